@@ -0,0 +1,76 @@
+import argparse
+import time
+
+from bili import codec
+from benchmark import fixtures
+
+
+"""
+    比较各个 JSON 后端在帧解码、弹幕 extra 解析和上行包编码上的耗时
+    用法: python -m benchmark.bench_json [--frames 录制的帧文件] [--count 合成帧数量]
+"""
+
+
+def best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_backend(json_codec: codec.JsonCodec, bodies: list[memoryview], repeat: int) -> dict[str, float]:
+    danmaku_extras = []
+    for body in bodies:
+        message = json_codec.loads(body)
+        if message.get('cmd') == 'DANMU_MSG' and len(message['info']) > 15:
+            danmaku_extras.append(message['info'][0][15]['extra'])
+    verify = {'uid': 0, 'roomid': 22499290, 'protover': 3, 'platform': 'web', 'type': 2, 'key': 'x' * 180}
+
+    def decode():
+        for body in bodies:
+            json_codec.loads(body)
+
+    def extract():
+        for extra in danmaku_extras:
+            json_codec.decode_extra(extra)
+
+    def encode():
+        for _ in range(len(bodies)):
+            json_codec.dumps(verify)
+
+    frames = len(bodies)
+    return {
+        'decode_us_per_frame': best_of(decode, repeat) / frames * 1e6,
+        'extra_us_per_danmaku': best_of(extract, repeat) / max(len(danmaku_extras), 1) * 1e6,
+        'encode_us_per_packet': best_of(encode, repeat) / frames * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON backend benchmark')
+    parser.add_argument('--frames', help='recorded frame file (concatenated raw frames)')
+    parser.add_argument('--count', type=int, default=5000, help='number of synthetic frames')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.frames:
+        frames = [f for f in fixtures.load_frames(args.frames) if f[7] == 0]
+    else:
+        frames = fixtures.generate_frames(args.count)
+    bodies = [memoryview(f)[16:] for f in frames]
+
+    print(f'{len(bodies)} frames')
+    for name in codec.backends:
+        try:
+            json_codec = codec.create_codec(name)
+        except ImportError:
+            print(f'{name:<10} not installed')
+            continue
+        result = bench_backend(json_codec, bodies, args.repeat)
+        print(f'{name:<10} ' + '  '.join(f'{k}={v:.2f}' for k, v in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import time
+
+from bili import live
+from benchmark import server
+
+
+"""
+    启动本地弹幕服务器替身，用多个 LiveEventLoop 连接并统计实际处理的消息速率
+    用法: python -m benchmark.bench_load [--clients 连接数] [--duration 秒] [--rate 每个连接每秒消息数]
+                                       [--batch 每个批量帧的消息数] [--compression brotli|zlib|none]
+"""
+
+
+class LoadUser:
+
+    def __init__(self, mid: int = 0):
+        self.mid = mid
+
+
+async def run(args) -> None:
+    mix = server.parse_mix(args.mix) if args.mix else None
+    async with server.StandInServer(rate=args.rate, batch_size=args.batch,
+                                    compression=args.compression, mix=mix) as stand_in:
+        loops = []
+        for room_id in range(1, args.clients + 1):
+            live_house = stand_in.live_house(room_id)
+            loops.append(live.LiveEventLoop(live_house, live_house.host_list[0], LoadUser(),
+                                            heartbeat_interval=5))
+        tasks = [asyncio.create_task(event_loop.start()) for event_loop in loops]
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - start
+        messages = sum(event_loop.message_count for event_loop in loops)
+        danmakus = sum(event_loop.danmaku_count for event_loop in loops)
+        for event_loop in loops:
+            event_loop.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f'{args.clients} clients, {elapsed:.1f}s')
+    print(f'sent      {stand_in.sent_messages / elapsed:.0f} messages/s')
+    print(f'received  {messages / elapsed:.0f} messages/s  ({messages / elapsed / args.clients:.0f} per client)')
+    print(f'danmakus  {danmakus / elapsed:.0f} /s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test against the local stand-in server')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--rate', type=float, default=5000.0, help='messages per second per connection')
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--compression', choices=server.COMPRESSIONS, default='brotli')
+    parser.add_argument('--mix', default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import gc
+import tracemalloc
+
+from bili import codec
+from bili import live
+from benchmark import fixtures
+
+
+"""
+    测量每条被保留的弹幕占用的内存(字节)
+    对比当前的 interaction 类与改造前使用 __dict__、不共享字符串的实现
+    用法: python -m benchmark.bench_memory [--count 弹幕数量]
+"""
+
+
+class LegacyTextInfo:
+
+    def __init__(self, font_size, color):
+        self.font_size = font_size
+        self.color = color
+
+
+class LegacySenderData:
+
+    def __init__(self, mid, name, name_color, avatar_url, is_me):
+        self.mid = mid
+        self.name = name
+        self.name_color = name_color
+        self.avatar_url = avatar_url
+        self.is_me = is_me
+
+
+class LegacyDanmaku:
+
+    def __init__(self, content, time, text_info, emoji_infos, sender_data):
+        self.content = content
+        self.text_info = text_info
+        self.emoji_infos = emoji_infos
+        self.sender_data = sender_data
+        self.time = time
+
+
+def legacy_danmaku(json_data) -> LegacyDanmaku:
+    info = json_data['info']
+    rich_data = info[0][15]
+    extra = codec.loads(rich_data['extra'])
+    user = rich_data['user']
+    return LegacyDanmaku(
+        content=info[1],
+        time=info[9],
+        text_info=LegacyTextInfo(extra.get('font_size', 25), extra.get('color', 16777215)),
+        emoji_infos=[],
+        sender_data=LegacySenderData(user.get('uid', 0), user['base']['name'], user['base']['name_color'],
+                                     user['base']['face'], extra.get('send_from_me', False))
+    )
+
+
+def retained_bytes(bodies: list[bytes], build) -> float:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    retained = [build(codec.loads(body)) for body in bodies]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    count = len(retained)
+    del retained
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Danmaku memory benchmark')
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    frames = fixtures.generate_frames(args.count, danmaku_ratio=1.0)
+    bodies = [fixtures.frame_body(f) for f in frames]
+    del frames
+
+    legacy = retained_bytes(bodies, legacy_danmaku)
+    current = retained_bytes(bodies, live.get_danmaku)
+    print(f'{args.count} danmakus')
+    print(f'legacy   {legacy:.1f} bytes/danmaku')
+    print(f'current  {current:.1f} bytes/danmaku')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+
+from bili import replay
+from benchmark import fixtures
+
+
+"""
+    以不限速的方式回放，测量完整解析流程的吞吐量(帧/秒、弹幕/秒)
+    用法: python -m benchmark.bench_replay [--archive 归档目录 --room 直播间号] [--frames 录制的帧文件]
+                                         [--count 合成帧数量] [--batch 每条消息的帧数] [--speed 回放速度]
+"""
+
+
+def synthetic_records(count: int, batch: int) -> list[tuple[None, bytes]]:
+    frames = fixtures.generate_frames(count)
+    return [(None, fixtures.zlib_batch(frames[i:i + batch])) for i in range(0, len(frames), batch)]
+
+
+async def run(args) -> replay.ReplayStats:
+    if args.archive:
+        records = replay.iter_archive(args.archive, args.room)
+    elif args.frames:
+        records = replay.iter_frame_file(args.frames)
+    else:
+        records = synthetic_records(args.count, args.batch)
+    engine = replay.ReplayEngine(args.room, speed=args.speed)
+    try:
+        return await engine.run(records)
+    finally:
+        engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay throughput benchmark')
+    parser.add_argument('--archive', help='archive directory written by FrameArchive')
+    parser.add_argument('--room', type=int, default=0, help='room id of the archive')
+    parser.add_argument('--frames', help='recorded frame file (concatenated raw frames)')
+    parser.add_argument('--count', type=int, default=50000, help='number of synthetic frames')
+    parser.add_argument('--batch', type=int, default=20, help='synthetic frames per zlib message')
+    parser.add_argument('--speed', type=float, default=replay.SPEED_UNLIMITED,
+                        help='playback speed, 0 means as fast as possible')
+    args = parser.parse_args()
+
+    stats = asyncio.run(run(args))
+    print(f'{stats.messages} messages, {stats.frames} frames, {stats.danmakus} danmakus, '
+          f'{stats.errors} errors in {stats.elapsed:.3f}s')
+    print(f'{stats.frames_per_second():.0f} frames/s  {stats.danmakus_per_second():.0f} danmakus/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+
+from bili import codec
+from bili import encrypter
+from bili import signer
+from bili import live
+from benchmark import fixtures
+
+
+"""
+    协议、解析和签名热点路径的基准测试套件，结果保存为 JSON 以便比较不同版本
+    用法: python -m benchmark.bench_suite [--frames 录制的帧文件] [--output 结果文件]
+                                        [--compare 基准结果文件] [--threshold 允许的退化比例] [--only 用例名前缀]
+    使用 --compare 时，任何用例比基准慢 threshold 以上都会以非零状态退出
+"""
+
+
+ROOM_ID = 22499290
+BATCH_SIZES = (10, 50, 200)
+IMG_KEY = '7cd084941338484aae1ad9425b84077c'
+SUB_KEY = '4932caff0ff746eab6f01bf08b70ac45'
+
+
+def best_of(func, repeat: int, number: int) -> float:
+    """
+        :return:    repeat 轮中最快一轮的单次调用耗时(秒)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def build_cases(frames: list[bytes]) -> dict[str, tuple]:
+    """
+        :return:    用例名 -> (函数, 每次调用处理的条目数)
+    """
+    cases = {}
+    single = frames[:1000]
+
+    def decode_single():
+        for data in single:
+            live.decode_packets(ROOM_ID, data)
+
+    cases['decode_packets.single'] = (decode_single, len(single))
+
+    for size in BATCH_SIZES:
+        batch = fixtures.brotli_batch(frames[:size])
+
+        def decode_batch(batch=batch):
+            live.decode_packets(ROOM_ID, batch)
+
+        cases[f'decode_packets.brotli_{size}'] = (decode_batch, size)
+
+    def download_decode():
+        for data in single:
+            live.DownloadPacket(ROOM_ID, data).decode()
+
+    cases['DownloadPacket.decode'] = (download_decode, len(single))
+
+    rng = random.Random(0)
+    rich = [codec.loads(codec.dumps(fixtures.danmu_msg(rng))) for _ in range(1000)]
+    legacy = [codec.loads(codec.dumps(fixtures.legacy_danmu_msg(rng))) for _ in range(1000)]
+
+    def danmaku_rich():
+        for message in rich:
+            live.get_danmaku(message)
+
+    def danmaku_legacy():
+        for message in legacy:
+            live.get_danmaku(message)
+
+    cases['get_danmaku.rich'] = (danmaku_rich, len(rich))
+    cases['get_danmaku.legacy'] = (danmaku_legacy, len(legacy))
+
+    verify = live.VerifyPacket(ROOM_ID, 1, 'x' * 180)
+    verify_data = {'uid': 1, 'roomid': ROOM_ID, 'protover': 3, 'platform': 'web', 'type': 2, 'key': verify.token}
+    cases['UploadPacket.encode'] = (lambda: verify.encode(verify_data, 0), 1)
+
+    params = {'id': ROOM_ID, 'type': 0, 'web_location': '444.8'}
+    cases['encrypter.enc_wbi'] = (lambda: encrypter.enc_wbi(dict(params), IMG_KEY, SUB_KEY), 1)
+    # 绕过缓存，测量真正的计算耗时
+    cases['encrypter.get_mixin_key'] = (lambda: encrypter.get_mixin_key.__wrapped__(IMG_KEY + SUB_KEY), 1)
+    wbi_signer = signer.WbiSigner(keys=(IMG_KEY, SUB_KEY))
+    cases['signer.WbiSigner.sign'] = (lambda: wbi_signer.sign(params), 1)
+    return cases
+
+
+def calibrate(func, target: float = 0.05) -> int:
+    """
+        估计需要多少次调用才能让一轮耗时达到 target 秒
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= target or number >= 1 << 20:
+            return number
+        number *= 2
+
+
+def run_cases(cases: dict[str, tuple], repeat: int) -> dict[str, dict]:
+    results = {}
+    for name, (func, items) in cases.items():
+        number = calibrate(func)
+        seconds = best_of(func, repeat, number)
+        results[name] = {
+            'us_per_call': seconds * 1e6,
+            'us_per_item': seconds / items * 1e6,
+            'items_per_second': items / seconds if seconds > 0 else 0.0,
+            'items_per_call': items,
+        }
+        print(f'{name:<30} {seconds / items * 1e6:10.3f} us/item  {items / seconds:12.0f} items/s')
+    return results
+
+
+def metadata() -> dict:
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'json_backend': codec.get_backend().name,
+    }
+
+
+def compare(results: dict[str, dict], baseline_path: str, threshold: float) -> list[str]:
+    """
+        :return:    比基准慢 threshold 以上的用例名
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['us_per_item'] / baseline[name]['us_per_item']
+        mark = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = '  REGRESSION'
+        print(f'{name:<30} {ratio:6.2f}x{mark}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Protocol, parsing and signing benchmark suite')
+    parser.add_argument('--frames', help='recorded frame file (concatenated raw frames)')
+    parser.add_argument('--count', type=int, default=1000, help='number of synthetic frames')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', default=None, help='only run cases whose name starts with this prefix')
+    parser.add_argument('--output', default=None, help='write results to this JSON file')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown before failing')
+    args = parser.parse_args()
+
+    if args.frames:
+        frames = [f for f in fixtures.load_frames(args.frames) if f[7] == 0]
+    else:
+        frames = fixtures.generate_frames(max(args.count, max(BATCH_SIZES)))
+    cases = build_cases(frames)
+    if args.only:
+        cases = {name: case for name, case in cases.items() if name.startswith(args.only)}
+
+    results = run_cases(cases, args.repeat)
+    report = {'metadata': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        if compare(results, args.compare, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
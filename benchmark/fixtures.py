@@ -0,0 +1,221 @@
+import json
+import random
+import struct
+import zlib
+
+
+"""
+    基准测试使用的合成数据，结构与直播间实际下发的帧一致
+    也可以通过 load_frames 读取录制下来的原始帧文件(多个完整帧直接拼接)
+"""
+
+
+NAMES = ['路人甲', '夜猫子', 'KasugaFan', '某科学的弹幕姬', '今天也在摸鱼', 'bili_48213']
+WORDS = ['哈哈哈哈', '好耶', '来了来了', '主播晚上好', '这波操作可以', '？？？', '草', 'awsl']
+
+
+def make_frame(body: bytes, protocol: int = 0, packet_type: int = 5, sequence: int = 0) -> bytes:
+    return struct.pack('>IHHII', 16 + len(body), 16, protocol, packet_type, sequence) + body
+
+
+def danmu_msg(rng: random.Random) -> dict:
+    mid = rng.randint(1, 5000000)
+    name = rng.choice(NAMES)
+    content = rng.choice(WORDS)
+    ts = 1700000000 + rng.randint(0, 86400)
+    extra = {
+        'send_from_me': False,
+        'mode': 0,
+        'color': rng.choice((16777215, 16772431, 14893055)),
+        'dm_type': 0,
+        'font_size': 25,
+        'player_mode': 1,
+        'show_player_type': 0,
+        'content': content,
+        'user_hash': str(rng.getrandbits(32)),
+        'emoticon_unique': '',
+        'bulge_display': 0,
+        'recommend_score': rng.randint(0, 10),
+        'main_state_dm_color': '',
+        'objective_state_dm_color': '',
+        'direction': 0,
+        'pk_direction': 0,
+        'quartet_direction': 0,
+        'anniversary_crowd': 0,
+        'yeah_space_type': '',
+        'yeah_space_url': '',
+        'jump_to_url': '',
+        'space_type': '',
+        'space_url': '',
+        'animation': {},
+        'emots': None,
+        'is_audited': False,
+        'id_str': '%032x' % rng.getrandbits(128),
+        'icon': None,
+        'show_reply': True,
+        'reply_mid': 0,
+        'reply_uname': '',
+        'reply_uname_color': '',
+        'reply_is_mystery': False,
+        'hit_combo': 0,
+    }
+    if rng.random() < 0.2:
+        extra['emots'] = {
+            '[dog]': {
+                'count': 1, 'descript': '[dog]', 'emoji': '[dog]', 'emoticon_id': 208,
+                'emoticon_unique': 'emoji_208', 'height': 20, 'width': 20,
+                'url': 'http://i0.hdslb.com/bfs/live/4428c84e694fbf4e0ef6c06e958d9352c3582740.png'
+            }
+        }
+    user = {
+        'uid': mid,
+        'base': {
+            'name': name,
+            'face': f'https://i0.hdslb.com/bfs/face/{mid:040x}.jpg',
+            'name_color': 0,
+            'is_mystery': False,
+            'risk_ctrl_info': None,
+            'origin_info': {'name': name, 'face': f'https://i0.hdslb.com/bfs/face/{mid:040x}.jpg'},
+            'official_info': {'role': 0, 'title': '', 'desc': '', 'type': -1},
+            'name_color_str': ''
+        },
+        'medal': None,
+        'wealth': None,
+        'title': {'old_title_css_id': '', 'title_css_id': ''},
+        'uhead_frame': None,
+        'guard_leader': {'is_guard_leader': False}
+    }
+    rich = {
+        'mode': 0,
+        'show_player_type': 0,
+        'extra': json.dumps(extra, ensure_ascii=False, separators=(',', ':')),
+        'user': user
+    }
+    info = [
+        [0, 1, 25, extra['color'], ts * 1000, rng.getrandbits(31), 0, '%08x' % rng.getrandbits(32),
+         0, 0, 0, '', 0, '{}', '{}', rich, {'activity_identity': '', 'activity_source': 0, 'not_show': 0}, 0],
+        content,
+        [mid, name, 0, 0, 0, 10000, 1, ''],
+        [],
+        [0, 0, 9868950, '>50000', 0],
+        ['', ''],
+        0,
+        0,
+        None,
+        {'ts': ts, 'ct': '%08X' % rng.getrandbits(32)},
+        0,
+        0,
+        None,
+        None,
+        0,
+        105,
+        [rng.randint(0, 30)],
+        None
+    ]
+    return {'cmd': 'DANMU_MSG', 'info': info, 'dm_v2': ''}
+
+
+def legacy_danmu_msg(rng: random.Random) -> dict:
+    mid = rng.randint(1, 5000000)
+    ts = 1700000000 + rng.randint(0, 86400)
+    info = [
+        [0, 1, 25, 16777215, ts * 1000, rng.getrandbits(31), 0, '%08x' % rng.getrandbits(32), 0, 0, 0],
+        rng.choice(WORDS),
+        [mid, rng.choice(NAMES), 0, 0, 0, 10000, 1, ''],
+        [],
+        [0, 0, 9868950, '>50000', 0],
+        ['', ''],
+        0,
+        0,
+        None,
+    ]
+    return {'cmd': 'DANMU_MSG', 'info': info}
+
+
+def interact_word(rng: random.Random) -> dict:
+    mid = rng.randint(1, 5000000)
+    return {
+        'cmd': 'INTERACT_WORD',
+        'data': {
+            'contribution': {'grade': 0}, 'dmscore': 12, 'fans_medal': {
+                'anchor_roomid': 0, 'guard_level': 0, 'icon_id': 0, 'is_lighted': 0,
+                'medal_color': 0, 'medal_level': 0, 'medal_name': '', 'score': 0, 'special': '',
+                'target_id': 0
+            },
+            'identities': [1], 'is_spread': 0, 'msg_type': 1, 'roomid': 22499290,
+            'score': 1700000000000 + mid, 'spread_desc': '', 'spread_info': '',
+            'tail_icon': 0, 'timestamp': 1700000000, 'trigger_time': 1700000000000000000,
+            'uid': mid, 'uname': rng.choice(NAMES), 'uname_color': ''
+        }
+    }
+
+
+def online_rank_count(rng: random.Random) -> dict:
+    return {'cmd': 'ONLINE_RANK_COUNT', 'data': {'count': rng.randint(100, 5000), 'count_text': '', 'online_count': 0}}
+
+
+BUILDERS = {
+    'DANMU_MSG': danmu_msg,
+    'INTERACT_WORD': interact_word,
+    'ONLINE_RANK_COUNT': online_rank_count,
+}
+
+
+def generate_mixed(count: int, mix: dict[str, float], seed: int = 0) -> list[dict]:
+    """
+        按照给定的指令比例生成消息
+        :param mix:     指令名 -> 权重，指令名必须在 BUILDERS 中
+    """
+    rng = random.Random(seed)
+    builders = [BUILDERS[cmd] for cmd in mix]
+    weights = list(mix.values())
+    return [builder(rng) for builder in rng.choices(builders, weights, k=count)]
+
+
+def generate_messages(count: int, seed: int = 0, danmaku_ratio: float = 0.3) -> list[dict]:
+    """
+        生成一组混合指令的消息，默认只有 30% 是弹幕
+    """
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < danmaku_ratio:
+            messages.append(danmu_msg(rng))
+        elif roll < danmaku_ratio + (1 - danmaku_ratio) / 2:
+            messages.append(interact_word(rng))
+        else:
+            messages.append(online_rank_count(rng))
+    return messages
+
+
+def generate_frames(count: int, seed: int = 0, danmaku_ratio: float = 0.3) -> list[bytes]:
+    return [
+        make_frame(json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        for message in generate_messages(count, seed, danmaku_ratio)
+    ]
+
+
+def zlib_batch(frames: list[bytes]) -> bytes:
+    return make_frame(zlib.compress(b''.join(frames)), protocol=2)
+
+
+def brotli_batch(frames: list[bytes]) -> bytes:
+    import brotli
+    return make_frame(brotli.compress(b''.join(frames)), protocol=3)
+
+
+def load_frames(path: str) -> list[bytes]:
+    """
+        读取录制的原始帧文件，压缩的批量帧会被展开
+        :param path:    由完整帧直接拼接而成的文件
+        :return:        每个帧的字节
+    """
+    from bili import frame
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [bytes(view) for view in frame.iter_frames(data)]
+
+
+def frame_body(frame_bytes: bytes) -> bytes:
+    return frame_bytes[16:]
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import struct
+
+import websockets
+
+from bili import frame
+from bili import live
+from benchmark import fixtures
+
+
+"""
+    本地的弹幕服务器替身，使用与直播间相同的 16 字节头协议
+    处理握手(op 7/8)和心跳(op 2/3)，握手成功后按设定的速率下发 brotli/zlib 压缩的批量消息(op 5)
+    用法: python -m benchmark.server [--port 端口] [--rate 每秒消息数] [--batch 每个批量帧的消息数]
+                                    [--compression brotli|zlib|none] [--mix DANMU_MSG=0.3,INTERACT_WORD=0.4,...]
+"""
+
+
+DEFAULT_MIX = {'DANMU_MSG': 0.3, 'INTERACT_WORD': 0.35, 'ONLINE_RANK_COUNT': 0.35}
+COMPRESSIONS = ('brotli', 'zlib', 'none')
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """
+        :param text:    形如 DANMU_MSG=0.5,INTERACT_WORD=0.5
+    """
+    mix = {}
+    for item in text.split(','):
+        cmd, _, weight = item.partition('=')
+        cmd = cmd.strip()
+        if cmd not in fixtures.BUILDERS:
+            raise ValueError(f"Unsupported cmd: {cmd}")
+        mix[cmd] = float(weight) if weight else 1.0
+    return mix
+
+
+def reply(body: bytes, packet_type: int) -> bytes:
+    return fixtures.make_frame(body, protocol=frame.PROTOCOL_INT, packet_type=packet_type)
+
+
+class StandInServer:
+    """
+        每个连接独立计数，pool_size 个批量帧在启动时预先生成并压缩，下发时循环使用，因此速率不受生成和压缩速度的限制
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 rate: float = 1000.0, batch_size: int = 20, compression: str = 'brotli',
+                 mix: dict[str, float] | None = None, token: str | None = None,
+                 popularity: int = 10000, pool_size: int = 64, seed: int = 0):
+        """
+            :param host:            监听地址
+            :param port:            监听端口，0 表示由系统分配
+            :param rate:            每个连接每秒下发的消息(指令)数
+            :param batch_size:      每个批量帧包含的消息数
+            :param compression:     批量帧的压缩方式: brotli、zlib 或 none(不压缩，直接拼接)
+            :param mix:             指令名 -> 权重，默认为 DEFAULT_MIX
+            :param token:           握手时要求的 key，为 None 时不检查
+            :param popularity:      心跳回复中的人气值
+            :param pool_size:       预先生成的批量帧数量
+            :param seed:            随机数种子
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        if rate <= 0 or batch_size <= 0:
+            raise ValueError(f"Invalid rate {rate} or batch size {batch_size}")
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.batch_size = batch_size
+        self.compression = compression
+        self.mix = mix if mix is not None else DEFAULT_MIX
+        self.token = token
+        self.popularity = popularity
+        self.batches = self.build_batches(pool_size, seed)
+        self.server = None
+        self.connections = 0
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.heartbeats = 0
+        self.rejected = 0
+
+
+    def build_batches(self, pool_size: int, seed: int) -> list[bytes]:
+        messages = fixtures.generate_mixed(pool_size * self.batch_size, self.mix, seed)
+        frames = [
+            fixtures.make_frame(json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            for message in messages
+        ]
+        batches = []
+        for start in range(0, len(frames), self.batch_size):
+            chunk = frames[start:start + self.batch_size]
+            if self.compression == 'brotli':
+                batches.append(fixtures.brotli_batch(chunk))
+            elif self.compression == 'zlib':
+                batches.append(fixtures.zlib_batch(chunk))
+            else:
+                batches.append(b''.join(chunk))
+        return batches
+
+
+    async def start(self) -> None:
+        self.server = await websockets.serve(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+
+    def live_house(self, room_id: int = 1) -> live.LiveHouse:
+        """
+            指向本服务器的 LiveHouse，可以直接交给 LiveEventLoop 使用
+        """
+        host = live.MQHost(self.host, self.port, self.port, self.port)
+        return live.LiveHouse(room_id, 0, 0, 0, self.token or '', [host])
+
+
+    async def handle(self, ws, path: str | None = None) -> None:
+        if not await self.verify(ws):
+            return
+        self.connections += 1
+        sender = asyncio.create_task(self.send_loop(ws))
+        try:
+            async for message in ws:
+                for view in frame.iter_frames(message):
+                    if frame.read_header(view)[3] == frame.OP_HEARTBEAT:
+                        self.heartbeats += 1
+                        await ws.send(reply(struct.pack('>I', self.popularity), frame.OP_HEARTBEAT_REPLY))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            sender.cancel()
+
+
+    async def verify(self, ws) -> bool:
+        message = await ws.recv()
+        for view in frame.iter_frames(message):
+            _, header_len, _, packet_type, _ = frame.read_header(view)
+            if packet_type != frame.OP_VERIFY:
+                continue
+            data = json.loads(bytes(view[header_len:]))
+            accepted = self.token is None or data.get('key') == self.token
+            await ws.send(reply(json.dumps({'code': 0 if accepted else -101}).encode(), frame.OP_VERIFY_REPLY))
+            if not accepted:
+                self.rejected += 1
+                await ws.close()
+            return accepted
+        await ws.close()
+        return False
+
+
+    async def send_loop(self, ws) -> None:
+        interval = self.batch_size / self.rate
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        position = 0
+        batches = self.batches
+        while True:
+            batch = batches[position]
+            position = (position + 1) % len(batches)
+            await ws.send(batch)
+            self.sent_messages += self.batch_size
+            self.sent_bytes += len(batch)
+            next_time += interval
+            delay = next_time - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -1.0:
+                # 落后太多时不再追赶，避免恢复后瞬间突发
+                next_time = loop.time()
+
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'connections': self.connections,
+            'sent_messages': self.sent_messages,
+            'sent_bytes': self.sent_bytes,
+            'heartbeats': self.heartbeats,
+            'rejected': self.rejected,
+        }
+
+
+async def serve(server: StandInServer, report_interval: float) -> None:
+    async with server:
+        print(f'listening on ws://{server.host}:{server.port}/sub')
+        last = server.sent_messages
+        while True:
+            await asyncio.sleep(report_interval)
+            current = server.sent_messages
+            print(f'{server.connections} connections  {(current - last) / report_interval:.0f} messages/s')
+            last = current
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in danmaku server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2245)
+    parser.add_argument('--rate', type=float, default=1000.0, help='messages per second per connection')
+    parser.add_argument('--batch', type=int, default=20, help='messages per batched frame')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='brotli')
+    parser.add_argument('--mix', default=None, help='cmd weights, e.g. DANMU_MSG=0.5,INTERACT_WORD=0.5')
+    parser.add_argument('--token', default=None, help='token required in the verify packet')
+    parser.add_argument('--report', type=float, default=5.0, help='seconds between two reports')
+    args = parser.parse_args()
+
+    server = StandInServer(args.host, args.port, args.rate, args.batch, args.compression,
+                           parse_mix(args.mix) if args.mix else None, args.token)
+    try:
+        asyncio.run(serve(server, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+from typing import Any
+import asyncio
+import importlib.util
+
+from bili import client
+from bili import codec
+from bili import constants
+
+
+"""
+    基于 aiohttp 的异步 HTTP 客户端，在事件循环中请求接口时不会阻塞其他直播间的接收
+    aiohttp 是可选依赖，只在第一次发送请求时导入
+    与 client.HttpClient 相同，默认请求头和会话的 Cookies 只设置一次，连接按主机复用
+"""
+
+
+def available() -> bool:
+    """
+        :return:    是否安装了 aiohttp
+    """
+    return importlib.util.find_spec('aiohttp') is not None
+
+
+class AsyncResponse:
+    """
+        已经读取完毕的响应
+    """
+
+    __slots__ = ('status', 'body', 'cookies')
+
+    def __init__(self, status: int, body: bytes, cookies: dict[str, str]):
+        self.status = status
+        self.body = body
+        self.cookies = cookies
+
+
+    def json(self) -> Any:
+        return codec.loads(self.body)
+
+
+class AsyncHttpClient:
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 16,
+                 retries: int = 3, backoff_factor: float = 0.5, timeout: float = 15.0):
+        """
+            :param limit:           总连接数上限
+            :param limit_per_host:  每个主机的连接数上限
+            :param retries:         连接失败、超时和 client.RETRY_STATUSES 状态码的重试次数，POST 只在连接失败时重试，不按状态码重试
+            :param backoff_factor:  重试的退避因子(秒)，第 n 次重试前等待 backoff_factor * 2 ^ (n - 1) 秒
+            :param timeout:         单次请求的总超时时间(秒)
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.headers = dict(constants.headers)
+        self.anonymous_headers = dict(constants.headers)
+        self.session = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+
+    def set_cookies(self, cookies: dict | None) -> None:
+        """
+            替换随请求发送的 Cookies，只拼接一次 Cookie 请求头
+        """
+        headers = dict(constants.headers)
+        if cookies:
+            headers['Cookie'] = '; '.join(f'{key}={value}' for key, value in cookies.items())
+        self.headers = headers
+
+
+    def get_session(self):
+        """
+            aiohttp.ClientSession 与创建它的事件循环绑定，换了事件循环(如多次 asyncio.run)时重新创建
+        """
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            # 服务器下发的 Cookies 不自动保存，需要时从 AsyncResponse.cookies 中读取
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 cookie_jar=aiohttp.DummyCookieJar(),
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.loop = loop
+        return self.session
+
+
+    async def request(self, method: str, url: str, anonymous: bool = False, **kwargs) -> AsyncResponse:
+        """
+            :param anonymous:   是否不携带登录会话的 Cookies，参看 client.HttpClient.request
+        """
+        import aiohttp
+        session = self.get_session()
+        headers = self.anonymous_headers if anonymous else self.headers
+        attempt = 0
+        while True:
+            try:
+                async with session.request(method, url, headers=headers, **kwargs) as response:
+                    body = await response.read()
+                    # 与 client.HttpClient 相同，POST 不按状态码重试，避免重复提交
+                    if (method != 'GET' or response.status not in client.RETRY_STATUSES
+                            or attempt >= self.retries):
+                        cookies = {key: morsel.value for key, morsel in response.cookies.items()}
+                        return AsyncResponse(response.status, body, cookies)
+            except aiohttp.ClientConnectorError:
+                if attempt >= self.retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if method != 'GET' or attempt >= self.retries:
+                    raise
+            attempt += 1
+            await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+
+
+    async def get(self, url: str, anonymous: bool = False, **kwargs) -> AsyncResponse:
+        return await self.request('GET', url, anonymous, **kwargs)
+
+
+    async def post(self, url: str, anonymous: bool = False, **kwargs) -> AsyncResponse:
+        return await self.request('POST', url, anonymous, **kwargs)
+
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.loop = None
+
+
+_default_client: AsyncHttpClient | None = None
+
+
+def get_client() -> AsyncHttpClient:
+    """
+        :return:    进程内共享的 AsyncHttpClient，第一次调用时创建
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncHttpClient()
+    return _default_client
+
+
+def set_client(http_client: AsyncHttpClient) -> None:
+    global _default_client
+    _default_client = http_client
@@ -0,0 +1,401 @@
+from typing import Callable, Iterator
+import bisect
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import weakref
+
+
+"""
+    原始帧归档
+    每条 websocket 消息原样(未解压)追加写入分段文件，文件大小超过 segment_size 时切换到新的分段
+    分段文件   {room_id}-{开始时间毫秒}-{序号}.seg   由若干条记录组成: 时间戳(float64 秒) + 长度(uint32) + 原始消息
+    索引文件   {room_id}-{开始时间毫秒}-{序号}.idx   由定长条目组成: 时间戳(float64 秒) + 记录在分段中的偏移(uint64)
+    同一毫秒内打开的分段按序号区分，旧版本写入的 {room_id}-{开始时间毫秒}.seg 同样可以读取
+    每隔 index_interval 字节写入一条索引，读取时对索引二分查找后只需顺序扫描很短的一段
+    文件的写入默认在所有归档共用的后台线程中进行，接收循环只需要把消息放入队列
+"""
+
+
+RECORD = struct.Struct('>dI')
+INDEX = struct.Struct('>dQ')
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+
+def segment_name(room_id: int, start_time: float, sequence: int = 0) -> str:
+    return f'{room_id}-{int(start_time * 1000):013d}-{sequence:03d}'
+
+
+def parse_segment_name(file_name: str) -> tuple[int, float, int] | None:
+    """
+        :return:    (直播间号, 分段开始时间, 序号)，不是分段文件时为 None
+    """
+    if not file_name.endswith(SEGMENT_SUFFIX):
+        return None
+    parts = file_name[:-len(SEGMENT_SUFFIX)].split('-')
+    if len(parts) == 2:
+        parts.append('0')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    return int(parts[0]), int(parts[1]) / 1000, int(parts[2])
+
+
+class BackgroundWriter:
+    """
+        按提交顺序在后台线程中执行写入操作，所有归档共用一个线程
+    """
+
+    def __init__(self):
+        self.queue: queue.SimpleQueue[tuple[Callable, tuple]] = queue.SimpleQueue()
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+
+
+    def submit(self, func: Callable, *args) -> None:
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='frame-archive-writer', daemon=True)
+                    self.thread.start()
+        self.queue.put((func, args))
+
+
+    def wait(self) -> None:
+        """
+            等待之前提交的所有操作完成
+        """
+        done = threading.Event()
+        self.submit(done.set)
+        done.wait()
+
+
+    def run(self) -> None:
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                # 单个归档的错误不应停止其他归档的写入
+                continue
+
+
+writer = BackgroundWriter()
+
+
+class FrameArchive:
+    """
+        单个直播间的归档写入端，write / flush / close 只能在一个线程中调用
+    """
+
+    def __init__(self, directory: str, room_id: int,
+                 segment_size: int = 64 * 1024 * 1024, index_interval: int = 4096,
+                 background: bool = True):
+        """
+            :param directory:       归档目录
+            :param room_id:         直播间号
+            :param segment_size:    单个分段文件的大小上限(字节)
+            :param index_interval:  两条索引之间至少间隔的字节数，0 表示每条记录都写入索引
+            :param background:      是否在后台线程中写入文件，为 False 时 write 直接写入
+        """
+        self.directory = directory
+        self.room_id = room_id
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.segment = None
+        self.index = None
+        self.segment_offset = 0
+        self.last_indexed = -1
+        self.frames = 0
+        self.bytes = 0
+        self.segments = 0
+        self.errors = 0
+        self.last_error: str | None = None
+        self.background = background
+        os.makedirs(directory, exist_ok=True)
+
+
+    def open_segment(self, timestamp: float) -> None:
+        self.close_files()
+        sequence = 0
+        while True:
+            base = os.path.join(self.directory, segment_name(self.room_id, timestamp, sequence))
+            try:
+                # 独占创建，同一毫秒内打开的分段(包括其他进程中的)不会写入同一个文件
+                self.segment = open(base + SEGMENT_SUFFIX, 'xb')
+                break
+            except FileExistsError:
+                sequence += 1
+        self.index = open(base + INDEX_SUFFIX, 'wb')
+        self.segment_offset = 0
+        self.last_indexed = -1
+        self.segments += 1
+
+
+    def write(self, data: bytes | str, timestamp: float | None = None) -> None:
+        """
+            追加一条原始消息，后台写入时只放入队列
+            :param data:        websocket 收到的消息
+            :param timestamp:   接收时间(秒)，默认为当前时间
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        elif not isinstance(data, bytes):
+            # 放入队列的数据在写入前可能被修改或释放
+            data = bytes(data)
+        if timestamp is None:
+            timestamp = time.time()
+        if self.background:
+            writer.submit(self.write_record, data, timestamp)
+        else:
+            self.write_record(data, timestamp)
+
+
+    def write_record(self, data: bytes, timestamp: float) -> None:
+        try:
+            self.append(data, timestamp)
+        except OSError as e:
+            self.errors += 1
+            self.last_error = repr(e)
+
+
+    def append(self, data: bytes, timestamp: float) -> None:
+        size = RECORD.size + len(data)
+        if self.segment is None or (self.segment_offset and self.segment_offset + size > self.segment_size):
+            self.open_segment(timestamp)
+        if self.last_indexed < 0 or self.segment_offset - self.last_indexed >= self.index_interval:
+            self.index.write(INDEX.pack(timestamp, self.segment_offset))
+            self.last_indexed = self.segment_offset
+        self.segment.write(RECORD.pack(timestamp, len(data)))
+        self.segment.write(data)
+        self.segment_offset += size
+        self.frames += 1
+        self.bytes += size
+
+
+    def flush(self) -> None:
+        """
+            把已经写入的记录刷新到磁盘，后台写入时不等待
+        """
+        if self.background:
+            writer.submit(self.flush_files)
+        else:
+            self.flush_files()
+
+
+    def flush_files(self) -> None:
+        if self.segment is not None:
+            self.segment.flush()
+            self.index.flush()
+
+
+    def close(self) -> None:
+        """
+            关闭当前分段，后台写入时会等待队列中的记录写完，在事件循环中应通过 asyncio.to_thread 调用
+        """
+        if self.background:
+            writer.submit(self.close_files)
+            writer.wait()
+        else:
+            self.close_files()
+
+
+    def close_files(self) -> None:
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment = None
+            self.index = None
+
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'segments': self.segments,
+            'errors': self.errors,
+        }
+
+
+class SegmentReader:
+    """
+        以内存映射的方式读取一个分段，返回的 memoryview 直接引用映射的内存
+        memoryview 在迭代到下一条记录或 close() 之后被释放，需要保留时应复制(bytes(payload))
+        调用方从 memoryview 再切出的视图需要在 close() 之前释放，否则 close() 会抛出 BufferError
+    """
+
+    def __init__(self, path: str):
+        """
+            :param path:    分段文件的路径(.seg)
+        """
+        self.path = path
+        self.data = _map(path)
+        self.index = _map(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+        self.index_count = len(self.index) // INDEX.size if self.index is not None else 0
+        self.iterators: weakref.WeakSet = weakref.WeakSet()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+    def __len__(self) -> int:
+        return len(self.data) if self.data is not None else 0
+
+
+    def index_entry(self, position: int) -> tuple[float, int]:
+        return INDEX.unpack_from(self.index, position * INDEX.size)
+
+
+    def seek(self, timestamp: float) -> int:
+        """
+            在索引中二分查找
+            :param timestamp:   时间(秒)
+            :return:            不晚于 timestamp 的最后一条索引对应的偏移，从这里开始扫描即可找到 timestamp 之后的所有记录
+        """
+        if self.index_count == 0:
+            return 0
+        position = bisect.bisect_right(_IndexKeys(self), timestamp) - 1
+        if position < 0:
+            return 0
+        return self.index_entry(position)[1]
+
+
+    def records(self, offset: int = 0) -> Iterator[tuple[float, memoryview]]:
+        """
+            从 offset 开始顺序读取记录，遇到写了一半的记录时停止
+            :return:    (接收时间, 原始消息)
+        """
+        iterator = self.iter_records(offset)
+        self.iterators.add(iterator)
+        return iterator
+
+
+    def iter_records(self, offset: int) -> Iterator[tuple[float, memoryview]]:
+        data = self.data
+        if data is None:
+            return
+        view = memoryview(data)
+        end = len(data)
+        payload = None
+        try:
+            while offset + RECORD.size <= end:
+                timestamp, length = RECORD.unpack_from(data, offset)
+                start = offset + RECORD.size
+                if start + length > end:
+                    break
+                payload = view[start:start + length]
+                yield timestamp, payload
+                payload.release()
+                payload = None
+                offset = start + length
+        finally:
+            if payload is not None:
+                payload.release()
+            view.release()
+
+
+    def iter_range(self, start: float | None = None, end: float | None = None) -> Iterator[tuple[float, memoryview]]:
+        """
+            读取接收时间在 [start, end) 之间的记录
+        """
+        offset = self.seek(start) if start is not None else 0
+        for timestamp, payload in self.records(offset):
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                break
+            yield timestamp, payload
+
+
+    def close(self) -> None:
+        # 先结束未读完的迭代器，释放它们持有的 memoryview
+        for iterator in list(self.iterators):
+            iterator.close()
+        self.iterators.clear()
+        for mapped in (self.data, self.index):
+            if mapped is not None:
+                mapped.close()
+        self.data = None
+        self.index = None
+        self.index_count = 0
+
+
+class _IndexKeys:
+    """
+        让 bisect 可以直接在映射的索引文件上查找时间戳
+    """
+
+    def __init__(self, reader: SegmentReader):
+        self.reader = reader
+
+
+    def __len__(self) -> int:
+        return self.reader.index_count
+
+
+    def __getitem__(self, position: int) -> float:
+        return self.reader.index_entry(position)[0]
+
+
+def _map(path: str) -> mmap.mmap | None:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ArchiveReader:
+    """
+        按时间范围读取一个直播间的所有分段
+    """
+
+    def __init__(self, directory: str, room_id: int):
+        self.directory = directory
+        self.room_id = room_id
+
+
+    def segments(self) -> list[tuple[float, str]]:
+        """
+            :return:    按开始时间(和序号)排序的 (开始时间, 分段路径)
+        """
+        result = []
+        for file_name in os.listdir(self.directory):
+            parsed = parse_segment_name(file_name)
+            if parsed is None or parsed[0] != self.room_id:
+                continue
+            result.append((parsed[1], parsed[2], os.path.join(self.directory, file_name)))
+        result.sort()
+        return [(start, path) for start, _, path in result]
+
+
+    def iter_range(self, start: float | None = None, end: float | None = None) -> Iterator[tuple[float, memoryview]]:
+        """
+            读取接收时间在 [start, end) 之间的记录，只打开时间范围可能重叠的分段
+            调用方需要在迭代到下一条记录之前用完(或复制)当前的 memoryview，参看 SegmentReader
+        """
+        segments = self.segments()
+        for position, (segment_start, path) in enumerate(segments):
+            if end is not None and segment_start >= end:
+                break
+            next_start = segments[position + 1][0] if position + 1 < len(segments) else None
+            if start is not None and next_start is not None and next_start <= start:
+                continue
+            reader = SegmentReader(path)
+            records = reader.iter_range(start, end)
+            try:
+                yield from records
+            finally:
+                records.close()
+                try:
+                    reader.close()
+                except BufferError:
+                    # 调用方仍持有 memoryview，映射交给垃圾回收释放
+                    pass
@@ -0,0 +1,36 @@
+import random
+
+
+class Backoff:
+    """
+        带随机抖动的指数退避
+        第 n 次的等待时间在 [d * (1 - jitter), d] 之间，其中 d = min(maximum, initial * factor ^ n)
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0, factor: float = 2.0, jitter: float = 0.5):
+        """
+            :param initial:     第一次的等待时间(秒)
+            :param maximum:     等待时间的上限(秒)
+            :param factor:      每次失败后等待时间的倍数
+            :param jitter:      随机抖动的比例(0 ~ 1)
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+
+    def next(self) -> float:
+        """
+            :return:    下一次重试前需要等待的时间(秒)
+        """
+        delay = min(self.maximum, self.initial * (self.factor ** self.attempts))
+        # 达到上限后不再增加指数，否则长时间失败后 factor ** attempts 会溢出
+        if delay < self.maximum:
+            self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+
+    def reset(self) -> None:
+        self.attempts = 0
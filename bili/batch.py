@@ -0,0 +1,161 @@
+from array import array
+from bili import buffer
+from bili import interaction
+
+
+class DanmakuBatch:
+    """
+        列式存储的弹幕批次，时间戳、mid、颜色和字号存放在定长数组中，内容存放在 UTF-8 字节缓冲区中并通过偏移量索引
+        to_numpy / to_arrow 直接引用这些缓冲区而不复制，导出之后批次被封存，不能再追加
+        numpy 和 pyarrow 都是可选依赖，只在调用对应方法时导入
+        设置 capacity 后按 policy 限制弹幕数量，策略与 buffer.EventBuffer 相同，
+        但 drop_oldest 为了避免每条弹幕都移动整列数据，一次丢弃最旧的四分之一
+    """
+
+    def __init__(self, room_id: int = 0, capacity: int | None = None, policy: str = buffer.DROP_OLDEST):
+        """
+            :param room_id:     直播间号
+            :param capacity:    最多保存的弹幕数量，None 表示不限制
+            :param policy:      超过容量时的策略，参看 buffer.EventBuffer
+        """
+        if capacity is not None and capacity <= 0:
+            raise ValueError(f"Invalid batch capacity: {capacity}")
+        if policy not in buffer.POLICIES:
+            raise ValueError(f"Unsupported drop policy: {policy}")
+        self.room_id = room_id
+        self.capacity = capacity
+        self.policy = policy
+        self.dropped = 0
+        self.timestamps = array('q')
+        self.mids = array('q')
+        self.colors = array('I')
+        self.font_sizes = array('i')
+        self.content_offsets = array('q', [0])
+        self.content_data = bytearray()
+        self.sealed = False
+
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+    def full(self) -> bool:
+        return self.capacity is not None and len(self.timestamps) >= self.capacity
+
+
+    def should_wait(self) -> bool:
+        return self.policy == buffer.BLOCK and self.full()
+
+
+    def append_values(self, timestamp: int, mid: int, color: int, font_size: int, content: str) -> bool:
+        """
+            :return:    弹幕是否被放入(drop_newest 策略下批次已满时为 False)
+        """
+        if self.sealed:
+            raise ValueError("DanmakuBatch has been exported and can no longer be appended to")
+        if self.full():
+            if self.policy == buffer.DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.policy == buffer.DROP_OLDEST:
+                self.drop_oldest(max(1, self.capacity // 4))
+        self.timestamps.append(timestamp)
+        self.mids.append(mid)
+        self.colors.append(color & 0xFFFFFFFF)
+        self.font_sizes.append(font_size)
+        self.content_data += content.encode('utf-8')
+        self.content_offsets.append(len(self.content_data))
+        return True
+
+
+    def drop_oldest(self, count: int) -> None:
+        count = min(count, len(self))
+        if count <= 0:
+            return
+        del self.timestamps[:count]
+        del self.mids[:count]
+        del self.colors[:count]
+        del self.font_sizes[:count]
+        cut = self.content_offsets[count]
+        del self.content_data[:cut]
+        self.content_offsets = array('q', (offset - cut for offset in self.content_offsets[count:]))
+        self.dropped += count
+
+
+    def append(self, danmaku: interaction.Danmaku) -> bool:
+        return self.append_values(
+            danmaku.timestamp,
+            danmaku.sender_data.mid,
+            danmaku.text_info.color,
+            danmaku.text_info.font_size,
+            danmaku.content
+        )
+
+
+    def extend(self, danmakus) -> None:
+        for danmaku in danmakus:
+            self.append(danmaku)
+
+
+    @classmethod
+    def from_danmakus(cls, danmakus, room_id: int = 0) -> 'DanmakuBatch':
+        """
+            从 pop_danmakus() 返回的弹幕列表创建批次
+        """
+        batch = cls(room_id)
+        batch.extend(danmakus)
+        return batch
+
+
+    def content(self, index: int) -> str:
+        start = self.content_offsets[index]
+        end = self.content_offsets[index + 1]
+        return self.content_data[start:end].decode('utf-8')
+
+
+    def contents(self) -> list[str]:
+        return [self.content(i) for i in range(len(self))]
+
+
+    def to_numpy(self) -> dict:
+        """
+            转换为 numpy 数组(不复制)，调用后批次被封存
+            :return:    各列的字典，内容列以 content_offsets(int64) 和 content_data(uint8) 表示
+        """
+        import numpy as np
+        self.sealed = True
+        return {
+            'timestamp': np.frombuffer(self.timestamps, dtype=np.int64),
+            'mid': np.frombuffer(self.mids, dtype=np.int64),
+            'color': np.frombuffer(self.colors, dtype=np.uint32),
+            'font_size': np.frombuffer(self.font_sizes, dtype=np.int32),
+            'content_offsets': np.frombuffer(self.content_offsets, dtype=np.int64),
+            'content_data': np.frombuffer(self.content_data, dtype=np.uint8),
+        }
+
+
+    def to_arrow(self):
+        """
+            转换为 pyarrow.RecordBatch(不复制)，调用后批次被封存
+        """
+        import pyarrow as pa
+        self.sealed = True
+        length = len(self)
+
+        def column(values: array, data_type):
+            return pa.Array.from_buffers(data_type, length, [None, pa.py_buffer(values)])
+
+        content = pa.Array.from_buffers(
+            pa.large_string(), length,
+            [None, pa.py_buffer(self.content_offsets), pa.py_buffer(self.content_data)]
+        )
+        return pa.RecordBatch.from_arrays(
+            [
+                column(self.timestamps, pa.timestamp('s', tz='UTC')),
+                column(self.mids, pa.int64()),
+                column(self.colors, pa.uint32()),
+                column(self.font_sizes, pa.int32()),
+                content,
+            ],
+            names=['timestamp', 'mid', 'color', 'font_size', 'content']
+        )
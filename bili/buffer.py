@@ -0,0 +1,127 @@
+from collections import deque
+import threading
+import asyncio
+
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class EventBuffer:
+    """
+        有界事件缓冲区，可在其他线程中批量取出
+        满时的策略:
+            drop_oldest - 丢弃最旧的事件
+            drop_newest - 丢弃新到达的事件
+            block       - 不丢弃事件，接收循环在读取下一条 websocket 消息前等待消费者腾出空间
+                          (同一条消息中的事件仍会被放入，因此可能短暂超过容量)
+    """
+
+    def __init__(self, capacity: int = 10000, policy: str = DROP_OLDEST):
+        if capacity <= 0:
+            raise ValueError(f"Invalid buffer capacity: {capacity}")
+        if policy not in POLICIES:
+            raise ValueError(f"Unsupported drop policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.accepted = 0
+        self.dropped = 0
+
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+    def full(self) -> bool:
+        return len(self.items) >= self.capacity
+
+
+    def put(self, item) -> bool:
+        """
+            放入一个事件，不会阻塞
+            :param item:    事件
+            :return:        事件是否被放入(drop_newest 策略下缓冲区已满时为 False)
+        """
+        with self.lock:
+            if len(self.items) >= self.capacity:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+            self.items.append(item)
+            self.accepted += 1
+            return True
+
+
+    append = put
+
+
+    def should_wait(self) -> bool:
+        return self.policy == BLOCK and len(self.items) >= self.capacity
+
+
+    async def wait_for_space(self) -> None:
+        """
+            block 策略下等待缓冲区出现空位，其他策略直接返回
+        """
+        while self.should_wait():
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self.lock:
+                if len(self.items) < self.capacity:
+                    return
+                self.waiters.append((loop, future))
+            await future
+
+
+    def drain(self, max_items: int | None = None) -> list:
+        """
+            批量取出事件，可以在任意线程中调用
+            :param max_items:   最多取出的数量，None 表示全部
+            :return:            按到达顺序排列的事件列表
+        """
+        with self.lock:
+            if max_items is None or max_items >= len(self.items):
+                items = list(self.items)
+                self.items.clear()
+            else:
+                items = [self.items.popleft() for _ in range(max_items)]
+            waiters = self.waiters
+            self.waiters = []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                continue
+        return items
+
+
+    def copy(self) -> list:
+        with self.lock:
+            return list(self.items)
+
+
+    def clear(self) -> None:
+        self.drain()
+
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self.items),
+            'capacity': self.capacity,
+            'accepted': self.accepted,
+            'dropped': self.dropped,
+        }
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,115 @@
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bili import constants
+import threading
+import requests
+
+
+"""
+    共享的 HTTP 客户端
+    所有模块通过同一个 requests.Session 发送请求，连接按主机保持复用(keep-alive)，避免每次请求都重新进行 TCP 和 TLS 握手
+    默认请求头在创建时设置一次，登录会话的 Cookies 通过 set_cookies 设置一次
+    Cookies 不保存在 Session 的 cookie jar 中，每次请求开始时取出当前的 Cookies 随请求发送，
+    替换 Cookies 不会影响正在进行的请求，服务器下发的 Cookies 也不会被自动保存(需要时从 Response.cookies 中读取)
+    登录前的请求(二维码登录、获取 wbi 密钥)使用 anonymous=True，不携带 Cookies
+"""
+
+
+DEFAULT_TIMEOUT = (5.0, 15.0)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+
+    def __init__(self, pool_connections: int = 8, pool_maxsize: int = 16,
+                 retries: int = 3, backoff_factor: float = 0.5,
+                 timeout: float | tuple[float, float] = DEFAULT_TIMEOUT):
+        """
+            :param pool_connections:    缓存连接池的主机数量
+            :param pool_maxsize:        每个主机的最大连接数，连接用完时请求等待空闲的连接
+            :param retries:             连接失败、读取失败和 RETRY_STATUSES 状态码的重试次数，POST 只在连接失败时重试
+            :param backoff_factor:      重试的退避因子(秒)，第 n 次重试前等待 backoff_factor * 2 ^ (n - 1) 秒
+            :param timeout:             默认超时时间(秒)，可以是 (连接超时, 读取超时)
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(constants.headers)
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.cookies: dict[str, str] = {}
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        # pool_block 为 False 时超出 pool_maxsize 的请求会新建用完即关闭的连接，并发时失去复用
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=retry, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.cookie_lock = threading.Lock()
+
+
+    def set_cookies(self, cookies: dict | None) -> None:
+        """
+            替换随请求发送的 Cookies
+            :param cookies:     新的 Cookies，为 None 时清空
+        """
+        with self.cookie_lock:
+            # 只替换引用，正在进行的请求继续使用旧的字典
+            self.cookies = dict(cookies or {})
+
+
+    def request(self, method: str, url: str | bytes, anonymous: bool = False, **kwargs) -> requests.Response:
+        """
+            :param anonymous:   是否不携带登录会话的 Cookies
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if not anonymous:
+            cookies = self.cookies
+            if 'cookies' in kwargs:
+                cookies = {**cookies, **kwargs['cookies']}
+            kwargs['cookies'] = cookies
+        return self.session.request(method, url, **kwargs)
+
+
+    def get(self, url: str | bytes, anonymous: bool = False, **kwargs) -> requests.Response:
+        return self.request('GET', url, anonymous, **kwargs)
+
+
+    def post(self, url: str | bytes, anonymous: bool = False, **kwargs) -> requests.Response:
+        return self.request('POST', url, anonymous, **kwargs)
+
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_client: HttpClient | None = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+        :return:    进程内共享的 HttpClient，第一次调用时创建
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = HttpClient()
+    return _default_client
+
+
+def set_client(http_client: HttpClient) -> None:
+    """
+        替换共享的 HttpClient，如需要不同的连接数或重试策略时在启动时调用
+    """
+    global _default_client
+    with _default_lock:
+        _default_client = http_client
@@ -0,0 +1,169 @@
+from typing import Any
+import json
+
+
+"""
+    可替换的 JSON 编解码后端
+    可选: json(标准库), orjson, msgspec，auto 会按 orjson -> msgspec -> json 的顺序选择第一个可用的后端
+"""
+
+
+DEFAULT_FONT_SIZE = 25
+DEFAULT_COLOR = 16777215
+
+
+def _emoji_tuples(emots: dict | None) -> list[tuple[str, str, int, int, str]]:
+    if not emots:
+        return []
+    return [
+        (v['descript'], v['emoji'], v.get('width', 20), v.get('height', 20), v['url'])
+        for v in emots.values()
+    ]
+
+
+class JsonCodec:
+    """
+        标准库 json 后端，也是其他后端的基类
+    """
+
+    name = 'json'
+
+    def loads(self, data) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+    def decode_extra(self, data) -> tuple[int, int, list[tuple[str, str, int, int, str]], bool]:
+        """
+            解析弹幕 info[0][15]['extra'] 中嵌套的 JSON 字符串
+            :param data:    extra 字符串
+            :return:        (字号, 颜色, 表情列表[(descript, emoji, width, height, url)], 是否为自己发送)
+        """
+        extra = self.loads(data)
+        return (
+            extra.get('font_size', DEFAULT_FONT_SIZE),
+            extra.get('color', DEFAULT_COLOR),
+            _emoji_tuples(extra.get('emots')),
+            extra.get('send_from_me', False)
+        )
+
+
+class OrjsonCodec(JsonCodec):
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+
+    def loads(self, data) -> Any:
+        return self.orjson.loads(data)
+
+
+    def dumps(self, obj) -> bytes:
+        return self.orjson.dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+
+        class Emoji(msgspec.Struct):
+            descript: str
+            emoji: str
+            url: str
+            width: int = 20
+            height: int = 20
+
+        class Extra(msgspec.Struct):
+            font_size: int = DEFAULT_FONT_SIZE
+            color: int = DEFAULT_COLOR
+            emots: dict[str, Emoji] | None = None
+            send_from_me: bool = False
+
+        self.decoder = msgspec.json.Decoder()
+        self.encoder = msgspec.json.Encoder()
+        # 直接解码为带类型的结构体，未声明的字段会被跳过
+        self.extra_decoder = msgspec.json.Decoder(Extra)
+
+
+    def loads(self, data) -> Any:
+        return self.decoder.decode(data)
+
+
+    def dumps(self, obj) -> bytes:
+        return self.encoder.encode(obj)
+
+
+    def decode_extra(self, data) -> tuple[int, int, list[tuple[str, str, int, int, str]], bool]:
+        extra = self.extra_decoder.decode(data)
+        emojis = []
+        if extra.emots:
+            emojis = [(v.descript, v.emoji, v.width, v.height, v.url) for v in extra.emots.values()]
+        return extra.font_size, extra.color, emojis, extra.send_from_me
+
+
+backends = {
+    'json': JsonCodec,
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+}
+
+backend: JsonCodec = JsonCodec()
+
+
+def create_codec(name: str) -> JsonCodec:
+    """
+        创建指定名称的编解码后端
+        :param name:    json / orjson / msgspec / auto
+        :return:        编解码器，依赖未安装时抛出 ImportError
+    """
+    if name == 'auto':
+        for candidate in ('orjson', 'msgspec'):
+            try:
+                return backends[candidate]()
+            except ImportError:
+                continue
+        return JsonCodec()
+    if name not in backends:
+        raise ValueError(f"Unsupported json backend: {name}")
+    return backends[name]()
+
+
+def set_backend(name: str) -> JsonCodec:
+    """
+        切换全局使用的 JSON 后端，指定的后端不可用时回退到标准库
+        :param name:    json / orjson / msgspec / auto
+        :return:        实际使用的编解码器
+    """
+    global backend
+    try:
+        backend = create_codec(name)
+    except ImportError:
+        backend = JsonCodec()
+    return backend
+
+
+def get_backend() -> JsonCodec:
+    return backend
+
+
+def loads(data) -> Any:
+    return backend.loads(data)
+
+
+def dumps(obj) -> bytes:
+    return backend.dumps(obj)
+
+
+def decode_extra(data) -> tuple[int, int, list[tuple[str, str, int, int, str]], bool]:
+    return backend.decode_extra(data)
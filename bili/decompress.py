@@ -1,3 +1,5 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
 import zlib
 import brotli
 
@@ -9,4 +11,59 @@ def decompress(data: bytes, compression: str) -> bytes:
     elif compression == 'brotli':
         return brotli.decompress(data)
     else:
-        raise ValueError(f"Unsupported compression type: {compression}")
\ No newline at end of file
+        raise ValueError(f"Unsupported compression type: {compression}")
+
+
+class DecompressStage:
+    """
+        解压阶段，超过阈值的数据交给线程池(或进程池)解压，避免阻塞 asyncio 事件循环
+    """
+
+    def __init__(self, threshold: int = 64 * 1024, pool_size: int = 2, use_processes: bool = False):
+        """
+            :param threshold:       压缩数据达到该字节数时才会放到池中解压
+            :param pool_size:       线程池/进程池的大小
+            :param use_processes:   是否使用进程池(数据需要被复制到子进程)
+        """
+        self.threshold = threshold
+        self.pool_size = pool_size
+        self.use_processes = use_processes
+        self.executor: Executor | None = None
+        self.offloaded = 0
+        self.inline = 0
+
+
+    def get_executor(self) -> Executor:
+        if self.executor is None:
+            if self.use_processes:
+                self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='decompress')
+        return self.executor
+
+
+    def should_offload(self, size: int) -> bool:
+        return size >= self.threshold
+
+
+    async def decompress(self, data, compression: str) -> bytes:
+        """
+            解压数据，小于阈值时直接在当前线程解压
+            :param data:            压缩数据(bytes 或 memoryview)
+            :param compression:     压缩类型
+            :return:                解压后的数据
+        """
+        if not self.should_offload(len(data)):
+            self.inline += 1
+            return decompress(data, compression)
+        self.offloaded += 1
+        if self.use_processes:
+            data = bytes(data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_executor(), decompress, data, compression)
+
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
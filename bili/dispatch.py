@@ -0,0 +1,123 @@
+from typing import Any, Callable
+from bili import codec
+from bili import frame
+import time
+
+
+CMD_KEY = b'"cmd"'
+PEEK_WINDOW = 64
+
+
+def peek_cmd(body) -> str | None:
+    """
+        读取顶层 "cmd" 字段的值
+        "cmd" 是第一个键时(服务器发送的绝大多数消息)直接从原始字节中读取，不解析 JSON，
+        否则 "cmd" 可能出现在嵌套的对象中，需要完整解析
+        旧版本的指令形如 DANMU_MSG:4:0:2:2:2:0，冒号之后的部分会被去掉
+        :param body:    帧的 JSON 部分(bytes 或 memoryview)
+        :return:        指令名，找不到时返回 None
+    """
+    cmd = _read_first_cmd(bytes(body[:PEEK_WINDOW]))
+    if cmd is not None:
+        return cmd
+    try:
+        json_obj = codec.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(json_obj, dict):
+        return None
+    return normalize_cmd(json_obj.get('cmd'))
+
+
+def normalize_cmd(cmd) -> str | None:
+    """
+        :param cmd: "cmd" 字段的值
+        :return:    去掉冒号之后部分的指令名，不是字符串时返回 None
+    """
+    if not isinstance(cmd, str):
+        return None
+    return cmd.split(':', 1)[0]
+
+
+def _read_first_cmd(raw: bytes) -> str | None:
+    raw = raw.lstrip()
+    if not raw.startswith(b'{'):
+        return None
+    raw = raw[1:].lstrip()
+    if not raw.startswith(CMD_KEY):
+        return None
+    colon = raw.find(b':', len(CMD_KEY))
+    if colon < 0 or raw[len(CMD_KEY):colon].strip():
+        return None
+    index = colon + 1
+    while index < len(raw) and raw[index] in b' \t\r\n':
+        index += 1
+    if not raw.startswith(b'"', index):
+        return None
+    end = raw.find(b'"', index + 1)
+    # 值被截断或包含转义字符时交给完整解析
+    if end < 0 or b'\\' in raw[index + 1:end]:
+        return None
+    return raw[index + 1:end].split(b':', 1)[0].decode('utf-8', 'replace')
+
+
+class CommandDispatcher:
+    """
+        按指令名分发的调度器，只有注册了处理函数的指令才会被完整解析
+        注册在 None 上的处理函数接收所有没有其他处理函数的指令
+    """
+
+    def __init__(self):
+        self.handlers: dict[str, list[Callable[[Any], Any]]] = {}
+        self.parsed = 0
+        self.skipped = 0
+        # 可选的 JSON 解析计时回调，传入参数为耗时(秒)
+        self.decode_timer: Callable[[float], Any] | None = None
+
+
+    def register(self, cmd: str, handler: Callable[[Any], Any]) -> None:
+        """
+            注册指令处理函数
+            :param cmd:         指令名，如 DANMU_MSG，为 None 时接收所有没有其他处理函数的指令
+            :param handler:     处理函数，传入参数为解析后的 JSON 对象
+        """
+        self.handlers.setdefault(cmd, []).append(handler)
+
+
+    def unregister(self, cmd: str, handler: Callable[[Any], Any]) -> None:
+        handlers = self.handlers.get(cmd)
+        if handlers is None or handler not in handlers:
+            return
+        handlers.remove(handler)
+        if not handlers:
+            del self.handlers[cmd]
+
+
+    def wants(self, cmd: str | None) -> bool:
+        return cmd in self.handlers or (cmd is not None and None in self.handlers)
+
+
+    def dispatch(self, packet) -> bool:
+        """
+            分发一个数据包(DownloadPacket)
+            :param packet:  未解码的数据包
+            :return:        是否有处理函数处理了该数据包
+        """
+        total_len, header_len = frame.read_header(packet.data)[:2]
+        cmd = peek_cmd(memoryview(packet.data)[header_len:total_len])
+        handlers = None
+        if cmd is not None:
+            handlers = self.handlers.get(cmd) or self.handlers.get(None)
+        if handlers is None:
+            self.skipped += 1
+            return False
+        self.parsed += 1
+        if self.decode_timer is None:
+            json_data = packet.decode()
+        else:
+            start = time.perf_counter()
+            json_data = packet.decode()
+            self.decode_timer(time.perf_counter() - start)
+        for handler in tuple(handlers):
+            handler(json_data)
+        return True
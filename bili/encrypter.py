@@ -2,14 +2,15 @@ from Crypto.Cipher import PKCS1_OAEP
 from Crypto.PublicKey import RSA
 from Crypto.Hash import SHA256
 from Crypto.PublicKey.RSA import RsaKey
-from bili import constants
-from functools import reduce
+from bili import client
+from functools import lru_cache
 from hashlib import md5
 
 import binascii
+import os.path
+import threading
 import urllib.parse
 import time
-import requests
 
 """
     The contents below came from BiliBili-Api-Collect, 
@@ -20,6 +21,7 @@ import requests
         mixinKeyEncTab, 
         get_mixin_key,
         enc_wbi,
+        sign_params,
         get_wbi_keys,
         get_correspond_path
     ]
@@ -33,15 +35,41 @@ mixinKeyEncTab = [
     36, 20, 34, 44, 52
 ]
 
+# 公钥文件位于仓库根目录，与当前工作目录无关
+RSA_PUB_KEY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rsa_pub_key.txt')
+
 pub_key: RsaKey = None
+cipher = None
+_cipher_lock = threading.Lock()
 
 
+@lru_cache(maxsize=8)
 def get_mixin_key(orig: str):
     """
-        对 imgKey 和 subKey 进行字符顺序打乱编码
+        对 imgKey 和 subKey 进行字符顺序打乱编码，密钥每天才变化一次，结果会被缓存
         :param orig: 原始的 imgKey + subKey 字符串
     """
-    return reduce(lambda s, i: s + orig[i], mixinKeyEncTab, '')[:32]
+    return ''.join([orig[i] for i in mixinKeyEncTab])[:32]
+
+
+# 过滤 value 中的 "!'()*" 字符
+_WBI_FILTER = str.maketrans('', '', "!'()*")
+
+
+def sign_params(params: dict, mixin_key: str, wts: int | None = None) -> dict[str, str]:
+    """
+        使用已经计算好的 mixin_key 为请求参数进行 wbi 签名
+        :param params:      请求参数字典，不会被修改
+        :param mixin_key:   get_mixin_key 的结果
+        :param wts:         签名时间戳(秒)，为 None 时使用当前时间
+        :return:            带有 w_rid 和 wts 的请求参数字典
+    """
+    signed = {k: str(v).translate(_WBI_FILTER) for k, v in params.items()}
+    signed['wts'] = str(round(time.time()) if wts is None else wts)
+    signed = dict(sorted(signed.items()))                       # 按照 key 重排参数
+    query = urllib.parse.urlencode(signed)                      # 序列化参数
+    signed['w_rid'] = md5((query + mixin_key).encode()).hexdigest()
+    return signed
 
 
 def enc_wbi(params: dict, img_key: str, sub_key: str):
@@ -52,20 +80,7 @@ def enc_wbi(params: dict, img_key: str, sub_key: str):
         :param sub_key:   从导航接口获取的 sub_key
         :return:          带有 w_rid 和 wts 的请求参数字典
     """
-    mixin_key = get_mixin_key(img_key + sub_key)
-    curr_time = round(time.time())
-    params['wts'] = curr_time                                   # 添加 wts 字段
-    params = dict(sorted(params.items()))                       # 按照 key 重排参数
-    # 过滤 value 中的 "!'()*" 字符
-    params = {
-        k : ''.join(filter(lambda chr: chr not in "!'()*", str(v)))
-        for k, v
-        in params.items()
-    }
-    query = urllib.parse.urlencode(params)                      # 序列化参数
-    wbi_sign = md5((query + mixin_key).encode()).hexdigest()    # 计算 w_rid
-    params['w_rid'] = wbi_sign
-    return params
+    return sign_params(params, get_mixin_key(img_key + sub_key))
 
 
 def get_wbi_keys() -> tuple[str, str]:
@@ -73,28 +88,45 @@ def get_wbi_keys() -> tuple[str, str]:
         获取最新的 img_key 和 sub_key
         :return:  一个包含 img_key 和 sub_key 的元组
     """
-    resp = requests.get('https://api.bilibili.com/x/web-interface/nav', headers=constants.headers)
+    resp = client.get_client().get('https://api.bilibili.com/x/web-interface/nav', anonymous=True)
     resp.raise_for_status()
-    json_content = resp.json()
-    img_url: str = json_content['data']['wbi_img']['img_url']
-    sub_url: str = json_content['data']['wbi_img']['sub_url']
+    return parse_wbi_keys(resp.json())
+
+
+def parse_wbi_keys(json_obj: dict) -> tuple[str, str]:
+    """
+        从导航接口的返回值中读取 img_key 和 sub_key，未登录时同样会返回
+    """
+    img_url: str = json_obj['data']['wbi_img']['img_url']
+    sub_url: str = json_obj['data']['wbi_img']['sub_url']
     img_key = img_url.rsplit('/', 1)[1].split('.')[0]
     sub_key = sub_url.rsplit('/', 1)[1].split('.')[0]
     return img_key, sub_key
 
 
-def read_rsa_pub_key() -> None:
+def read_rsa_pub_key(path: str = RSA_PUB_KEY_PATH) -> None:
     """
-        从本地文件读取 RSA 公钥
+        从本地文件读取 RSA 公钥，并创建可以重复使用的 OAEP 加密器
     """
-    global pub_key
-    with open('../rsa_pub_key.txt', 'r') as f:
+    global pub_key, cipher
+    with open(path, 'r') as f:
         raw_key = f.read()
-        pub_key = RSA.import_key(raw_key)
+    key = RSA.import_key(raw_key)
+    pub_key = key
+    cipher = PKCS1_OAEP.new(key, SHA256)
+
+
+def get_cipher():
+    """
+        :return:    OAEP 加密器，第一次调用时读取公钥
+    """
+    if cipher is None:
+        with _cipher_lock:
+            if cipher is None:
+                read_rsa_pub_key()
+    return cipher
+
 
 def get_correspond_path(time_stamp):
-    if pub_key is None:
-        read_rsa_pub_key()
-    cipher = PKCS1_OAEP.new(pub_key, SHA256)
-    encrypted = cipher.encrypt(f'refresh_{time_stamp}'.encode())
-    return binascii.b2a_hex(encrypted).decode()
\ No newline at end of file
+    encrypted = get_cipher().encrypt(f'refresh_{time_stamp}'.encode())
+    return binascii.b2a_hex(encrypted).decode()
@@ -0,0 +1,207 @@
+from collections import deque
+from typing import Any, Callable, Iterable, TextIO
+import asyncio
+import threading
+import time
+import sys
+
+
+DANMAKU = 'DANMU_MSG'
+
+
+class LiveEvent:
+    """
+        直播间事件
+        type 为指令名: DANMU_MSG 事件的 data 是 interaction.Danmaku，其他指令的 data 是解析后的 JSON 对象
+        receive_time 为收到所在 websocket 消息的时间，dispatch_time 为分发给订阅者的时间，
+        未开启延迟统计时 dispatch_time 与 receive_time 相同，不为每个事件读取时钟
+    """
+
+    __slots__ = ('room_id', 'type', 'data', 'receive_time', 'dispatch_time')
+
+    def __init__(self, room_id: int, type: str, data: Any,
+                 receive_time: float = 0.0, dispatch_time: float = 0.0):
+        self.room_id = room_id
+        self.type = type
+        self.data = data
+        self.receive_time = receive_time
+        self.dispatch_time = dispatch_time
+
+
+    def __repr__(self):
+        return f'LiveEvent(room_id={self.room_id}, type={self.type})'
+
+
+class EventHub:
+    """
+        按事件类型分发给订阅者，没有订阅者时发布端可以完全跳过事件的构造
+    """
+
+    def __init__(self):
+        self.callbacks: dict[str | None, list[Callable[[LiveEvent], Any]]] = {}
+        self.errors = 0
+
+
+    def subscribe(self, callback: Callable[[LiveEvent], Any], event_types: Iterable[str] = ()) -> None:
+        """
+            :param callback:        回调函数，传入参数为 LiveEvent
+            :param event_types:     订阅的事件类型，为空时订阅所有类型
+        """
+        for event_type in tuple(event_types) or (None,):
+            self.callbacks.setdefault(event_type, []).append(callback)
+
+
+    def unsubscribe(self, callback: Callable[[LiveEvent], Any]) -> None:
+        for event_type in list(self.callbacks.keys()):
+            callbacks = self.callbacks[event_type]
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                del self.callbacks[event_type]
+
+
+    def wants(self, event_type: str) -> bool:
+        return event_type in self.callbacks or None in self.callbacks
+
+
+    def publish(self, event: LiveEvent) -> None:
+        for key in (event.type, None):
+            callbacks = self.callbacks.get(key)
+            if callbacks is None:
+                continue
+            for callback in tuple(callbacks):
+                try:
+                    callback(event)
+                except Exception as e:
+                    self.errors += 1
+
+
+class EventStream:
+    """
+        事件的异步迭代器: async for event in stream
+        超过容量时丢弃最旧的事件，关闭后迭代结束
+    """
+
+    def __init__(self, hub: EventHub, event_types: Iterable[str] = (), capacity: int = 10000,
+                 on_close: Callable[['EventStream'], Any] | None = None):
+        """
+            :param hub:         订阅的事件中心
+            :param event_types: 订阅的事件类型，为空时订阅所有类型
+            :param capacity:    缓存的事件数量，超过时丢弃最旧的事件
+            :param on_close:    关闭时的回调，用于释放为该迭代器建立的其他订阅
+        """
+        self.hub = hub
+        self.on_close = on_close
+        self.items: deque[LiveEvent] = deque()
+        self.capacity = capacity
+        self.waiter: asyncio.Future | None = None
+        self.closed = False
+        self.dropped = 0
+        hub.subscribe(self.push, event_types)
+
+
+    def push(self, event: LiveEvent) -> None:
+        if len(self.items) >= self.capacity:
+            self.items.popleft()
+            self.dropped += 1
+        self.items.append(event)
+        self.wake()
+
+
+    def wake(self) -> None:
+        waiter = self.waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.hub.unsubscribe(self.push)
+        if self.on_close is not None:
+            self.on_close(self)
+        self.wake()
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self) -> LiveEvent:
+        while not self.items:
+            if self.closed:
+                raise StopAsyncIteration
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.items.popleft()
+
+
+def format_danmaku(event: LiveEvent) -> str:
+    danmaku = event.data
+    return f'{danmaku.get_time()} - {danmaku.sender_data.name}: {danmaku.content} '
+
+
+class PrintSink:
+    """
+        批量输出事件的订阅者，攒够 batch_size 条或距离上次输出超过 flush_interval 秒时一次性写出
+        可以在任意线程中调用
+    """
+
+    def __init__(self, formatter: Callable[[LiveEvent], str] = format_danmaku,
+                 stream: TextIO | None = None,
+                 flush_interval: float = 0.5, batch_size: int = 256):
+        """
+            :param formatter:       把事件格式化为一行文本的函数
+            :param stream:          输出流，默认为 sys.stdout
+            :param flush_interval:  最长的输出间隔(秒)
+            :param batch_size:      攒够多少条立即输出
+        """
+        self.formatter = formatter
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending: list[LiveEvent] = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+
+    def __call__(self, event: LiveEvent) -> None:
+        with self.lock:
+            self.pending.append(event)
+            if len(self.pending) < self.batch_size and time.monotonic() - self.last_flush < self.flush_interval:
+                return
+        self.flush()
+
+
+    def flush(self) -> None:
+        with self.lock:
+            events = self.pending
+            self.pending = []
+            self.last_flush = time.monotonic()
+        if not events:
+            return
+        lines = []
+        for event in events:
+            try:
+                lines.append(self.formatter(event))
+            except Exception as e:
+                continue
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write('\n'.join(lines) + '\n')
+        stream.flush()
+
+
+    async def run(self) -> None:
+        """
+            定时输出，保证消息较少时也能按时输出
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                self.flush()
+        finally:
+            self.flush()
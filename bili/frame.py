@@ -0,0 +1,162 @@
+from typing import Awaitable, Callable, Iterator
+from bili import decompress
+import struct
+
+
+HEADER = struct.Struct('>IHHII')
+HEADER_LEN = HEADER.size
+
+PROTOCOL_JSON = 0
+PROTOCOL_INT = 1
+PROTOCOL_ZLIB = 2
+PROTOCOL_BROTLI = 3
+
+OP_HEARTBEAT = 2
+OP_HEARTBEAT_REPLY = 3
+OP_MESSAGE = 5
+OP_VERIFY = 7
+OP_VERIFY_REPLY = 8
+
+COMPRESSIONS = {
+    PROTOCOL_ZLIB: 'zlib',
+    PROTOCOL_BROTLI: 'brotli',
+}
+
+MAX_DEPTH = 8
+
+
+def read_header(view, offset: int = 0) -> tuple[int, int, int, int, int]:
+    """
+        从缓冲区读取 16 字节的包头，不复制数据
+        :param view:    bytes / bytearray / memoryview
+        :param offset:  包头所在的偏移量
+        :return:        (total_len, header_len, protocol, packet_type, sequence)
+    """
+    return HEADER.unpack_from(view, offset)
+
+
+def complete_length(view: memoryview) -> int:
+    """
+        计算缓冲区开头完整帧的总长度，末尾不完整的帧不计入
+        :param view:    待检查的缓冲区
+        :return:        完整帧所占的字节数
+    """
+    offset = 0
+    end = len(view)
+    while offset + HEADER_LEN <= end:
+        total_len, header_len = HEADER.unpack_from(view, offset)[:2]
+        if total_len < header_len or header_len < HEADER_LEN:
+            raise ValueError(f"Malformed frame header at offset {offset}")
+        if offset + total_len > end:
+            break
+        offset += total_len
+    return offset
+
+
+def iter_frames(data, decompressor: Callable = decompress.decompress,
+                depth: int = 0) -> Iterator[memoryview]:
+    """
+        遍历缓冲区中的所有帧，遇到 zlib / brotli 压缩的批量帧时递归展开
+        :param data:            只包含完整帧的缓冲区
+        :param decompressor:    解压函数，签名与 decompress.decompress 相同
+        :param depth:           当前递归深度
+        :return:                每一帧(包含包头)的 memoryview，不会复制原缓冲区
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError("Nested frame batches are too deep")
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    offset = 0
+    end = len(view)
+    while offset + HEADER_LEN <= end:
+        total_len, header_len, protocol = HEADER.unpack_from(view, offset)[:3]
+        if total_len < header_len or header_len < HEADER_LEN or offset + total_len > end:
+            raise ValueError(f"Malformed frame header at offset {offset}")
+        frame = view[offset:offset + total_len]
+        compression = COMPRESSIONS.get(protocol)
+        if compression is None:
+            yield frame
+        else:
+            yield from iter_frames(decompressor(frame[header_len:], compression), decompressor, depth + 1)
+        offset += total_len
+    if offset != end:
+        raise ValueError(f"Truncated frame at offset {offset}")
+
+
+async def expand_frames(data, stage: decompress.DecompressStage, depth: int = 0) -> list[memoryview]:
+    """
+        与 iter_frames 相同，但压缩的批量帧交给解压阶段处理，较大的批量不会阻塞事件循环
+        :param data:    只包含完整帧的缓冲区
+        :param stage:   解压阶段
+        :param depth:   当前递归深度
+        :return:        每一帧(包含包头)的 memoryview 列表
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError("Nested frame batches are too deep")
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    frames = []
+    offset = 0
+    end = len(view)
+    while offset + HEADER_LEN <= end:
+        total_len, header_len, protocol = HEADER.unpack_from(view, offset)[:3]
+        if total_len < header_len or header_len < HEADER_LEN or offset + total_len > end:
+            raise ValueError(f"Malformed frame header at offset {offset}")
+        frame = view[offset:offset + total_len]
+        compression = COMPRESSIONS.get(protocol)
+        if compression is None:
+            frames.append(frame)
+        else:
+            expanded = await stage.decompress(frame[header_len:], compression)
+            frames.extend(await expand_frames(expanded, stage, depth + 1))
+        offset += total_len
+    if offset != end:
+        raise ValueError(f"Truncated frame at offset {offset}")
+    return frames
+
+
+class FrameParser:
+    """
+        流式帧解析器，能够处理被拆分到多条 websocket 消息中的帧
+    """
+
+    def __init__(self, decompressor: Callable = decompress.decompress):
+        self.decompressor = decompressor
+        self.pending = b''
+
+
+    def split(self, data) -> memoryview:
+        """
+            输入一条 websocket 消息，返回其中完整帧部分的 memoryview，不完整的尾部留到下一条消息
+            只有在上一条消息留下了不完整的帧时才会拼接(复制)数据
+            :param data:    websocket 收到的原始字节
+            :return:        只包含完整帧的 memoryview
+        """
+        if self.pending:
+            data = self.pending + bytes(data)
+        view = memoryview(data)
+        end = complete_length(view)
+        self.pending = bytes(view[end:]) if end < len(view) else b''
+        return view[:end]
+
+
+    def feed(self, data) -> Iterator[memoryview]:
+        """
+            输入一条 websocket 消息，返回其中所有完整帧(展开后)的迭代器
+            :param data:    websocket 收到的原始字节
+            :return:        帧 memoryview 的迭代器
+        """
+        return iter_frames(self.split(data), self.decompressor)
+
+
+    def feed_async(self, data, stage: decompress.DecompressStage) -> Awaitable[list[memoryview]]:
+        """
+            与 feed 相同，但通过解压阶段展开压缩的批量帧
+            拆分在调用时同步完成，因此多条消息可以并发解压而不会打乱拼接顺序
+            :param data:    websocket 收到的原始字节
+            :param stage:   解压阶段
+            :return:        等待后得到帧 memoryview 列表
+        """
+        return expand_frames(self.split(data), stage)
+
+
+    def reset(self) -> None:
+        self.pending = b''
@@ -1,53 +1,246 @@
-from datetime import datetime, timezone, timedelta
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta, tzinfo
+from functools import lru_cache
+from sys import intern
+import threading
 import pytz
 
+
+DEFAULT_TIME_ZONE = 'Asia/Shanghai'
+DEFAULT_TIME_UNIFORM = "%Y-%m-%d %H:%M:%S"
+
+
+@lru_cache(maxsize=64)
+def get_timezone(time_zone: str | None) -> tzinfo:
+    return timezone.utc if time_zone is None else pytz.timezone(time_zone)
+
+
+def normalize_timestamp(value) -> int:
+    """
+        统一弹幕的时间戳格式
+        :param value:   新版弹幕的 {'ts': 秒, 'ct': ...}，或旧版弹幕的毫秒/秒时间戳
+        :return:        秒级时间戳
+    """
+    if isinstance(value, dict):
+        value = value.get('ts', 0)
+    value = int(value)
+    if value > 100000000000:
+        value //= 1000
+    return value
+
+
+class TimeFormatter:
+    """
+        时间格式化器，时区只解析一次，同一秒内的时间戳直接复用上一次的结果
+    """
+
+    def __init__(self, time_zone: str | None = DEFAULT_TIME_ZONE, time_uniform: str = DEFAULT_TIME_UNIFORM):
+        self.tz = get_timezone(time_zone)
+        self.time_uniform = time_uniform
+        self.last: tuple[int, str] = (-1, '')
+
+
+    def format(self, timestamp) -> str:
+        """
+            :param timestamp:   时间戳(任意 normalize_timestamp 支持的格式)
+            :return:            格式化后的字符串
+        """
+        second = normalize_timestamp(timestamp)
+        last = self.last
+        if last[0] == second:
+            return last[1]
+        text = datetime.fromtimestamp(second, self.tz).strftime(self.time_uniform)
+        self.last = (second, text)
+        return text
+
+
+    def format_batch(self, timestamps) -> list[str]:
+        """
+            批量格式化，每个不同的秒只格式化一次
+            :param timestamps:  时间戳列表
+            :return:            与输入顺序一致的字符串列表
+        """
+        formatted: dict[int, str] = {}
+        results = []
+        for timestamp in timestamps:
+            second = normalize_timestamp(timestamp)
+            text = formatted.get(second)
+            if text is None:
+                text = datetime.fromtimestamp(second, self.tz).strftime(self.time_uniform)
+                formatted[second] = text
+            results.append(text)
+        return results
+
+
+@lru_cache(maxsize=64)
+def get_formatter(time_zone: str | None = DEFAULT_TIME_ZONE, time_uniform: str = DEFAULT_TIME_UNIFORM) -> TimeFormatter:
+    """
+        获取共享的时间格式化器
+    """
+    return TimeFormatter(time_zone, time_uniform)
+
+
 def timestamp_to_datetime(timestamp: int, time_zone: str, time_uniform: str) -> str:
-    tz = pytz.timezone(time_zone)
-    dt = datetime.fromtimestamp(timestamp, timezone.utc if time_zone is None else tz)
-    return dt.strftime(time_uniform)
+    return get_formatter(time_zone, time_uniform).format(timestamp)
+
+
+"""
+    弹幕相关的类都使用 __slots__，不再为每个对象分配 __dict__
+    发送者名称、头像链接和表情信息会被 intern，重复出现的字符串只保留一份
+"""
+
+
+def intern_str(value):
+    """
+        只驻留字符串，接口缺少字段时可能是 None 或其他类型，原样返回
+    """
+    return intern(value) if type(value) is str else value
 
 
 class TextInfo:
 
+    __slots__ = ('font_size', 'color')
+
     def __init__(self, font_size: int, color: int):
         self.font_size = font_size
         self.color = color
 
 
+@lru_cache(maxsize=1024)
+def text_info(font_size: int, color: int) -> TextInfo:
+    """
+        获取共享的 TextInfo，相同字号和颜色的弹幕使用同一个对象(不应修改返回的对象)
+    """
+    return TextInfo(font_size, color)
+
+
 class EmojiInfo:
 
+    __slots__ = ('descript', 'emoji', 'size', 'url')
+
     def __init__(self, descript: str, emoji: str, size: tuple[int, int], url: str):
-        self.descript = descript
-        self.emoji = emoji
+        self.descript = intern_str(descript)
+        self.emoji = intern_str(emoji)
         self.size = size
-        self.url = url
+        self.url = intern_str(url)
 
 
 class SenderData:
 
+    __slots__ = ('mid', 'name', 'name_color', 'avatar_url', 'is_me')
+
     def __init__(self, mid: int, name: str,
                  name_color: int, avatar_url: str,
                  is_me: bool):
         self.mid = mid
-        self.name = name
+        self.name = intern_str(name)
         self.name_color = name_color
-        self.avatar_url = avatar_url
+        self.avatar_url = intern_str(avatar_url)
         self.is_me = is_me
 
 
+class SenderCache:
+    """
+        以 mid 为键的发送者缓存(LRU)，同一用户的弹幕共享同一个 SenderData
+        只有名称、颜色、头像或 is_me 发生变化时才会创建新的对象
+        mid 为 0(未登录或隐藏身份的用户)时不同的发送者共用同一个 mid，不会被缓存
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.entries: OrderedDict[int, SenderData] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.uncached = 0
+
+
+    def get(self, mid: int, name: str, name_color: int, avatar_url: str, is_me: bool) -> SenderData:
+        """
+            获取(或创建)发送者数据
+            :return:    缓存中的 SenderData，不应修改返回的对象
+        """
+        if not mid:
+            self.uncached += 1
+            return SenderData(mid, name, name_color, avatar_url, is_me)
+        with self.lock:
+            sender = self.entries.get(mid)
+            if sender is not None:
+                if (sender.name == name and sender.name_color == name_color
+                        and sender.avatar_url == avatar_url and sender.is_me == is_me):
+                    self.entries.move_to_end(mid)
+                    self.hits += 1
+                    return sender
+                self.refreshes += 1
+            else:
+                self.misses += 1
+            sender = SenderData(mid, name, name_color, avatar_url, is_me)
+            self.entries[mid] = sender
+            self.entries.move_to_end(mid)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return sender
+
+
+    def resize(self, max_size: int) -> None:
+        with self.lock:
+            self.max_size = max_size
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'uncached': self.uncached,
+        }
+
+
+sender_cache = SenderCache()
+
+
 class Danmaku:
 
-    def __init__(self, content: str, time: int, text_info: TextInfo,
-                 emoji_infos: list[EmojiInfo], sender_data: SenderData):
+    __slots__ = ('content', 'text_info', 'emoji_infos', 'sender_data', 'time', 'timestamp',
+                 'server_time', 'receive_time', 'dispatch_time')
+
+    def __init__(self, content: str, time, text_info: TextInfo,
+                 emoji_infos: tuple[EmojiInfo, ...], sender_data: SenderData,
+                 server_time: float = 0.0):
+        """
+            :param time:            弹幕中原始的发送时间，新版弹幕为 {'ts': 秒, 'ct': ...}，原样保存在 time 中
+            :param server_time:     服务器发送时间(秒，精确到毫秒)，为 0 时使用 timestamp
+        """
         self.content = content
         self.text_info = text_info
         self.emoji_infos = emoji_infos
         self.sender_data = sender_data
         self.time = time
+        # 统一为秒级的发送时间，参看 normalize_timestamp
+        self.timestamp = normalize_timestamp(time)
+        self.server_time = server_time if server_time else float(self.timestamp)
+        # 由 LiveEventLoop 填写: 收到所在 websocket 消息的时间和分发给订阅者的时间(time.time())
+        # 未开启延迟统计时 dispatch_time 与 receive_time 相同
+        self.receive_time = 0.0
+        self.dispatch_time = 0.0
 
 
-    def get_time(self, time_zone: str = 'Asia/Shanghai', time_uniform: str = "%Y-%m-%d %H:%M:%S") -> str:
-        return timestamp_to_datetime(self.time['ts'], time_zone, time_uniform)
+    def get_time(self, time_zone: str = DEFAULT_TIME_ZONE, time_uniform: str = DEFAULT_TIME_UNIFORM) -> str:
+        return get_formatter(time_zone, time_uniform).format(self.timestamp)
 
 
     def __str__(self):
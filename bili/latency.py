@@ -0,0 +1,104 @@
+from collections import deque
+
+
+"""
+    端到端延迟统计
+    server_to_receive   服务器发送弹幕(info[0][4]，毫秒)到本地收到 websocket 消息的延迟，包含两端时钟的偏差
+    receive_to_dispatch 本地收到消息到弹幕交给订阅者(或放入缓冲区)的延迟，反映解压、解析和订阅者的负载
+    每个直播间和每个服务器各保留最近 window 个样本，分位数在读取时计算
+"""
+
+
+SERVER_TO_RECEIVE = 'server_to_receive'
+RECEIVE_TO_DISPATCH = 'receive_to_dispatch'
+KINDS = (SERVER_TO_RECEIVE, RECEIVE_TO_DISPATCH)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RollingQuantiles:
+    """
+        最近 window 个样本的分位数，记录只是一次 deque.append
+    """
+
+    __slots__ = ('samples',)
+
+    def __init__(self, window: int = 1024):
+        self.samples: deque[float] = deque(maxlen=window)
+
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+    def quantiles(self, quantiles: tuple[float, ...] = QUANTILES) -> dict[str, float]:
+        """
+            :return:    形如 {'p50': 秒, 'p95': 秒, 'p99': 秒}，没有样本时为空字典
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+        last = len(ordered) - 1
+        return {f'p{round(q * 100)}': ordered[min(last, int(q * len(ordered)))] for q in quantiles}
+
+
+class LatencyMonitor:
+    """
+        按直播间和服务器分组的延迟统计，可以在多个直播间之间共享
+    """
+
+    def __init__(self, window: int = 1024):
+        """
+            :param window:  每组保留的样本数量
+        """
+        self.window = window
+        self.rooms: dict[int, dict[str, RollingQuantiles]] = {}
+        self.hosts: dict[str, dict[str, RollingQuantiles]] = {}
+
+
+    def group(self, groups: dict, key) -> dict[str, RollingQuantiles]:
+        trackers = groups.get(key)
+        if trackers is None:
+            trackers = groups[key] = {kind: RollingQuantiles(self.window) for kind in KINDS}
+        return trackers
+
+
+    def record(self, room_id: int, host: str | None, server_to_receive: float, receive_to_dispatch: float) -> None:
+        """
+            :param room_id:             直播间号
+            :param host:                服务器地址
+            :param server_to_receive:   服务器发送到本地接收的延迟(秒)
+            :param receive_to_dispatch: 本地接收到分发的延迟(秒)
+        """
+        room = self.group(self.rooms, room_id)
+        room[SERVER_TO_RECEIVE].add(server_to_receive)
+        room[RECEIVE_TO_DISPATCH].add(receive_to_dispatch)
+        if host is not None:
+            trackers = self.group(self.hosts, host)
+            trackers[SERVER_TO_RECEIVE].add(server_to_receive)
+            trackers[RECEIVE_TO_DISPATCH].add(receive_to_dispatch)
+
+
+    def remove_room(self, room_id: int) -> None:
+        self.rooms.pop(room_id, None)
+
+
+    @staticmethod
+    def summarize(groups: dict) -> dict:
+        return {
+            key: {kind: dict(tracker.quantiles(), count=len(tracker)) for kind, tracker in trackers.items()}
+            for key, trackers in list(groups.items())
+        }
+
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+            :return:    {'rooms': {直播间号: {类型: {'p50', 'p95', 'p99', 'count'}}}, 'hosts': {服务器: ...}}
+        """
+        return {
+            'rooms': self.summarize(self.rooms),
+            'hosts': self.summarize(self.hosts),
+        }
@@ -1,19 +1,30 @@
-from typing import Any
+from typing import Any, Awaitable, Callable
 
 from PIL.ImageChops import offset
 
 from bili.session import Session
-from bili import encrypter
-from bili import constants
+from bili import aioclient
+from bili import client
+from bili import codec
+from bili import archive
+from bili import backoff
+from bili import batch
+from bili import buffer
 from bili import decompress
+from bili import dispatch
+from bili import events
+from bili import frame
 from bili import interaction
+from bili import latency
+from bili import metrics
+from bili import signer
 from bili.session import User
-import requests
 from abc import ABC, abstractmethod
+from collections import deque
 import websockets
 import asyncio
-import json
 import struct
+import time
 
 
 class UploadPacket(ABC):
@@ -27,8 +38,7 @@ class UploadPacket(ABC):
         pass
 
     def encode(self, data, sequence: int) -> bytes:
-        json_str = json.dumps(data, separators=(',', ':'))
-        json_bytes = json_str.encode('utf-8')
+        json_bytes = codec.dumps(data)
         header = struct.pack('>IHHII',
                              16 + len(json_bytes),
                              16, self.protocol,
@@ -87,17 +97,16 @@ class DownloadPacket:
 
 
     def decode(self) -> Any | None:
-        self.total_len, self.header_len, self.protocol, self.packet_type, self.sequence = struct.unpack('>IHHII', self.data[:16])
-        json_bytes = self.data[16:self.total_len]
+        self.total_len, self.header_len, self.protocol, self.packet_type, self.sequence = frame.read_header(self.data)
+        body = memoryview(self.data)[self.header_len:self.total_len]
         match self.protocol:
             case 0:
-                self.json = json.loads(json_bytes)
+                self.json = codec.loads(body)
             case 1:
-                self.json = json.loads(json_bytes)
-            case 2:
-                self.json = json.loads(decompress.decompress(json_bytes, 'zlib'))
-            case 3:
-                self.json = json.loads(decompress.decompress(json_bytes, 'brotli'))
+                self.json = codec.loads(body)
+            case 2 | 3:
+                # 压缩的批量帧需要先通过 frame.iter_frames 展开, 本身不是 JSON
+                self.json = None
         return self.json
 
 
@@ -122,14 +131,25 @@ class HeartbeatResponsePacket(DownloadPacket):
     def get_popularity(self) -> int | None:
         (self.total_len, self.header_len, self.protocol,
          self.packet_type, self.sequence, self.popularity) = (
-            struct.unpack('>IHHIII',self.data[:20]))
+            struct.unpack_from('>IHHIII', self.data))
         return self.popularity
 
 
+def server_send_time(danmaku_info) -> float:
+    """
+        :param danmaku_info:    弹幕的 info[0]
+        :return:                服务器发送时间(秒)，第 5 项为毫秒时间戳，没有时返回 0
+    """
+    if len(danmaku_info) > 4 and danmaku_info[4]:
+        return danmaku_info[4] / 1000
+    return 0.0
+
+
 def get_danmaku(json_data) -> interaction.Danmaku | None:
     if json_data is None:
         return None
-    if json_data.get('cmd') != 'DANMU_MSG':
+    # 旧版本的指令形如 DANMU_MSG:4:0:2:2:2:0
+    if dispatch.normalize_cmd(json_data.get('cmd')) != 'DANMU_MSG':
         return None
     info = json_data.get('info', ())
     if len(info) < 3:
@@ -138,37 +158,32 @@ def get_danmaku(json_data) -> interaction.Danmaku | None:
     if len(info) > 15:
         send_timestamp = info[9]
         rich_data = info[0][15]
-        extra_json = json.loads(rich_data['extra'])
+        font_size, color, emots, send_from_me = codec.decode_extra(rich_data['extra'])
         user_json = rich_data['user']
         user_base_json = user_json['base']
-        text_info = interaction.TextInfo(
-            font_size=extra_json.get('font_size', 25),
-            color=extra_json.get('color', 16777215)
-        )
-        emots: dict = extra_json.get('emots', {})
+        text_info = interaction.text_info(font_size, color)
         emojis = []
-        if emots is not None:
-            for k, v in emots.items():
-                emoji = interaction.EmojiInfo(
-                    descript=v['descript'],
-                    emoji=v['emoji'],
-                    size=(v.get('width', 20), v.get('height', 20)),
-                    url=v['url']
-                )
-                emojis.append(emoji)
-        sender = interaction.SenderData(
+        for descript, emoji, width, height, url in emots:
+            emojis.append(interaction.EmojiInfo(
+                descript=descript,
+                emoji=emoji,
+                size=(width, height),
+                url=url
+            ))
+        sender = interaction.sender_cache.get(
             mid=user_json.get('uid', 0),
             name=user_base_json['name'],
             name_color=user_base_json['name_color'],
             avatar_url=user_base_json['face'],
-            is_me=extra_json.get('send_from_me', False)
+            is_me=send_from_me
         )
         return interaction.Danmaku(
             content=content,
             time=send_timestamp,
             text_info=text_info,
-            emoji_infos=emojis,
-            sender_data=sender
+            emoji_infos=tuple(emojis),
+            sender_data=sender,
+            server_time=server_send_time(info[0])
         )
     else:
         danmaku_info = info[0]
@@ -180,16 +195,13 @@ def get_danmaku(json_data) -> interaction.Danmaku | None:
             send_timestamp = danmaku_info[4]
         danmaku_font_size = danmaku_info[2]
         danmaku_color = danmaku_info[3]
-        text_info = interaction.TextInfo(
-            font_size=danmaku_font_size,
-            color=danmaku_color
-        )
+        text_info = interaction.text_info(danmaku_font_size, danmaku_color)
 
         sender_mid = sender_info[0]
         sender_name = sender_info[1]
         sender_name_color = 0xffffff
         sender_avatar_url = ''
-        sender = interaction.SenderData(
+        sender = interaction.sender_cache.get(
             mid=sender_mid,
             name=sender_name,
             name_color=sender_name_color,
@@ -200,8 +212,9 @@ def get_danmaku(json_data) -> interaction.Danmaku | None:
             content=content,
             time=send_timestamp,
             text_info=text_info,
-            emoji_infos=[],
-            sender_data=sender
+            emoji_infos=(),
+            sender_data=sender,
+            server_time=server_send_time(danmaku_info)
         )
 
 
@@ -226,7 +239,16 @@ class MQHost:
         return f'https://{self.host}:{self.port}/sub'
 
 
+    async def send_verify(self, socket, live_house_id: int, mid: int, token: str) -> None:
+        await VerifyPacket(live_house_id, mid, token).send(socket)
+
+
+    async def send_heartbeat(self, socket) -> None:
+        await HeartbeatUploadPacket(0).send(socket)
+
+
     async def verify(self, socket, live_house_id: int, mid: int, token: str) -> bool:
+        # 会直接读取 socket，只能在没有其他读取者(如 LiveEventLoop 的接收循环)时使用
         try:
             packet = VerifyPacket(live_house_id, mid, token)
             await packet.send(socket)
@@ -238,6 +260,7 @@ class MQHost:
 
 
     async def heartbeat(self, socket) -> int:
+        # 会直接读取 socket，只能在没有其他读取者(如 LiveEventLoop 的接收循环)时使用
         try:
             packet = HeartbeatUploadPacket(0)
             await packet.send(socket)
@@ -265,18 +288,46 @@ class LiveHouse:
         self.host_list = host_list
 
 
-def get_live_house(live_house_id: int, session: Session, wbi: tuple[str, str]) -> LiveHouse | int:
-    img_key, sub_key = wbi[0], wbi[1]
-    signed_params = encrypter.enc_wbi(
-       params  = {'id': live_house_id},
-       img_key = img_key,
-       sub_key = sub_key
-    )
-
-    response = requests.get("https://api.live.bilibili.com/xlive/web-room/v1/index/getDanmuInfo",
-                            headers=constants.headers, cookies=session.cookies, params=signed_params)
-
-    json_obj = response.json()
+GET_DANMU_INFO_URL = 'https://api.live.bilibili.com/xlive/web-room/v1/index/getDanmuInfo'
+
+
+def get_live_house(live_house_id: int, session: Session, wbi: signer.WbiSigner | tuple[str, str]) -> LiveHouse | int:
+    wbi_signer = signer.as_signer(wbi)
+    wbi_signer.ensure()
+    version = wbi_signer.version
+    # 会话的 Cookies 已经设置在共享的客户端上
+    response = client.get_client().get(GET_DANMU_INFO_URL, params=wbi_signer.sign({'id': live_house_id}))
+    result = parse_live_house(live_house_id, response.json())
+    if result in signer.SIGN_REJECTED_CODES:
+        # 密钥可能已经轮换，刷新后重试一次
+        wbi_signer.refresh(version)
+        response = client.get_client().get(GET_DANMU_INFO_URL, params=wbi_signer.sign({'id': live_house_id}))
+        result = parse_live_house(live_house_id, response.json())
+    return result
+
+
+async def get_live_house_async(live_house_id: int, session: Session,
+                               wbi: signer.WbiSigner | tuple[str, str]) -> LiveHouse | int:
+    """
+        get_live_house 的异步版本，不会阻塞事件循环中的其他直播间
+    """
+    wbi_signer = signer.as_signer(wbi)
+    await wbi_signer.ensure_async()
+    version = wbi_signer.version
+    http = aioclient.get_client()
+    response = await http.get(GET_DANMU_INFO_URL, params=wbi_signer.sign({'id': live_house_id}))
+    result = parse_live_house(live_house_id, response.json())
+    if result in signer.SIGN_REJECTED_CODES:
+        await wbi_signer.refresh_async(version)
+        response = await http.get(GET_DANMU_INFO_URL, params=wbi_signer.sign({'id': live_house_id}))
+        result = parse_live_house(live_house_id, response.json())
+    return result
+
+
+def parse_live_house(live_house_id: int, json_obj: dict) -> LiveHouse | int:
+    """
+        :return:    getDanmuInfo 返回错误时为错误码
+    """
     if json_obj['code'] != 0:
         return json_obj['code']
 
@@ -303,86 +354,575 @@ def get_live_house(live_house_id: int, session: Session, wbi: tuple[str, str]) -
     )
 
 
+def frames_to_packets(live_house_id: int, frames) -> list[DownloadPacket]:
+    packets = []
+    for view in frames:
+        if frame.read_header(view)[3] != frame.OP_MESSAGE:
+            continue
+        packets.append(DownloadPacket(live_house_id, view))
+    return packets
+
+
 def decode_packets(live_house_id: int, packet_bytes: bytes) -> list[DownloadPacket]:
-    total_len, header_len, protocol, packet_type, sequence = struct.unpack('>IHHII', packet_bytes[0 : 16])
-    match protocol:
-        case 0:
-            return [DownloadPacket(live_house_id, packet_bytes)]
-        case 1:
-            return []
-        case 2:
-            return [DownloadPacket(live_house_id, packet_bytes)]
-        case 3:
-            packet_bytes = decompress.decompress(packet_bytes[16:], 'brotli')
-            packets = []
-            offset = 0
-            while offset < len(packet_bytes):
-                lens, h_len, proto, p_type, seq = struct.unpack('>IHHII', packet_bytes[offset:offset + 16])
-                packet_data = packet_bytes[offset:offset + lens]
-                packets.append(DownloadPacket(live_house_id, packet_data))
-                offset += lens
-            return packets
-    return []
+    return frames_to_packets(live_house_id, frame.iter_frames(packet_bytes))
 
 
 class LiveEventLoop:
 
 
-    def __init__(self, live: LiveHouse, host: MQHost, user: User, heartbeat_interval: float = 30.0):
+    def __init__(self, live: LiveHouse, host: MQHost, user: User, heartbeat_interval: float = 30.0,
+                 decompress_stage: decompress.DecompressStage | None = None,
+                 buffer_capacity: int = 10000, drop_policy: str = buffer.DROP_OLDEST,
+                 verify_timeout: float = 10.0, collect_batch: bool = False,
+                 frame_archive: archive.FrameArchive | None = None,
+                 pipeline_metrics: metrics.PipelineMetrics | None = None,
+                 latency_monitor: latency.LatencyMonitor | None = None,
+                 live_house_provider: Callable[[], Awaitable['LiveHouse | int']] | None = None,
+                 owns_decompress_stage: bool = False):
+        """
+            :param owns_decompress_stage:   decompress_stage 是否只由该循环使用，为 True 时 stop() 会关闭解压池，
+                                            多个循环共享的解压池(如 LiveRoomManager 中)由创建者关闭
+        """
         self.live = live
         self.user = user
         self.host = host
         self.heartbeat_interval = heartbeat_interval
+        self.verify_timeout = verify_timeout
         self.popularity = -1
+        self.heartbeat_sent_time = 0.0
+        self.heartbeat_rtt = -1.0
+        self.heartbeat_rtts: deque[float] = deque(maxlen=64)
+        self.verify_waiter: asyncio.Future | None = None
+        self.verify_rejected = False
+        self.live_house_provider = live_house_provider
+        self.stopped = False
+        self.reader_task: asyncio.Task | None = None
+        self.connections = 0
+        self.reconnects = 0
+        self.token_refreshes = 0
+        self.disconnected_time = 0.0
+        self.last_recover_time = -1.0
+        self.recover_times: deque[float] = deque(maxlen=64)
+        self.last_error: str | None = None
         self.ended = False
         self.running = False
-        self.received_danmakus = []
+        self.received_danmakus = buffer.EventBuffer(buffer_capacity, drop_policy)
+        self.archive = frame_archive
+        self.danmaku_batch = batch.DanmakuBatch(live.room_id, buffer_capacity, drop_policy) if collect_batch else None
+        # block 策略下 pop_batch 取走批次后唤醒接收循环
+        self.batch_popped = asyncio.Event()
+        self.message_count = 0
+        # 解析出的弹幕数量，不受缓冲区丢弃策略的影响
+        self.danmaku_count = 0
+        self.last_message_time = 0.0
+        self.connected = asyncio.Event()
+        self.parser = frame.FrameParser()
+        self.decompress_stage = decompress_stage
+        self.owns_decompress_stage = owns_decompress_stage
+        self.dispatcher = dispatch.CommandDispatcher()
+        self.dispatcher.register(events.DANMAKU, self.on_danmaku)
+        self.hub = events.EventHub()
+        self.raw_handlers: dict[str | None, Any] = {}
+        self.streams: list[events.EventStream] = []
+        self.latency = latency_monitor
+        self.receive_time = 0.0
+        self.pipeline_metrics = pipeline_metrics
+        self.metrics: metrics.RoomMetrics | None = None
+        if pipeline_metrics is not None:
+            self.metrics = pipeline_metrics.attach(live.room_id, self)
+            self.dispatcher.decode_timer = self.metrics.observe_json
 
 
     async def start(self):
         self.__set_state__(True, False)
+        self.verify_rejected = False
+        reader = None
+        heartbeat = None
         try:
             async with websockets.connect(self.host.get_ws_url()) as ws:
-                verified = await self.host.verify(ws, self.live.room_id, self.user.mid, self.live.token)
-                if not verified:
-                    self.__set_state__(False, True)
+                self.parser.reset()
+                self.verify_waiter = asyncio.get_running_loop().create_future()
+                # 只有接收循环读取 socket，握手和心跳的回复由它按照 packet_type 分发
+                if self.decompress_stage is not None:
+                    reader = asyncio.create_task(self.receive_ordered(ws))
+                else:
+                    reader = asyncio.create_task(self.receive(ws))
+                await self.host.send_verify(ws, self.live.room_id, self.user.mid, self.live.token)
+                await asyncio.wait((reader, self.verify_waiter), timeout=self.verify_timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not self.verify_waiter.done():
+                    if reader.done():
+                        # 握手完成前连接就断开了，取出接收循环的异常交给 run() 处理
+                        reader.result()
                     return
-                asyncio.create_task(self.heartbeat_loop(ws))
-                while True:
-                    response = await ws.recv()
-                    packets = decode_packets(self.live.room_id, response)
-                    for packet in packets:
-                        try:
-                            json_data = packet.decode()
-                            danmaku = get_danmaku(json_data)
-                            if danmaku is not None:
-                                self.received_danmakus.append(danmaku)
-                                print(f'{danmaku.get_time()} - {danmaku.sender_data.name}: {danmaku.content} ')
-                        except Exception as e:
-                            continue
+                if not self.verify_waiter.result():
+                    self.verify_rejected = True
+                    return
+                self.connected.set()
+                self.connections += 1
+                if self.disconnected_time:
+                    self.last_recover_time = time.monotonic() - self.disconnected_time
+                    self.recover_times.append(self.last_recover_time)
+                    self.disconnected_time = 0.0
+                heartbeat = asyncio.create_task(self.heartbeat_loop(ws))
+                self.reader_task = reader
+                try:
+                    await reader
+                except asyncio.CancelledError:
+                    # stop() 取消了接收循环
+                    if not self.stopped:
+                        raise
         finally:
+            for task in (reader, heartbeat):
+                if task is not None and not task.done():
+                    task.cancel()
+            self.verify_waiter = None
+            self.reader_task = None
+            if self.archive is not None:
+                self.archive.flush()
+            if self.connected.is_set():
+                self.disconnected_time = time.monotonic()
+            self.connected.clear()
             self.__set_state__(False, True)
 
 
-    def pop_danmakus(self) -> list[interaction.Danmaku]:
-        danmakus = self.received_danmakus.copy()
-        self.received_danmakus.clear()
-        return danmakus
+    async def run(self, max_attempts: int | None = None,
+                  reconnect_backoff: backoff.Backoff | None = None) -> None:
+        """
+            带自动重连的运行，直到 stop() 被调用
+            连接断开或失败时依次尝试 host_list 中的下一个服务器，重试间隔为带抖动的指数退避
+            握手被拒绝时通过 live_house_provider 重新获取 token 和服务器列表
+            订阅者和事件迭代器在重连过程中保持不变
+            :param max_attempts:        连续失败的最大次数，None 表示不限制
+            :param reconnect_backoff:   重连的退避策略
+        """
+        self.stopped = False
+        reconnect_backoff = reconnect_backoff or backoff.Backoff()
+        failures = 0
+        while not self.stopped:
+            connections = self.connections
+            self.last_error = None
+            try:
+                await self.start()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = repr(e)
+            if self.stopped:
+                break
+            if self.verify_rejected:
+                self.last_error = 'verify rejected'
+            if self.connections != connections:
+                # 刚刚从正常的连接断开，从头开始退避
+                failures = 0
+                reconnect_backoff.reset()
+            else:
+                failures += 1
+                if max_attempts is not None and failures >= max_attempts:
+                    break
+            self.reconnects += 1
+            if not (self.verify_rejected and await self.refresh_live_house()):
+                self.next_host()
+            await asyncio.sleep(reconnect_backoff.next())
+        self.__set_state__(False, True)
+
+
+    def next_host(self) -> None:
+        hosts = self.live.host_list
+        if not hosts:
+            return
+        try:
+            index = hosts.index(self.host) + 1
+        except ValueError:
+            index = 0
+        self.host = hosts[index % len(hosts)]
+
+
+    async def refresh_live_house(self) -> bool:
+        """
+            重新获取 getDanmuInfo 的 token 和服务器列表
+            :return:    是否获取成功
+        """
+        if self.live_house_provider is None:
+            return False
+        try:
+            live_house = await self.live_house_provider()
+        except Exception as e:
+            self.last_error = repr(e)
+            return False
+        if isinstance(live_house, int) or not live_house.host_list:
+            return False
+        self.live = live_house
+        self.host = live_house.host_list[0]
+        self.token_refreshes += 1
+        return True
+
+
+    async def receive(self, ws):
+        if self.metrics is not None:
+            return await self.receive_instrumented(ws)
+        while True:
+            if self.should_wait():
+                await self.wait_for_space()
+            response = await ws.recv()
+            self.receive_time = time.time()
+            if self.archive is not None:
+                self.archive.write(response)
+            try:
+                packets = self.decode_message(response)
+            except Exception as e:
+                self.parser.reset()
+                continue
+            self.handle_packets(packets)
+
+
+    async def receive_instrumented(self, ws):
+        """
+            与 receive 相同，但记录等待消息和拆帧解压的耗时
+            帧是惰性展开的，因此解压在 route_frames 中完成，计时包含在 decompress 阶段
+        """
+        room_metrics = self.metrics
+        while True:
+            if self.should_wait():
+                await self.wait_for_space()
+            start = time.perf_counter()
+            response = await ws.recv()
+            received = time.perf_counter()
+            self.receive_time = time.time()
+            room_metrics.observe_stage('recv', received - start)
+            if self.archive is not None:
+                self.archive.write(response)
+            try:
+                packets = self.decode_message(response)
+            except Exception as e:
+                room_metrics.count_error()
+                self.parser.reset()
+                continue
+            room_metrics.observe_stage('decompress', time.perf_counter() - received)
+            self.handle_packets(packets)
+
+
+    async def receive_ordered(self, ws):
+        """
+            接收循环的流水线版本：较大的压缩消息在解压池中解压，接收不会被阻塞，
+            解压结果按照消息到达的顺序依次分发
+        """
+        stage = self.decompress_stage
+        pending = asyncio.Queue(maxsize=max(stage.pool_size, 1) * 4)
+        consumer = asyncio.create_task(self.consume_ordered(pending))
+        try:
+            while True:
+                if self.should_wait():
+                    await self.wait_for_space()
+                if self.metrics is not None:
+                    start = time.perf_counter()
+                    response = await ws.recv()
+                    self.metrics.observe_stage('recv', time.perf_counter() - start)
+                else:
+                    response = await ws.recv()
+                received = time.time()
+                if self.archive is not None:
+                    self.archive.write(response)
+                try:
+                    if stage.should_offload(len(response)):
+                        item = asyncio.ensure_future(self.parser.feed_async(response, stage))
+                    elif self.metrics is not None:
+                        start = time.perf_counter()
+                        item = self.decode_message(response)
+                        self.metrics.observe_stage('decompress', time.perf_counter() - start)
+                    else:
+                        item = self.decode_message(response)
+                except Exception as e:
+                    if self.metrics is not None:
+                        self.metrics.count_error()
+                    self.parser.reset()
+                    continue
+                await pending.put((received, item))
+        except asyncio.CancelledError:
+            consumer.cancel()
+            raise
+        finally:
+            # 连接断开时让消费者分发完已经收到的消息，被取消时直接取消消费者
+            if not consumer.done():
+                try:
+                    pending.put_nowait(None)
+                except asyncio.QueueFull:
+                    consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+            while not pending.empty():
+                entry = pending.get_nowait()
+                if entry is not None and not isinstance(entry[1], list):
+                    entry[1].cancel()
+
+
+    async def consume_ordered(self, pending: asyncio.Queue):
+        while True:
+            entry = await pending.get()
+            if entry is None:
+                return
+            received, item = entry
+            if not isinstance(item, list):
+                # 在解压池中展开的消息，计时从开始等待结果到拆帧完成
+                start = time.perf_counter()
+                try:
+                    item = self.route_frames(await item)
+                except Exception as e:
+                    if self.metrics is not None:
+                        self.metrics.count_error()
+                    continue
+                if self.metrics is not None:
+                    self.metrics.observe_stage('decompress', time.perf_counter() - start)
+            self.receive_time = received
+            self.handle_packets(item)
+
+
+    def handle_packets(self, packets: list[DownloadPacket]) -> None:
+        self.message_count += len(packets)
+        if self.metrics is not None:
+            self.metrics.count_messages(len(packets))
+        self.last_message_time = time.monotonic()
+        for packet in packets:
+            try:
+                self.dispatcher.dispatch(packet)
+            except Exception as e:
+                continue
+
+
+    def on_danmaku(self, json_data) -> None:
+        if self.metrics is not None:
+            return self.on_danmaku_instrumented(json_data)
+        danmaku = get_danmaku(json_data)
+        if danmaku is not None:
+            self.danmaku_count += 1
+            self.stamp_danmaku(danmaku)
+            self.received_danmakus.append(danmaku)
+            if self.danmaku_batch is not None:
+                self.danmaku_batch.append(danmaku)
+            if self.hub.wants(events.DANMAKU):
+                self.hub.publish(events.LiveEvent(self.live.room_id, events.DANMAKU, danmaku,
+                                                  danmaku.receive_time, danmaku.dispatch_time))
+
+
+    def on_danmaku_instrumented(self, json_data) -> None:
+        room_metrics = self.metrics
+        start = time.perf_counter()
+        danmaku = get_danmaku(json_data)
+        extracted = time.perf_counter()
+        room_metrics.observe_stage('extract', extracted - start)
+        if danmaku is None:
+            return
+        room_metrics.count_danmaku()
+        self.danmaku_count += 1
+        self.stamp_danmaku(danmaku)
+        self.received_danmakus.append(danmaku)
+        if self.danmaku_batch is not None:
+            self.danmaku_batch.append(danmaku)
+        if self.hub.wants(events.DANMAKU):
+            self.hub.publish(events.LiveEvent(self.live.room_id, events.DANMAKU, danmaku,
+                                              danmaku.receive_time, danmaku.dispatch_time))
+            room_metrics.observe_stage('consumers', time.perf_counter() - extracted)
+
+
+    def stamp_danmaku(self, danmaku: interaction.Danmaku) -> None:
+        """
+            记录接收和分发时间，并统计端到端延迟
+        """
+        received = self.receive_time
+        dispatched = self.dispatch_clock()
+        danmaku.receive_time = received
+        danmaku.dispatch_time = dispatched
+        if self.latency is not None:
+            self.latency.record(self.live.room_id, self.host.host if self.host is not None else None,
+                                received - danmaku.server_time, dispatched - received)
+
+
+    def dispatch_clock(self) -> float:
+        """
+            :return:    分发时间，只有开启延迟统计时才为每个事件读取时钟，否则使用接收时间
+        """
+        return time.time() if self.latency is not None else self.receive_time
+
+
+    def subscribe(self, callback, *event_types: str) -> None:
+        """
+            订阅事件，回调在接收循环中同步执行，不应进行耗时操作
+            :param callback:        回调函数，传入参数为 events.LiveEvent
+            :param event_types:     订阅的指令名，为空时订阅所有指令
+        """
+        self.hub.subscribe(callback, event_types)
+        for event_type in tuple(event_types) or (None,):
+            self.ensure_raw_handler(event_type)
+
+
+    def unsubscribe(self, callback) -> None:
+        self.hub.unsubscribe(callback)
+        self.prune_raw_handlers()
+
+
+    def prune_raw_handlers(self) -> None:
+        """
+            注销已经没有订阅者的指令，之后这些指令不再被解析
+        """
+        for cmd in list(self.raw_handlers.keys()):
+            if cmd not in self.hub.callbacks:
+                self.dispatcher.unregister(cmd, self.raw_handlers.pop(cmd))
+
+
+    def release_stream(self, stream: events.EventStream) -> None:
+        if stream in self.streams:
+            self.streams.remove(stream)
+        self.prune_raw_handlers()
+
+
+    def events(self, *event_types: str, capacity: int = 10000) -> events.EventStream:
+        """
+            获取事件的异步迭代器: async for event in loop.events('DANMU_MSG')
+            迭代器在 stop() 时结束，提前退出迭代时应调用其 close()
+            :param event_types:     订阅的指令名，为空时订阅所有指令(所有消息都会被解析)
+            :param capacity:        迭代器缓存的事件数量，超过时丢弃最旧的事件
+        """
+        stream = events.EventStream(self.hub, event_types, capacity, on_close=self.release_stream)
+        self.streams.append(stream)
+        for event_type in tuple(event_types) or (None,):
+            self.ensure_raw_handler(event_type)
+        return stream
+
+
+    def ensure_raw_handler(self, cmd: str | None) -> None:
+        """
+            :param cmd:     需要发布的指令名，为 None 时发布所有没有其他处理函数的指令
+        """
+        if cmd == events.DANMAKU or cmd in self.raw_handlers:
+            return
+        room_id = self.live.room_id
+
+        def publish(json_data):
+            event_type = cmd if cmd is not None else dispatch.normalize_cmd(json_data.get('cmd'))
+            event = events.LiveEvent(room_id, event_type, json_data, self.receive_time, self.dispatch_clock())
+            if self.metrics is None:
+                self.hub.publish(event)
+                return
+            start = time.perf_counter()
+            self.hub.publish(event)
+            self.metrics.observe_stage('consumers', time.perf_counter() - start)
+
+        self.raw_handlers[cmd] = publish
+        self.dispatcher.register(cmd, publish)
+
+
+    def decode_message(self, message: bytes) -> list[DownloadPacket]:
+        return self.route_frames(self.parser.feed(message))
+
+
+    def route_frames(self, frames) -> list[DownloadPacket]:
+        """
+            按照 packet_type 分发帧: 心跳回复更新人气值，握手回复交给握手流程，普通消息返回给调度器
+        """
+        packets = []
+        for view in frames:
+            packet_type = frame.read_header(view)[3]
+            if packet_type == frame.OP_MESSAGE:
+                packets.append(DownloadPacket(self.live.room_id, view))
+            elif packet_type == frame.OP_HEARTBEAT_REPLY:
+                self.on_heartbeat_reply(view)
+            elif packet_type == frame.OP_VERIFY_REPLY:
+                self.on_verify_reply(view)
+        return packets
+
+
+    def on_heartbeat_reply(self, view) -> None:
+        popularity = HeartbeatResponsePacket(self.live.room_id, view).get_popularity()
+        if popularity is not None:
+            self.popularity = popularity
+        if self.heartbeat_sent_time:
+            self.heartbeat_rtt = time.monotonic() - self.heartbeat_sent_time
+            self.heartbeat_rtts.append(self.heartbeat_rtt)
+            self.heartbeat_sent_time = 0.0
+
+
+    def on_verify_reply(self, view) -> None:
+        waiter = self.verify_waiter
+        if waiter is None or waiter.done():
+            return
+        try:
+            waiter.set_result(VerifyResponsePacket(self.live.room_id, view).is_ok())
+        except Exception as e:
+            waiter.set_result(False)
+
+
+    def should_wait(self) -> bool:
+        """
+            block 策略下弹幕缓冲区或列式批次已满时，接收循环在读取下一条消息前等待
+        """
+        return self.received_danmakus.should_wait() or (
+            self.danmaku_batch is not None and self.danmaku_batch.should_wait())
+
+
+    async def wait_for_space(self) -> None:
+        await self.received_danmakus.wait_for_space()
+        while self.danmaku_batch is not None and self.danmaku_batch.should_wait():
+            self.batch_popped.clear()
+            await self.batch_popped.wait()
+
+
+    def pop_danmakus(self, max_items: int | None = None) -> list[interaction.Danmaku]:
+        return self.received_danmakus.drain(max_items)
+
+
+    def pop_batch(self) -> batch.DanmakuBatch | None:
+        """
+            取出当前的列式弹幕批次并换上新的批次，需要在事件循环所在的线程中调用
+            :return:    未开启 collect_batch 时为 None
+        """
+        current = self.danmaku_batch
+        if current is None:
+            return None
+        self.danmaku_batch = batch.DanmakuBatch(self.live.room_id, current.capacity, current.policy)
+        self.batch_popped.set()
+        return current
 
 
     def stop(self) -> list[interaction.Danmaku]:
+        self.stopped = True
         self.__set_state__(False, True)
+        if self.reader_task is not None and not self.reader_task.done():
+            self.reader_task.cancel()
+        for stream in tuple(self.streams):
+            stream.close()
+        self.streams.clear()
+        if self.pipeline_metrics is not None:
+            self.pipeline_metrics.detach(self.live.room_id, self)
+        if self.latency is not None:
+            self.latency.remove_room(self.live.room_id)
+        if self.owns_decompress_stage and self.decompress_stage is not None:
+            self.decompress_stage.shutdown()
         return self.pop_danmakus()
 
 
     async def heartbeat_loop(self, ws):
         while self.running and not self.ended:
-            popularity = await self.host.heartbeat(ws)
-            if popularity != -1:
-                self.popularity = popularity
+            try:
+                self.heartbeat_sent_time = time.monotonic()
+                await self.host.send_heartbeat(ws)
+            except Exception as e:
+                return
             await asyncio.sleep(self.heartbeat_interval)
 
 
+    def heartbeat_latency(self) -> dict[str, float]:
+        """
+            心跳往返时间(秒)
+            :return:    包含 last / avg / max 的字典，没有数据时为 -1
+        """
+        if not self.heartbeat_rtts:
+            return {'last': -1.0, 'avg': -1.0, 'max': -1.0}
+        return {
+            'last': self.heartbeat_rtt,
+            'avg': sum(self.heartbeat_rtts) / len(self.heartbeat_rtts),
+            'max': max(self.heartbeat_rtts),
+        }
+
+
     def __set_state__(self, running: bool, ended: bool):
         self.running = running
         self.ended = ended
\ No newline at end of file
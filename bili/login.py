@@ -1,6 +1,6 @@
-import time, requests, PIL, qrcode, os
+import time, PIL, qrcode, os
 from bili.session import Session
-from bili import constants
+from bili import client
 
 qr_code_codes = {
     0    : "Login successful",                              # 成功登录
@@ -15,7 +15,7 @@ def gen_qrcode() -> tuple[str, str]:
         :return: 二维码的URL和二维码的key(URL用于生成具体的二维码图片，key用于轮询二维码状态)
     """
     url = "https://passport.bilibili.com/x/passport-login/web/qrcode/generate"
-    response = requests.get(url, headers=constants.headers)
+    response = client.get_client().get(url, anonymous=True)
     data = response.json()
     if data['code'] == 0:
         qr_code_url = data['data']['url']
@@ -41,7 +41,7 @@ def check_qrcode_status(qrcode_key: str) -> dict:
     params = {
         "qrcode_key": qrcode_key
     }
-    response = requests.get(url, headers=constants.headers, params=params)
+    response = client.get_client().get(url, anonymous=True, params=params)
     data = response.json()
     code = data['code']
     msg = data['message']
@@ -0,0 +1,367 @@
+from bili import live
+from bili import aioclient
+from bili import archive
+from bili import batch
+from bili import buffer
+from bili import decompress
+from bili import events
+from bili import interaction
+from bili import latency
+from bili import metrics
+from bili import resolver
+from bili import signer
+from bili.session import Session, User
+import asyncio
+import time
+
+
+class RoomHandle:
+
+    def __init__(self, room_id: int):
+        self.room_id = room_id
+        self.state = 'pending'
+        self.error: str | None = None
+        self.event_loop: live.LiveEventLoop | None = None
+        self.task: asyncio.Task | None = None
+        self.archive: archive.FrameArchive | None = None
+        self.added_time = time.monotonic()
+        self.connected_time = 0.0
+
+
+    def current_state(self) -> str:
+        event_loop = self.event_loop
+        if self.state in ('connecting', 'running') and event_loop is not None:
+            if event_loop.connected.is_set():
+                return 'running'
+            return 'reconnecting' if event_loop.connections else 'connecting'
+        return self.state
+
+
+    def health(self) -> dict:
+        event_loop = self.event_loop
+        messages = event_loop.message_count if event_loop is not None else 0
+        last_message_time = event_loop.last_message_time if event_loop is not None else 0.0
+        return {
+            'state': self.current_state(),
+            'error': self.error if self.error is not None or event_loop is None else event_loop.last_error,
+            'popularity': event_loop.popularity if event_loop is not None else -1,
+            'heartbeat_rtt': event_loop.heartbeat_rtt if event_loop is not None else -1.0,
+            'host': event_loop.host.host if event_loop is not None else None,
+            'reconnects': event_loop.reconnects if event_loop is not None else 0,
+            'last_recover_time': event_loop.last_recover_time if event_loop is not None else -1.0,
+            'messages': messages,
+            'dropped': event_loop.received_danmakus.dropped if event_loop is not None else 0,
+            'last_message_age': time.monotonic() - last_message_time if last_message_time else None,
+            'uptime': time.monotonic() - self.connected_time if self.connected_time else 0.0,
+        }
+
+
+class LiveRoomManager:
+    """
+        在同一个 asyncio 事件循环中管理多个直播间连接
+        所有直播间共享同一个 Session、用户信息和 wbi 密钥，连接过程通过并发数和最小间隔限流
+    """
+
+    def __init__(self, session: Session, user: User, wbi: signer.WbiSigner | tuple[str, str],
+                 max_concurrent_connects: int = 8,
+                 connect_interval: float = 0.2,
+                 connect_timeout: float = 15.0,
+                 heartbeat_interval: float = 30.0,
+                 decompress_stage: decompress.DecompressStage | None = None,
+                 buffer_capacity: int = 10000,
+                 drop_policy: str = buffer.DROP_OLDEST,
+                 collect_batch: bool = False,
+                 archive_directory: str | None = None,
+                 archive_segment_size: int = 64 * 1024 * 1024,
+                 pipeline_metrics: metrics.PipelineMetrics | None = None,
+                 latency_monitor: latency.LatencyMonitor | None = None,
+                 resolve_rate: float = resolver.DEFAULT_RATE,
+                 resolve_burst: int = resolver.DEFAULT_BURST,
+                 live_house_ttl: float = resolver.DEFAULT_TTL):
+        """
+            :param session:                 共享的登录会话
+            :param user:                    当前用户
+            :param wbi:                     共享的 wbi 签名器，也可以是 (img_key, sub_key)
+            :param max_concurrent_connects: 同时处于握手中的直播间数量上限，也是批量获取房间信息的并发数
+            :param connect_interval:        两次发起连接之间的最小间隔(秒)
+            :param connect_timeout:         单个直播间从发起连接到握手完成的超时时间(秒)
+            :param heartbeat_interval:      心跳间隔(秒)
+            :param decompress_stage:        共享的解压阶段
+            :param buffer_capacity:         每个直播间弹幕缓冲区的容量
+            :param drop_policy:             缓冲区满时的策略，参看 buffer.EventBuffer
+            :param collect_batch:           是否同时把弹幕写入列式批次，参看 batch.DanmakuBatch
+            :param archive_directory:       原始帧的归档目录，为 None 时不归档，参看 archive.FrameArchive
+            :param archive_segment_size:    单个归档分段文件的大小上限(字节)
+            :param pipeline_metrics:        接收流程的指标，为 None 时不统计，参看 metrics.PipelineMetrics
+            :param latency_monitor:         端到端延迟统计，为 None 时不统计，参看 latency.LatencyMonitor
+            :param resolve_rate:            每秒最多发起的 getDanmuInfo 请求数
+            :param resolve_burst:           允许的突发 getDanmuInfo 请求数
+            :param live_house_ttl:          getDanmuInfo 结果的缓存时间(秒)，参看 resolver.RoomResolver
+        """
+        self.session = session
+        self.user = user
+        self.wbi = signer.as_signer(wbi)
+        self.resolver = resolver.RoomResolver(session, self.wbi, rate=resolve_rate, burst=resolve_burst,
+                                              concurrency=max_concurrent_connects, ttl=live_house_ttl)
+        self.max_concurrent_connects = max_concurrent_connects
+        self.connect_interval = connect_interval
+        self.connect_timeout = connect_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.decompress_stage = decompress_stage
+        self.buffer_capacity = buffer_capacity
+        self.drop_policy = drop_policy
+        self.collect_batch = collect_batch
+        self.archive_directory = archive_directory
+        self.archive_segment_size = archive_segment_size
+        self.pipeline_metrics = pipeline_metrics
+        self.latency_monitor = latency_monitor
+        self.rooms: dict[int, RoomHandle] = {}
+        self.connect_semaphore = asyncio.Semaphore(max_concurrent_connects)
+        self.pacing_lock = asyncio.Lock()
+        self.last_connect_time = 0.0
+        self.last_sample: tuple[float, int] = (time.monotonic(), 0)
+        self.removed_messages = 0
+        self.subscriptions: list[tuple] = []
+
+
+    def subscribe(self, callback, *event_types: str) -> None:
+        """
+            为所有直播间(包括之后添加的)订阅事件，参看 LiveEventLoop.subscribe
+        """
+        self.subscriptions.append((callback, event_types))
+        for handle in self.rooms.values():
+            if handle.event_loop is not None:
+                handle.event_loop.subscribe(callback, *event_types)
+
+
+    def unsubscribe(self, callback) -> None:
+        self.subscriptions = [item for item in self.subscriptions if item[0] is not callback]
+        for handle in self.rooms.values():
+            if handle.event_loop is not None:
+                handle.event_loop.unsubscribe(callback)
+
+
+    def events(self, *event_types: str, capacity: int = 10000) -> events.EventStream:
+        """
+            所有直播间事件合并后的异步迭代器
+        """
+        hub = events.EventHub()
+        # 绑定方法每次访问都是新的对象，保存同一个对象才能在关闭时取消订阅
+        publish = hub.publish
+        stream = events.EventStream(hub, (), capacity, on_close=lambda _: self.unsubscribe(publish))
+        self.subscribe(publish, *event_types)
+        return stream
+
+
+    def add_room(self, room_id: int) -> bool:
+        """
+            添加直播间，连接在后台进行，必须在事件循环中调用
+            :param room_id:     直播间号
+            :return:            直播间已存在时返回 False
+        """
+        if room_id in self.rooms:
+            return False
+        handle = RoomHandle(room_id)
+        handle.task = asyncio.create_task(self.run_room(handle))
+        self.rooms[room_id] = handle
+        return True
+
+
+    async def remove_room(self, room_id: int) -> bool:
+        """
+            断开并移除直播间
+            :param room_id:     直播间号
+            :return:            直播间不存在时返回 False
+        """
+        handle = self.rooms.pop(room_id, None)
+        if handle is None:
+            return False
+        if handle.event_loop is not None:
+            self.removed_messages += handle.event_loop.message_count
+            handle.event_loop.stop()
+        if handle.task is not None and not handle.task.done():
+            handle.task.cancel()
+            try:
+                await handle.task
+            except asyncio.CancelledError:
+                pass
+        if handle.archive is not None:
+            # 等待后台线程写完该直播间的记录
+            await asyncio.to_thread(handle.archive.close)
+        handle.state = 'removed'
+        return True
+
+
+    async def pace(self) -> None:
+        async with self.pacing_lock:
+            delay = self.last_connect_time + self.connect_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.last_connect_time = time.monotonic()
+
+
+    async def run_room(self, handle: RoomHandle) -> None:
+        receiving = None
+        try:
+            # getDanmuInfo 由 resolver 限速，不占用握手的并发数
+            handle.state = 'resolving'
+            live_house = await self.resolve(handle.room_id)
+            if isinstance(live_house, int):
+                handle.state = 'failed'
+                handle.error = f'getDanmuInfo returned code {live_house}'
+                return
+            if not live_house.host_list:
+                handle.state = 'failed'
+                handle.error = 'empty host list'
+                return
+            async with self.connect_semaphore:
+                await self.pace()
+                handle.state = 'connecting'
+                if self.archive_directory is not None and handle.archive is None:
+                    handle.archive = archive.FrameArchive(self.archive_directory, handle.room_id,
+                                                          self.archive_segment_size)
+                event_loop = live.LiveEventLoop(live_house, live_house.host_list[0], self.user,
+                                                self.heartbeat_interval, self.decompress_stage,
+                                                self.buffer_capacity, self.drop_policy,
+                                                collect_batch=self.collect_batch,
+                                                frame_archive=handle.archive,
+                                                pipeline_metrics=self.pipeline_metrics,
+                                                latency_monitor=self.latency_monitor,
+                                                live_house_provider=lambda: self.refresh(handle.room_id))
+                for callback, event_types in self.subscriptions:
+                    event_loop.subscribe(callback, *event_types)
+                handle.event_loop = event_loop
+                receiving = asyncio.create_task(event_loop.run())
+                connected = asyncio.create_task(event_loop.connected.wait())
+                await asyncio.wait((receiving, connected), timeout=self.connect_timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                connected.cancel()
+            handle.state = 'running'
+            if event_loop.connected.is_set():
+                handle.connected_time = time.monotonic()
+            await receiving
+            handle.state = 'ended'
+        except asyncio.CancelledError:
+            if receiving is not None:
+                receiving.cancel()
+            raise
+        except Exception as e:
+            handle.state = 'failed'
+            handle.error = repr(e)
+
+
+    async def resolve(self, room_id: int) -> live.LiveHouse | int:
+        return await self.resolver.resolve(room_id)
+
+
+    async def resolve_many(self, room_ids) -> dict[int, live.LiveHouse | int | Exception]:
+        """
+            预先批量获取直播间信息，之后 add_room 会直接使用缓存，参看 RoomResolver.resolve_many
+        """
+        return await self.resolver.resolve_many(room_ids)
+
+
+    def update_session(self, session: Session) -> None:
+        """
+            替换刷新后的会话，缓存的直播间信息是用旧的 Cookies 获取的，之后的重连需要重新获取
+            已经建立的连接不受影响
+        """
+        self.session = session
+        self.resolver.session = session
+        self.resolver.invalidate()
+
+
+    async def refresh(self, room_id: int) -> live.LiveHouse | int:
+        # 握手被拒绝，缓存的 token 已经失效
+        return await self.resolver.resolve(room_id, force=True)
+
+
+    def health(self) -> dict[int, dict]:
+        """
+            :return:    每个直播间的状态，键为直播间号
+        """
+        return {room_id: handle.health() for room_id, handle in self.rooms.items()}
+
+
+    def pop_danmakus(self) -> dict[int, list[interaction.Danmaku]]:
+        """
+            取出每个直播间缓冲区中的弹幕，block 策略下接收循环依赖这里腾出空间
+            :return:    键为直播间号，没有弹幕的直播间不包含在内
+        """
+        danmakus = {}
+        for room_id, handle in self.rooms.items():
+            if handle.event_loop is None:
+                continue
+            items = handle.event_loop.pop_danmakus()
+            if items:
+                danmakus[room_id] = items
+        return danmakus
+
+
+    def pop_batches(self) -> dict[int, batch.DanmakuBatch]:
+        """
+            取出每个直播间的列式弹幕批次，需要开启 collect_batch
+            :return:    键为直播间号，没有弹幕的直播间不包含在内
+        """
+        batches = {}
+        for room_id, handle in self.rooms.items():
+            if handle.event_loop is None:
+                continue
+            current = handle.event_loop.pop_batch()
+            if current is not None and len(current):
+                batches[room_id] = current
+        return batches
+
+
+    def latency(self) -> dict[str, dict]:
+        """
+            :return:    按直播间和服务器分组的延迟分位数，未开启延迟统计时为空字典，参看 LatencyMonitor.snapshot
+        """
+        if self.latency_monitor is None:
+            return {}
+        return self.latency_monitor.snapshot()
+
+
+    def total_messages(self) -> int:
+        return self.removed_messages + sum(
+            handle.event_loop.message_count
+            for handle in self.rooms.values()
+            if handle.event_loop is not None
+        )
+
+
+    def throughput(self) -> float:
+        """
+            计算自上次调用以来所有直播间的总消息吞吐量
+            :return:    每秒消息数
+        """
+        now = time.monotonic()
+        total = self.total_messages()
+        last_time, last_total = self.last_sample
+        self.last_sample = (now, total)
+        if now <= last_time:
+            return 0.0
+        return (total - last_total) / (now - last_time)
+
+
+    def stats(self) -> dict:
+        states: dict[str, int] = {}
+        for handle in self.rooms.values():
+            state = handle.current_state()
+            states[state] = states.get(state, 0) + 1
+        return {
+            'rooms': len(self.rooms),
+            'states': states,
+            'messages': self.total_messages(),
+            'messages_per_second': self.throughput(),
+            'sender_cache': interaction.sender_cache.stats(),
+            'resolver': self.resolver.stats(),
+        }
+
+
+    async def close(self) -> None:
+        for room_id in list(self.rooms.keys()):
+            await self.remove_room(room_id)
+        if self.decompress_stage is not None:
+            self.decompress_stage.shutdown()
+        await aioclient.get_client().close()
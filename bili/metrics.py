@@ -0,0 +1,331 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+import bisect
+import threading
+
+from bili import latency
+
+
+"""
+    可选的运行指标，以 Prometheus 文本格式通过本地 HTTP 接口提供
+    没有传入 PipelineMetrics 时 LiveEventLoop 只多一次 None 判断，不会计时也不会计数
+    人气值、重连次数、队列长度等状态量在抓取时才从 LiveEventLoop 读取，不占用接收循环的时间
+"""
+
+
+STAGES = ('recv', 'decompress', 'json', 'extract', 'consumers')
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values: dict[tuple, float] = {}
+
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+    def set_total(self, value: float, labels: tuple = ()) -> None:
+        # 用于由其他对象维护的累计值，在抓取时同步
+        self.values[labels] = value
+
+
+    def remove(self, labels: tuple) -> None:
+        self.values.pop(labels, None)
+
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in list(self.values.items()):
+            yield f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+
+
+class Gauge(Counter):
+
+    kind = 'gauge'
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self.values[labels] = value
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签对应 [各个桶的计数(不累加), 总和, 总数]
+        self.values: dict[tuple, list] = {}
+
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+
+    def remove(self, labels: tuple) -> None:
+        self.values.pop(labels, None)
+
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), list(counts)):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.label_names, labels)} {count}'
+
+
+class Registry:
+    """
+        指标的集合，collectors 在每次抓取时被调用，用于在抓取时更新状态量
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self.collectors: list[Callable[[], None]] = []
+        self.lock = threading.Lock()
+
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, label_names))
+
+
+    def gauge(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, label_names))
+
+
+    def histogram(self, name: str, help_text: str, label_names: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self.collectors.append(collector)
+
+
+    def render(self) -> str:
+        for collector in tuple(self.collectors):
+            try:
+                collector()
+            except Exception as e:
+                continue
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class RoomMetrics:
+    """
+        单个直播间的指标句柄，标签在创建时确定，接收循环中直接使用
+    """
+
+    __slots__ = ('pipeline', 'labels', 'stage_labels')
+
+    def __init__(self, pipeline: 'PipelineMetrics', room_id: int):
+        self.pipeline = pipeline
+        self.labels = (str(room_id),)
+        self.stage_labels = {stage: (str(room_id), stage) for stage in STAGES}
+
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self.pipeline.stage_seconds.observe(seconds, self.stage_labels[stage])
+
+
+    def observe_json(self, seconds: float) -> None:
+        self.pipeline.stage_seconds.observe(seconds, self.stage_labels['json'])
+
+
+    def count_messages(self, amount: int) -> None:
+        self.pipeline.messages.inc(amount, self.labels)
+
+
+    def count_danmaku(self) -> None:
+        self.pipeline.danmakus.inc(1, self.labels)
+
+
+    def count_error(self) -> None:
+        self.pipeline.errors.inc(1, self.labels)
+
+
+class PipelineMetrics:
+    """
+        LiveEventLoop 接收流程的指标
+        各阶段: recv(等待 websocket 消息)、decompress(拆帧和解压)、json(JSON 解析)、
+               extract(从 JSON 中提取弹幕)、consumers(订阅者回调)
+    """
+
+    def __init__(self, registry: Registry | None = None, latency_monitor: latency.LatencyMonitor | None = None):
+        """
+            :param registry:        指标注册表，默认新建
+            :param latency_monitor: 同时导出其中的延迟分位数
+        """
+        self.registry = registry if registry is not None else Registry()
+        self.latency_monitor = latency_monitor
+        registry = self.registry
+        self.stage_seconds = registry.histogram(
+            'bili_live_stage_seconds', 'Time spent in each stage of the receive pipeline', ('room', 'stage'))
+        self.messages = registry.counter(
+            'bili_live_messages_total', 'Op 5 messages received', ('room',))
+        self.danmakus = registry.counter(
+            'bili_live_danmakus_total', 'Danmakus extracted', ('room',))
+        self.errors = registry.counter(
+            'bili_live_decode_errors_total', 'Websocket messages that failed to decode', ('room',))
+        self.popularity = registry.gauge(
+            'bili_live_popularity', 'Popularity reported by the last heartbeat reply', ('room',))
+        self.reconnects = registry.counter(
+            'bili_live_reconnects_total', 'Reconnect attempts of the room', ('room',))
+        self.connected = registry.gauge(
+            'bili_live_connected', 'Whether the room is connected and verified', ('room',))
+        self.queue_depth = registry.gauge(
+            'bili_live_queue_depth', 'Danmakus waiting in the event buffer', ('room',))
+        self.dropped = registry.counter(
+            'bili_live_dropped_total', 'Danmakus dropped by the event buffer', ('room',))
+        self.heartbeat_rtt = registry.gauge(
+            'bili_live_heartbeat_rtt_seconds', 'Round trip time of the last heartbeat', ('room',))
+        self.room_latency = registry.gauge(
+            'bili_live_latency_seconds', 'Rolling latency quantiles of each room', ('room', 'kind', 'quantile'))
+        self.host_latency = registry.gauge(
+            'bili_live_host_latency_seconds', 'Rolling latency quantiles of each server', ('host', 'kind', 'quantile'))
+        self.loops: dict[int, object] = {}
+        registry.add_collector(self.collect)
+
+
+    def attach(self, room_id: int, event_loop) -> RoomMetrics:
+        self.loops[room_id] = event_loop
+        return RoomMetrics(self, room_id)
+
+
+    def detach(self, room_id: int, event_loop) -> None:
+        if self.loops.get(room_id) is not event_loop:
+            return
+        del self.loops[room_id]
+        labels = (str(room_id),)
+        for metric in (self.popularity, self.reconnects, self.connected,
+                       self.queue_depth, self.dropped, self.heartbeat_rtt,
+                       self.messages, self.danmakus, self.errors):
+            metric.remove(labels)
+        # 动态增删直播间时不保留已移除直播间的序列
+        for stage in STAGES:
+            self.stage_seconds.remove((str(room_id), stage))
+
+
+    def collect(self) -> None:
+        for room_id, event_loop in list(self.loops.items()):
+            labels = (str(room_id),)
+            self.popularity.set(event_loop.popularity, labels)
+            self.reconnects.set_total(event_loop.reconnects, labels)
+            self.connected.set(1 if event_loop.connected.is_set() else 0, labels)
+            self.queue_depth.set(len(event_loop.received_danmakus), labels)
+            self.dropped.set_total(event_loop.received_danmakus.dropped, labels)
+            self.heartbeat_rtt.set(event_loop.heartbeat_rtt, labels)
+        if self.latency_monitor is not None:
+            snapshot = self.latency_monitor.snapshot()
+            self.export_latency(self.room_latency, snapshot['rooms'])
+            self.export_latency(self.host_latency, snapshot['hosts'])
+
+
+    @staticmethod
+    def export_latency(gauge: Gauge, groups: dict) -> None:
+        gauge.values.clear()
+        for key, kinds in groups.items():
+            for kind, summary in kinds.items():
+                for quantile in latency.QUANTILES:
+                    value = summary.get(f'p{round(quantile * 100)}')
+                    if value is not None:
+                        gauge.set(value, (str(key), kind, str(quantile)))
+
+
+class MetricsServer:
+    """
+        在后台线程中提供 /metrics 接口
+    """
+
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server: ThreadingHTTPServer | None = None
+        self.thread: threading.Thread | None = None
+
+
+    def start(self) -> None:
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
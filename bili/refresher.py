@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from typing import Callable
+
+from bili import aioclient
+from bili import backoff
+from bili import encrypter
+from bili.session import Session
+
+
+"""
+    后台定时检查并刷新 Cookies
+    刷新在事件循环中异步进行，新的 Cookies 通过 Session.__set_data__ 一次性替换到共享的 HTTP 客户端上，
+    之后的请求(如重连时的 getDanmuInfo)直接使用新的会话，不需要重启
+"""
+
+
+DEFAULT_INTERVAL = 3600.0
+
+
+class CookieRefresher:
+
+    def __init__(self, session: Session, saving_path: str | None = None,
+                 interval: float = DEFAULT_INTERVAL,
+                 on_refresh: Callable[[Session], None] | None = None,
+                 retry_backoff: backoff.Backoff | None = None):
+        """
+            :param session:         需要保持有效的登录会话
+            :param saving_path:     刷新成功后保存会话的路径，为 None 时不保存
+            :param interval:        两次检查之间的间隔(秒)
+            :param on_refresh:      刷新成功后的回调，如把新的会话发送给工作进程
+            :param retry_backoff:   检查或刷新失败后的重试间隔，上限为 interval
+        """
+        self.session = session
+        self.saving_path = saving_path
+        self.interval = interval
+        self.on_refresh = on_refresh
+        self.retry_backoff = retry_backoff or backoff.Backoff(initial=30.0, maximum=interval)
+        self.task: asyncio.Task | None = None
+        self.thread: threading.Thread | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.checks = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_check_time = 0.0
+        self.last_refresh_time = 0.0
+        self.last_error: str | None = None
+
+
+    async def check(self) -> bool:
+        """
+            检查一次 Cookies，需要时刷新
+            :return:    检查后会话是否有效
+        """
+        self.checks += 1
+        self.last_check_time = time.time()
+        if aioclient.available():
+            state = await self.session.cookie_need_to_refresh_async()
+        else:
+            state = await asyncio.to_thread(self.session.cookie_need_to_refresh)
+        if not state['logged_in']:
+            self.last_error = 'not logged in'
+            return False
+        if not state['need_to_refresh']:
+            self.last_error = None
+            return True
+        if aioclient.available():
+            refreshed = await self.session.refresh_cookies_async(state['timestamp'])
+        else:
+            refreshed = await asyncio.to_thread(self.session.refresh_cookies, state['timestamp'])
+        if not refreshed:
+            self.last_error = 'refresh failed'
+            return False
+        self.refreshes += 1
+        self.last_refresh_time = time.time()
+        self.last_error = None
+        if self.saving_path is not None:
+            self.session.save_session(self.saving_path)
+        if self.on_refresh is not None:
+            self.on_refresh(self.session)
+        return True
+
+
+    async def run(self, initial_delay: float = 0.0) -> None:
+        """
+            循环检查直到被取消，失败时按退避间隔重试
+            :param initial_delay:   第一次检查前的等待时间(秒)，启动时已经检查过的话可以设为 interval
+        """
+        # 公钥在第一次需要刷新之前就读取好
+        try:
+            await asyncio.to_thread(encrypter.get_cipher)
+        except Exception as e:
+            self.last_error = repr(e)
+        await asyncio.sleep(initial_delay)
+        while True:
+            try:
+                valid = await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                valid = False
+                self.last_error = repr(e)
+            if valid:
+                self.retry_backoff.reset()
+                delay = self.interval
+            else:
+                self.failures += 1
+                delay = self.retry_backoff.next()
+            await asyncio.sleep(delay)
+
+
+    def start(self, initial_delay: float = 0.0) -> asyncio.Task:
+        """
+            在当前事件循环中启动后台检查，必须在事件循环中调用
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run(initial_delay))
+        return self.task
+
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+
+    def start_thread(self, initial_delay: float = 0.0) -> threading.Thread:
+        """
+            在单独的线程和事件循环中运行，用于没有事件循环的进程(如分片模式的监督进程)
+            该事件循环使用进程内共享的 aioclient 客户端，进程中不应再有其他事件循环同时使用它，
+            stop_thread 时会关闭客户端的连接
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return self.thread
+        ready = threading.Event()
+
+        async def serve():
+            self.loop = asyncio.get_running_loop()
+            task = self.start(initial_delay)
+            ready.set()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            finally:
+                await aioclient.get_client().close()
+
+        self.thread = threading.Thread(target=asyncio.run, args=(serve(),), name='cookie-refresher', daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.thread
+
+
+    def stop_thread(self, timeout: float = 5.0) -> None:
+        """
+            停止 start_thread 启动的线程，可以在任意线程中调用
+        """
+        if self.thread is None:
+            return
+        task, loop = self.task, self.loop
+        if task is not None and loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass
+        self.thread.join(timeout)
+        self.thread = None
+        self.loop = None
+        self.task = None
+
+
+    def stats(self) -> dict:
+        return {
+            'checks': self.checks,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_check_time': self.last_check_time,
+            'last_refresh_time': self.last_refresh_time,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,170 @@
+from typing import Iterable, Iterator
+import asyncio
+import time
+
+from bili import archive
+from bili import buffer
+from bili import events
+from bili import frame
+from bili import live
+
+
+"""
+    离线回放：把录制的原始消息依次送入与 LiveEventLoop 相同的解析流程
+    (拆帧 -> DownloadPacket.decode -> get_danmaku -> 订阅者)，用于在修复解析器后重新处理历史数据，或者稳定复现线上问题
+    speed 为 1 时按录制时的节奏回放，大于 1 时加速，SPEED_UNLIMITED 表示不等待，此时的结果即为解析流程的吞吐量
+"""
+
+
+SPEED_UNLIMITED = 0.0
+
+
+def iter_archive(directory: str, room_id: int,
+                 start: float | None = None, end: float | None = None) -> Iterator[tuple[float, memoryview]]:
+    """
+        读取 archive.FrameArchive 写入的归档
+        :return:    (接收时间, 原始消息)
+    """
+    return archive.ArchiveReader(directory, room_id).iter_range(start, end)
+
+
+def iter_frame_file(path: str) -> Iterator[tuple[None, bytes]]:
+    """
+        读取由完整帧直接拼接而成的文件，每个顶层帧作为一条消息，没有时间信息
+        :return:    (None, 原始消息)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    view = memoryview(data)
+    end = frame.complete_length(view)
+    offset = 0
+    while offset < end:
+        total_len = frame.read_header(view, offset)[0]
+        yield None, data[offset:offset + total_len]
+        offset += total_len
+
+
+class ReplayStats:
+
+    def __init__(self, messages: int, frames: int, danmakus: int, elapsed: float, errors: int):
+        self.messages = messages
+        self.frames = frames
+        self.danmakus = danmakus
+        self.elapsed = elapsed
+        self.errors = errors
+
+
+    def frames_per_second(self) -> float:
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+
+
+    def danmakus_per_second(self) -> float:
+        return self.danmakus / self.elapsed if self.elapsed > 0 else 0.0
+
+
+    def to_dict(self) -> dict:
+        return {
+            'messages': self.messages,
+            'frames': self.frames,
+            'danmakus': self.danmakus,
+            'errors': self.errors,
+            'elapsed': self.elapsed,
+            'frames_per_second': self.frames_per_second(),
+            'danmakus_per_second': self.danmakus_per_second(),
+        }
+
+
+class ReplayEngine:
+    """
+        回放引擎，内部使用一个不连接服务器的 LiveEventLoop，订阅方式与在线时相同
+    """
+
+    def __init__(self, room_id: int, speed: float = 1.0,
+                 buffer_capacity: int = 10000, drop_policy: str = buffer.DROP_OLDEST,
+                 collect_batch: bool = False):
+        """
+            :param room_id:         回放的直播间号，只用于填充事件
+            :param speed:           回放速度倍数，SPEED_UNLIMITED 表示尽可能快
+            :param buffer_capacity: 弹幕缓冲区的容量，参看 LiveEventLoop.pop_danmakus
+            :param drop_policy:     缓冲区满时的策略，回放时 block 等同于不丢弃
+            :param collect_batch:   是否同时写入列式批次，参看 LiveEventLoop.pop_batch
+        """
+        if speed < 0:
+            raise ValueError(f"Invalid replay speed: {speed}")
+        self.speed = speed
+        live_house = live.LiveHouse(room_id, 0, 0, 0, '', [])
+        self.event_loop = live.LiveEventLoop(live_house, None, None,
+                                             buffer_capacity=buffer_capacity, drop_policy=drop_policy,
+                                             collect_batch=collect_batch)
+        self.errors = 0
+
+
+    def subscribe(self, callback, *event_types: str) -> None:
+        self.event_loop.subscribe(callback, *event_types)
+
+
+    def unsubscribe(self, callback) -> None:
+        self.event_loop.unsubscribe(callback)
+
+
+    def events(self, *event_types: str, capacity: int = 10000) -> events.EventStream:
+        return self.event_loop.events(*event_types, capacity=capacity)
+
+
+    def feed(self, message, timestamp: float | None = None) -> None:
+        """
+            处理一条录制的消息
+            :param timestamp:   录制时的接收时间，写入弹幕的 receive_time，为 None 时使用当前时间
+        """
+        event_loop = self.event_loop
+        event_loop.receive_time = timestamp if timestamp is not None else time.time()
+        try:
+            packets = event_loop.decode_message(message)
+        except Exception as e:
+            self.errors += 1
+            event_loop.parser.reset()
+            return
+        event_loop.handle_packets(packets)
+
+
+    async def run(self, records: Iterable[tuple[float | None, bytes]]) -> ReplayStats:
+        """
+            回放所有记录，没有时间信息的记录不等待
+            :param records:     (接收时间, 原始消息)，如 iter_archive 或 iter_frame_file 的结果
+            :return:            回放统计
+        """
+        event_loop = self.event_loop
+        messages = 0
+        frames_before = event_loop.message_count
+        danmakus_before = event_loop.danmaku_count
+        errors_before = self.errors
+        started = time.perf_counter()
+        first_timestamp = None
+        for timestamp, message in records:
+            if self.speed != SPEED_UNLIMITED and timestamp is not None:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                delay = started + (timestamp - first_timestamp) / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.feed(message, timestamp)
+            messages += 1
+            if messages % 1024 == 0:
+                # 让出事件循环，异步迭代器的消费者才能跟上
+                await asyncio.sleep(0)
+        event_loop.parser.reset()
+        return ReplayStats(
+            messages=messages,
+            frames=event_loop.message_count - frames_before,
+            danmakus=event_loop.danmaku_count - danmakus_before,
+            elapsed=time.perf_counter() - started,
+            errors=self.errors - errors_before
+        )
+
+
+    def pop_danmakus(self, max_items: int | None = None) -> list:
+        return self.event_loop.pop_danmakus(max_items)
+
+
+    def close(self) -> None:
+        self.event_loop.stop()
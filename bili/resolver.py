@@ -0,0 +1,272 @@
+import asyncio
+import time
+
+from bili import aioclient
+from bili import backoff
+from bili import live
+from bili import signer
+from bili.session import Session
+
+
+"""
+    批量获取直播间的 getDanmuInfo(token 和服务器列表)
+    所有请求先经过令牌桶限速，被限流的错误码会让令牌桶暂停一段时间，可重试的错误按指数退避重新排队
+    成功的结果按 ttl 缓存，同一直播间同时只会有一个请求
+"""
+
+
+DEFAULT_TTL = 300.0
+DEFAULT_RATE = 20.0
+DEFAULT_BURST = 40
+# 请求被拦截或过于频繁，需要降低整体速度
+RATE_LIMITED_CODES = (-412, -509, -799)
+# 服务器临时错误或签名被拒绝(签名器已经刷新过一次密钥)，稍后重试即可
+RETRYABLE_CODES = RATE_LIMITED_CODES + signer.SIGN_REJECTED_CODES + (-500, -503, -504)
+
+
+class TokenBucket:
+    """
+        令牌桶，平均每秒发放 rate 个令牌，最多积攒 burst 个
+        等待中的调用按先后顺序获得令牌
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+            :param rate:    每秒发放的令牌数
+            :param burst:   令牌数上限，即允许的突发请求数
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid token bucket: rate={rate}, burst={burst}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+    def penalize(self, seconds: float) -> None:
+        """
+            清空令牌并在 seconds 秒内不再发放
+        """
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = max(now, self.paused_until)
+
+
+class RoomResolver:
+
+    def __init__(self, session: Session, wbi: signer.WbiSigner | tuple[str, str],
+                 rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST, concurrency: int = 16,
+                 ttl: float = DEFAULT_TTL, retries: int = 3,
+                 penalty: float = 5.0, retry_backoff: backoff.Backoff | None = None):
+        """
+            :param session:         登录会话
+            :param wbi:             wbi 签名器，也可以是 (img_key, sub_key)
+            :param rate:            每秒最多发起的请求数
+            :param burst:           允许的突发请求数
+            :param concurrency:     resolve_many 同时进行的请求数
+            :param ttl:             成功结果的缓存时间(秒)，0 表示不缓存
+            :param retries:         可重试错误(网络错误和 RETRYABLE_CODES)的最大重试次数
+            :param penalty:         遇到 RATE_LIMITED_CODES 时令牌桶暂停的时间(秒)
+            :param retry_backoff:   重试间隔的退避策略，每个直播间使用一份副本
+        """
+        self.session = session
+        self.wbi = signer.as_signer(wbi)
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.retries = retries
+        self.penalty = penalty
+        self.retry_backoff = retry_backoff or backoff.Backoff(initial=1.0, maximum=30.0)
+        self.cache: dict[int, tuple[float, live.LiveHouse]] = {}
+        self.inflight: dict[int, asyncio.Future] = {}
+        self.requests = 0
+        self.cache_hits = 0
+        self.retried = 0
+        self.failures = 0
+
+
+    def cached(self, room_id: int) -> live.LiveHouse | None:
+        entry = self.cache.get(room_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.cache[room_id]
+            return None
+        return entry[1]
+
+
+    def invalidate(self, room_id: int | None = None) -> None:
+        """
+            :param room_id:     为 None 时清空所有缓存
+        """
+        if room_id is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(room_id, None)
+
+
+    def new_backoff(self) -> backoff.Backoff:
+        template = self.retry_backoff
+        return backoff.Backoff(template.initial, template.maximum, template.factor, template.jitter)
+
+
+    async def fetch(self, room_id: int) -> live.LiveHouse | int:
+        """
+            经过令牌桶发送一次请求，不重试
+        """
+        await self.bucket.acquire()
+        self.requests += 1
+        if aioclient.available():
+            result = await live.get_live_house_async(room_id, self.session, self.wbi)
+        else:
+            result = await asyncio.to_thread(live.get_live_house, room_id, self.session, self.wbi)
+        if isinstance(result, int):
+            if result in RATE_LIMITED_CODES:
+                self.bucket.penalize(self.penalty)
+        elif self.ttl > 0:
+            self.cache[room_id] = (time.monotonic() + self.ttl, result)
+        return result
+
+
+    async def attempt(self, room_id: int) -> tuple[live.LiveHouse | int | Exception, bool]:
+        """
+            :return:    (结果, 是否可以重试)，网络错误以异常对象返回
+        """
+        try:
+            result = await self.fetch(room_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return e, True
+        return result, isinstance(result, int) and result in RETRYABLE_CODES
+
+
+    async def resolve(self, room_id: int, force: bool = False) -> live.LiveHouse | int:
+        """
+            获取单个直播间的信息，可重试的错误会在退避后重试
+            :param room_id: 直播间号
+            :param force:   忽略缓存，如握手被拒绝需要新的 token 时
+            :return:        LiveHouse，或者最后一次的错误码
+        """
+        if not force:
+            live_house = self.cached(room_id)
+            if live_house is not None:
+                self.cache_hits += 1
+                return live_house
+        pending = self.inflight.get(room_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = self.inflight[room_id] = asyncio.ensure_future(self.resolve_with_retries(room_id))
+        pending.add_done_callback(lambda future: self.finish(room_id, future))
+        return await asyncio.shield(pending)
+
+
+    def finish(self, room_id: int, future: asyncio.Future) -> None:
+        if self.inflight.get(room_id) is future:
+            del self.inflight[room_id]
+        if not future.cancelled():
+            # 等待的调用可能都已经被取消，这里取走异常避免未处理的警告
+            future.exception()
+
+
+    async def resolve_with_retries(self, room_id: int) -> live.LiveHouse | int:
+        retry_backoff = self.new_backoff()
+        retries = 0
+        while True:
+            result, retryable = await self.attempt(room_id)
+            if not retryable or retries >= self.retries:
+                break
+            retries += 1
+            self.retried += 1
+            await asyncio.sleep(retry_backoff.next())
+        if not isinstance(result, live.LiveHouse):
+            self.failures += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+    async def resolve_many(self, room_ids, force: bool = False) -> dict[int, live.LiveHouse | int | Exception]:
+        """
+            并发获取多个直播间的信息
+            concurrency 个工作协程从队列中取出直播间，可重试的失败在退避后重新放回队列，等待期间不占用工作协程
+            :param room_ids:    直播间号
+            :param force:       忽略缓存
+            :return:            键为直播间号，值为 LiveHouse、错误码或者最后一次的网络异常
+        """
+        results: dict[int, live.LiveHouse | int | Exception] = {}
+        queue: asyncio.Queue[tuple[int, int]] = asyncio.Queue()
+        backoffs: dict[int, backoff.Backoff] = {}
+        for room_id in dict.fromkeys(room_ids):
+            live_house = None if force else self.cached(room_id)
+            if live_house is not None:
+                self.cache_hits += 1
+                results[room_id] = live_house
+            else:
+                queue.put_nowait((room_id, 0))
+        if queue.empty():
+            return results
+        loop = asyncio.get_running_loop()
+        remaining = queue.qsize()
+        done = loop.create_future()
+        delayed: list[asyncio.TimerHandle] = []
+
+        async def worker() -> None:
+            nonlocal remaining
+            while True:
+                room_id, retries = await queue.get()
+                result, retryable = await self.attempt(room_id)
+                if retryable and retries < self.retries:
+                    self.retried += 1
+                    retry_backoff = backoffs.setdefault(room_id, self.new_backoff())
+                    delayed.append(loop.call_later(retry_backoff.next(), queue.put_nowait, (room_id, retries + 1)))
+                    continue
+                if not isinstance(result, live.LiveHouse):
+                    self.failures += 1
+                results[room_id] = result
+                remaining -= 1
+                if remaining == 0 and not done.done():
+                    done.set_result(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, remaining))]
+        try:
+            await done
+        finally:
+            for handle in delayed:
+                handle.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return results
+
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'cached': len(self.cache),
+            'retries': self.retried,
+            'failures': self.failures,
+        }
@@ -1,6 +1,7 @@
-import time, json, requests
-from bs4 import BeautifulSoup
-from bili import constants
+import time, json, re
+import asyncio
+from bili import aioclient
+from bili import client
 from bili import encrypter
 
 
@@ -43,21 +44,37 @@ def load_user_from_file(filepath: str) -> User | None:
 
 
 class Session:
+    """
+        登录会话，Cookies 会被设置到共享的 client.HttpClient 和 aioclient.AsyncHttpClient 上，因此同一进程中同时只能使用一个会话
+    """
 
     def __init__(self, login_time: str, cookies: dict, refresh_token: str):
         self.__set_data__(login_time, cookies, refresh_token)
 
 
+    def __setstate__(self, state: dict) -> None:
+        # 在其他进程中反序列化时同样需要把 Cookies 设置到该进程的共享客户端上
+        self.__dict__.update(state)
+        client.get_client().set_cookies(self.cookies)
+        aioclient.get_client().set_cookies(self.cookies)
+
+
     def __set_data__(self, login_time: str, cookies: dict, refresh_token: str) -> None:
-        self.login_time = login_time
-        self.cookies = cookies
-        self.session_data = cookies['SESSDATA']
-        self.jct = cookies['bili_jct']
-        self.uid = cookies['DedeUserID']
-        self.md5 = cookies['DedeUserID__ckMd5']
-        self.session_id = cookies['sid']
-        self.sec_ck = cookies["sec_ck"]
-        self.refresh_token = refresh_token
+        # 先读取所有字段再一次性替换，缺少字段时会话保持原样，读取方不会看到新旧混合的 Cookies
+        state = {
+            'login_time': login_time,
+            'cookies': cookies,
+            'session_data': cookies['SESSDATA'],
+            'jct': cookies['bili_jct'],
+            'uid': cookies['DedeUserID'],
+            'md5': cookies['DedeUserID__ckMd5'],
+            'session_id': cookies['sid'],
+            'sec_ck': cookies["sec_ck"],
+            'refresh_token': refresh_token
+        }
+        self.__dict__.update(state)
+        client.get_client().set_cookies(cookies)
+        aioclient.get_client().set_cookies(cookies)
 
 
     def save_session(self, filepath: str) -> None:
@@ -82,19 +99,16 @@ class Session:
                     - "need_to_refresh": 布尔值，表示是否需要刷新Cookies
                     - "timestamp": 整数，表示服务器返回的时间戳
         """
-        csrf_token = self.jct
-        result = requests.get("https://passport.bilibili.com/x/passport-login/web/cookie/info", headers=constants.headers, cookies=self.cookies, params={"csrf": csrf_token})
+        result = client.get_client().get(COOKIE_INFO_URL, params={"csrf": self.jct})
+        return parse_cookie_info(result.json())
 
-        json_obj = result.json()
-        logged_in = json_obj['code'] == 0
-        need_to_refresh = json_obj['data']['refresh']
-        timestamp = json_obj['data']['timestamp']
 
-        return {
-            "logged_in": logged_in,
-            "need_to_refresh": need_to_refresh,
-            "timestamp": timestamp
-        }
+    async def cookie_need_to_refresh_async(self) -> dict[str, bool | int]:
+        """
+        cookie_need_to_refresh 的异步版本
+        """
+        result = await aioclient.get_client().get(COOKIE_INFO_URL, params={"csrf": self.jct})
+        return parse_cookie_info(result.json())
 
 
     def refresh_cookies(self, timestamp: int) -> bool:
@@ -105,73 +119,137 @@ class Session:
         """
         try:
             correspond_path = encrypter.get_correspond_path(timestamp)
-            url = f'https://www.bilibili.com/correspond/1/{correspond_path}'.encode()
-            response = requests.get(url, headers=constants.headers, cookies=self.cookies)
-            soup = BeautifulSoup(response.content, 'lxml')
-            data = soup.find('body')
-            if data is None:
+            response = client.get_client().get(f'https://www.bilibili.com/correspond/1/{correspond_path}')
+            refresh_csrf = extract_refresh_csrf(response.content)
+            if refresh_csrf is None:
                 return False
-            key = data.find('div', attrs={'id': '1-name'})
-            if key is None:
+
+            response = client.get_client().post(COOKIE_REFRESH_URL, params=self.__refresh_params__(refresh_csrf))
+            json_obj = response.json()
+            if json_obj['code'] != 0:
                 return False
-            refresh_csrf = key.text
 
-            params = {
-                'csrf': self.jct,
-                'refresh_csrf': refresh_csrf,
-                'source': 'main_web',
-                'refresh_token': self.refresh_token
-            }
-            url = 'https://passport.bilibili.com/x/passport-login/web/cookie/refresh'
-            response = requests.post(url, headers=constants.headers, cookies=self.cookies, params=params)
+            old_refresh_token = self.refresh_token
+            self.__apply_refresh__(response.cookies.get_dict(), json_obj['data']['refresh_token'])
 
+            response = client.get_client().post(CONFIRM_REFRESH_URL,
+                                                params=self.__confirm_params__(old_refresh_token))
             json_obj = response.json()
             if json_obj['code'] != 0:
                 return False
+            return True
+        except Exception:
+            return False
 
-            self.__set_data__(time.gmtime(), response.cookies.get_dict(), json_obj['data']['refresh_token'])
 
-            url = 'https://passport.bilibili.com/x/passport-login/web/confirm/refresh'
-            params = {
-                'csrf': self.jct,
-                'refresh_token': self.refresh_token
-            }
+    async def refresh_cookies_async(self, timestamp: int) -> bool:
+        """
+        refresh_cookies 的异步版本
+        """
+        http = aioclient.get_client()
+        try:
+            # RSA 加密在线程中进行，不阻塞事件循环
+            correspond_path = await asyncio.to_thread(encrypter.get_correspond_path, timestamp)
+            response = await http.get(f'https://www.bilibili.com/correspond/1/{correspond_path}')
+            refresh_csrf = extract_refresh_csrf(response.body)
+            if refresh_csrf is None:
+                return False
 
-            response = requests.post(url, headers=constants.headers, cookies=self.cookies, params=params)
+            response = await http.post(COOKIE_REFRESH_URL, params=self.__refresh_params__(refresh_csrf))
             json_obj = response.json()
             if json_obj['code'] != 0:
                 return False
-            return True
-        except:
+
+            old_refresh_token = self.refresh_token
+            self.__apply_refresh__(response.cookies, json_obj['data']['refresh_token'])
+
+            response = await http.post(CONFIRM_REFRESH_URL, params=self.__confirm_params__(old_refresh_token))
+            return response.json()['code'] == 0
+        except Exception:
+            # 不能捕获 CancelledError，否则后台刷新无法被停止
             return False
 
 
+    def __refresh_params__(self, refresh_csrf: str) -> dict[str, str]:
+        return {
+            'csrf': self.jct,
+            'refresh_csrf': refresh_csrf,
+            'source': 'main_web',
+            'refresh_token': self.refresh_token
+        }
+
+
+    def __apply_refresh__(self, new_cookies: dict, refresh_token: str) -> None:
+        # 刷新接口只下发变化的 Cookies，合并到旧的 Cookies 上再整体替换
+        self.__set_data__(time.gmtime(), {**self.cookies, **new_cookies}, refresh_token)
+
+
+    def __confirm_params__(self, old_refresh_token: str) -> dict[str, str]:
+        # 确认刷新时 csrf 来自新的 Cookies，refresh_token 是刷新前的旧值
+        return {
+            'csrf': self.jct,
+            'refresh_token': old_refresh_token
+        }
+
+
     def get_user_data(self, user_saving_path: str, wbi_saving_path: str) -> tuple[User, tuple[str, str]] | tuple[None, tuple[str, str]]:
         """
         获取用户数据
         :return: 包含用户数据的User对象
         """
-        url = "https://api.bilibili.com/x/web-interface/nav"
-        response = requests.get(url, headers=constants.headers, cookies=self.cookies)
-        json_obj = response.json()
-
-        data = json_obj['data']
-        img_url: str = json_obj['data']['wbi_img']['img_url']
-        sub_url: str = json_obj['data']['wbi_img']['sub_url']
-        img_key = img_url.rsplit('/', 1)[1].split('.')[0]
-        sub_key = sub_url.rsplit('/', 1)[1].split('.')[0]
-        wbi = (img_key, sub_key)
-        # save_wbi(wbi_saving_path, wbi)
-        if json_obj['code'] != 0:
-            return None, wbi
-        avatar_url: str = data['face']
-        mid: int = data['mid']
-        name: str = data['uname']
-        level: int = data['level_info']['current_level']
-        pendant_url: str = data['pendant']['image']
-        user = User(user_saving_path, mid, name, avatar_url, level, pendant_url)
-        # user.save()
-        return user, wbi
+        response = client.get_client().get(NAV_URL)
+        return parse_nav(response.json(), user_saving_path)
+
+
+    async def get_user_data_async(self, user_saving_path: str, wbi_saving_path: str) -> tuple[User, tuple[str, str]] | tuple[None, tuple[str, str]]:
+        """
+        get_user_data 的异步版本
+        """
+        response = await aioclient.get_client().get(NAV_URL)
+        return parse_nav(response.json(), user_saving_path)
+
+
+COOKIE_INFO_URL = 'https://passport.bilibili.com/x/passport-login/web/cookie/info'
+COOKIE_REFRESH_URL = 'https://passport.bilibili.com/x/passport-login/web/cookie/refresh'
+CONFIRM_REFRESH_URL = 'https://passport.bilibili.com/x/passport-login/web/confirm/refresh'
+NAV_URL = 'https://api.bilibili.com/x/web-interface/nav'
+
+
+def parse_cookie_info(json_obj: dict) -> dict[str, bool | int]:
+    return {
+        "logged_in": json_obj['code'] == 0,
+        "need_to_refresh": json_obj['data']['refresh'],
+        "timestamp": json_obj['data']['timestamp']
+    }
+
+
+_REFRESH_CSRF_PATTERN = re.compile(rb'<div\b[^>]*\bid\s*=\s*["\']?1-name["\']?[^>]*>\s*([^<\s]*)\s*<', re.IGNORECASE)
+
+
+def extract_refresh_csrf(html: bytes) -> str | None:
+    """
+    从 correspond 页面中读取 refresh_csrf，即 <div id="1-name"> 的内容
+    :return: 找不到时返回None
+    """
+    match = _REFRESH_CSRF_PATTERN.search(html)
+    if match is None or not match.group(1):
+        return None
+    return match.group(1).decode()
+
+
+def parse_nav(json_obj: dict, user_saving_path: str) -> tuple[User, tuple[str, str]] | tuple[None, tuple[str, str]]:
+    data = json_obj['data']
+    wbi = encrypter.parse_wbi_keys(json_obj)
+    if json_obj['code'] != 0:
+        return None, wbi
+    avatar_url: str = data['face']
+    mid: int = data['mid']
+    name: str = data['uname']
+    level: int = data['level_info']['current_level']
+    pendant_url: str = data['pendant']['image']
+    user = User(user_saving_path, mid, name, avatar_url, level, pendant_url)
+    # user.save()
+    return user, wbi
 
 
 def save_wbi(path: str, wbi: tuple[str, str]) -> None:
@@ -0,0 +1,453 @@
+from multiprocessing.connection import Connection, wait
+from bili.session import Session, User
+from bili import client
+from bili import signer
+from hashlib import md5
+from typing import Callable
+import multiprocessing
+import threading
+import asyncio
+import bisect
+import time
+
+
+"""
+    多进程分片：监督进程启动 N 个工作进程，每个工作进程运行自己的 asyncio 事件循环和 LiveRoomManager
+    直播间通过一致性哈希分配到工作进程，工作进程退出时只有它负责的直播间会被重新分配
+    工作进程按固定间隔把弹幕批量发回监督进程，每批只需要一次序列化
+"""
+
+
+class HashRing:
+    """
+        一致性哈希环
+    """
+
+    def __init__(self, nodes: tuple[int, ...] = (), replicas: int = 64):
+        self.replicas = replicas
+        self.keys: list[int] = []
+        self.ring: dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(md5(key.encode()).digest()[:8], 'big')
+
+
+    def add(self, node: int) -> None:
+        for i in range(self.replicas):
+            key = self.hash(f'{node}#{i}')
+            if key in self.ring:
+                continue
+            self.ring[key] = node
+            bisect.insort(self.keys, key)
+
+
+    def remove(self, node: int) -> None:
+        for i in range(self.replicas):
+            key = self.hash(f'{node}#{i}')
+            if self.ring.get(key) == node:
+                del self.ring[key]
+                self.keys.pop(bisect.bisect_left(self.keys, key))
+
+
+    def get(self, item) -> int | None:
+        """
+            :param item:    需要分配的对象(如直播间号)
+            :return:        负责该对象的节点，环为空时返回 None
+        """
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, self.hash(str(item))) % len(self.keys)
+        return self.ring[self.keys[index]]
+
+
+    def nodes(self) -> set[int]:
+        return set(self.ring.values())
+
+
+def apply_runtime_options(options: dict) -> None:
+    """
+        在工作进程中应用进程级的全局配置，spawn 启动的进程不会继承监督进程中的设置
+        :param options:     json_backend / sender_cache_size / http_pool_size / http_retries，缺少的项保持默认
+    """
+    from bili import codec
+    from bili import interaction
+
+    if 'json_backend' in options:
+        codec.set_backend(options['json_backend'])
+    if 'sender_cache_size' in options:
+        interaction.sender_cache.resize(options['sender_cache_size'])
+    if 'http_pool_size' in options or 'http_retries' in options:
+        client_options = {}
+        if 'http_pool_size' in options:
+            client_options['pool_maxsize'] = options['http_pool_size']
+        if 'http_retries' in options:
+            client_options['retries'] = options['http_retries']
+        client.set_client(client.HttpClient(**client_options))
+
+
+def split_resolve_limits(manager_options: dict, workers: int) -> dict:
+    """
+        每个工作进程有自己的令牌桶，把 getDanmuInfo 的限速平分给各工作进程，保证总速度不超过配置值
+        :param manager_options:     LiveRoomManager 的参数
+        :param workers:             工作进程数量
+        :return:                    替换了 resolve_rate 与 resolve_burst 的参数副本
+    """
+    from bili import resolver
+
+    options = dict(manager_options)
+    workers = max(1, workers)
+    options['resolve_rate'] = options.get('resolve_rate', resolver.DEFAULT_RATE) / workers
+    options['resolve_burst'] = max(1, options.get('resolve_burst', resolver.DEFAULT_BURST) // workers)
+    return options
+
+
+def run_worker(worker_id: int, command_conn: Connection, event_conn: Connection,
+               session: Session, user: User, wbi: signer.WbiSigner | tuple[str, str],
+               manager_options: dict, decompress_options: dict | None, flush_interval: float,
+               runtime_options: dict | None = None) -> None:
+    """
+        工作进程入口
+        :param worker_id:           工作进程编号
+        :param command_conn:        接收监督进程指令的管道 ('add', room_id) / ('remove', room_id) / ('session', Session) / ('stop',)
+        :param event_conn:          向监督进程发送 ('events', worker_id, [(room_id, danmaku), ...]) 与 ('health', worker_id, dict)
+        :param session:             登录会话
+        :param user:                当前用户
+        :param wbi:                 wbi 签名器或 (img_key, sub_key)
+        :param manager_options:     传给 LiveRoomManager 的其他参数
+        :param decompress_options:  传给 DecompressStage 的参数，为 None 时不使用解压池
+        :param flush_interval:      批量发送事件的间隔(秒)
+        :param runtime_options:     进程级的全局配置，参看 apply_runtime_options
+    """
+    apply_runtime_options(runtime_options or {})
+    if session is not None:
+        # 会话在反序列化时把 Cookies 设置到了默认的共享客户端上，替换客户端后需要重新设置
+        client.get_client().set_cookies(session.cookies)
+    from bili.manager import LiveRoomManager
+    from bili import codec
+    from bili import decompress
+
+    async def main():
+        stage = decompress.DecompressStage(**decompress_options) if decompress_options is not None else None
+        manager = LiveRoomManager(session, user, wbi, decompress_stage=stage, **manager_options)
+        stopped = asyncio.Event()
+
+        async def read_commands():
+            while True:
+                try:
+                    command = await asyncio.to_thread(command_conn.recv)
+                except (EOFError, OSError):
+                    stopped.set()
+                    return
+                if command[0] == 'add':
+                    manager.add_room(command[1])
+                elif command[0] == 'remove':
+                    await manager.remove_room(command[1])
+                elif command[0] == 'session':
+                    # 反序列化时已经把新的 Cookies 设置到本进程的共享客户端上
+                    manager.update_session(command[1])
+                elif command[0] == 'stop':
+                    stopped.set()
+                    return
+
+        async def flush_events():
+            last_health = 0.0
+            while not stopped.is_set():
+                await asyncio.sleep(flush_interval)
+                batch = []
+                for room_id, handle in manager.rooms.items():
+                    if handle.event_loop is not None:
+                        batch.extend((room_id, danmaku) for danmaku in handle.event_loop.pop_danmakus())
+                if batch:
+                    event_conn.send(('events', worker_id, batch))
+                now = time.monotonic()
+                if now - last_health >= 1.0:
+                    last_health = now
+                    event_conn.send(('health', worker_id, {
+                        'stats': manager.stats(),
+                        'rooms': manager.health(),
+                        'json_backend': codec.get_backend().name
+                    }))
+
+        commands = asyncio.create_task(read_commands())
+        flusher = asyncio.create_task(flush_events())
+        await stopped.wait()
+        flusher.cancel()
+        await manager.close()
+        commands.cancel()
+
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, EOFError):
+        pass
+
+
+class WorkerHandle:
+
+    def __init__(self, worker_id: int, slot: int, process, command_conn: Connection, event_conn: Connection):
+        self.worker_id = worker_id
+        # 在哈希环上的槽位，替代的工作进程沿用同一个槽位
+        self.slot = slot
+        self.process = process
+        self.command_conn = command_conn
+        self.event_conn = event_conn
+        self.rooms: set[int] = set()
+        self.health: dict = {}
+
+
+class ShardSupervisor:
+    """
+        监督进程：管理工作进程，分配直播间并合并各工作进程发回的弹幕
+    """
+
+    def __init__(self, session: Session, user: User, wbi: signer.WbiSigner | tuple[str, str],
+                 workers: int = multiprocessing.cpu_count(),
+                 manager_options: dict | None = None,
+                 decompress_options: dict | None = None,
+                 flush_interval: float = 0.05,
+                 respawn: bool = True,
+                 runtime_options: dict | None = None):
+        """
+            :param session:             登录会话
+            :param user:                当前用户
+            :param wbi:                 wbi 签名器或 (img_key, sub_key)
+            :param workers:             工作进程数量
+            :param manager_options:     传给每个工作进程中 LiveRoomManager 的参数
+            :param decompress_options:  传给每个工作进程中 DecompressStage 的参数
+            :param flush_interval:      工作进程批量发送事件的间隔(秒)
+            :param respawn:             工作进程退出后是否启动新的工作进程替代
+            :param runtime_options:     在每个工作进程中应用的全局配置，参看 apply_runtime_options
+        """
+        self.session = session
+        self.user = user
+        self.wbi = wbi
+        self.worker_count = workers
+        self.manager_options = split_resolve_limits(manager_options or {}, workers)
+        self.decompress_options = decompress_options
+        self.flush_interval = flush_interval
+        self.respawn = respawn
+        self.runtime_options = runtime_options or {}
+        self.context = multiprocessing.get_context('spawn')
+        self.ring = HashRing()
+        self.workers: dict[int, WorkerHandle] = {}
+        self.rooms: dict[int, int] = {}
+        self.subscribers: list[Callable] = []
+        self.slots: dict[int, int] = {}
+        self.next_worker_id = 0
+        self.lock = threading.RLock()
+        self.monitor: threading.Thread | None = None
+        self.running = False
+        self.events_received = 0
+        self.worker_restarts = 0
+
+
+    def start(self) -> None:
+        with self.lock:
+            self.running = True
+            for _ in range(self.worker_count):
+                self.spawn_worker()
+        self.monitor = threading.Thread(target=self.monitor_loop, name='shard-monitor', daemon=True)
+        self.monitor.start()
+
+
+    def spawn_worker(self, slot: int | None = None) -> WorkerHandle:
+        """
+            :param slot:    接管的槽位，为 None 时新增一个槽位并重新分配直播间
+        """
+        new_slot = slot is None
+        if new_slot:
+            slot = min(set(range(len(self.slots) + 1)) - self.slots.keys())
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        command_recv, command_send = self.context.Pipe(duplex=False)
+        event_recv, event_send = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker_id, command_recv, event_send, self.session, self.user, self.wbi,
+                  self.manager_options, self.decompress_options, self.flush_interval,
+                  self.runtime_options),
+            name=f'live-worker-{worker_id}',
+            daemon=True
+        )
+        process.start()
+        command_recv.close()
+        event_send.close()
+        handle = WorkerHandle(worker_id, slot, process, command_send, event_recv)
+        self.workers[worker_id] = handle
+        self.slots[slot] = worker_id
+        if new_slot:
+            # 只有工作进程数量变化时才需要移动其他直播间
+            self.ring.add(slot)
+            self.rebalance()
+        return handle
+
+
+    def worker_for(self, room_id: int) -> int | None:
+        """
+            :return:    按哈希环负责该直播间的工作进程编号
+        """
+        slot = self.ring.get(room_id)
+        if slot is None:
+            return None
+        return self.slots.get(slot)
+
+
+    def subscribe(self, callback: Callable[[int, object], None]) -> None:
+        """
+            订阅合并后的弹幕，回调在监督进程的监控线程中执行
+            :param callback:    回调函数，传入参数为 (直播间号, 弹幕)
+        """
+        self.subscribers.append(callback)
+
+
+    def add_room(self, room_id: int) -> int | None:
+        """
+            :param room_id:     直播间号
+            :return:            负责该直播间的工作进程编号
+        """
+        with self.lock:
+            if room_id in self.rooms:
+                return self.rooms[room_id]
+            worker_id = self.worker_for(room_id)
+            if worker_id is None:
+                return None
+            self.assign(room_id, worker_id)
+            return worker_id
+
+
+    def remove_room(self, room_id: int) -> bool:
+        with self.lock:
+            worker_id = self.rooms.pop(room_id, None)
+            if worker_id is None:
+                return False
+            handle = self.workers.get(worker_id)
+            if handle is not None:
+                handle.rooms.discard(room_id)
+                self.send(handle, ('remove', room_id))
+            return True
+
+
+    def update_session(self, session: Session) -> None:
+        """
+            把刷新后的会话发送给所有工作进程，之后启动的工作进程同样使用新的会话
+        """
+        with self.lock:
+            self.session = session
+            for handle in self.workers.values():
+                self.send(handle, ('session', session))
+
+
+    def assign(self, room_id: int, worker_id: int) -> None:
+        handle = self.workers[worker_id]
+        self.rooms[room_id] = worker_id
+        handle.rooms.add(room_id)
+        self.send(handle, ('add', room_id))
+
+
+    def send(self, handle: WorkerHandle, command: tuple) -> None:
+        try:
+            handle.command_conn.send(command)
+        except (OSError, EOFError, BrokenPipeError):
+            pass
+
+
+    def rebalance(self) -> None:
+        """
+            按照当前的哈希环重新计算分配，只移动归属发生变化的直播间
+        """
+        with self.lock:
+            for room_id, worker_id in list(self.rooms.items()):
+                target = self.worker_for(room_id)
+                if target is None or target == worker_id:
+                    continue
+                old = self.workers.get(worker_id)
+                if old is not None:
+                    old.rooms.discard(room_id)
+                    self.send(old, ('remove', room_id))
+                self.assign(room_id, target)
+
+
+    def handle_worker_exit(self, handle: WorkerHandle) -> None:
+        with self.lock:
+            self.workers.pop(handle.worker_id, None)
+            if self.slots.get(handle.slot) == handle.worker_id:
+                del self.slots[handle.slot]
+            handle.command_conn.close()
+            handle.event_conn.close()
+            for room_id in handle.rooms:
+                self.rooms.pop(room_id, None)
+            orphans = handle.rooms
+            if self.running and self.respawn:
+                # 新的工作进程接管同一个槽位，只有退出的工作进程上的直播间需要重新连接
+                self.worker_restarts += 1
+                self.spawn_worker(handle.slot)
+            else:
+                self.ring.remove(handle.slot)
+            for room_id in orphans:
+                worker_id = self.worker_for(room_id)
+                if worker_id is not None:
+                    self.assign(room_id, worker_id)
+
+
+    def monitor_loop(self) -> None:
+        while self.running:
+            with self.lock:
+                handles = list(self.workers.values())
+            if not handles:
+                time.sleep(0.1)
+                continue
+            by_conn = {handle.event_conn: handle for handle in handles}
+            by_sentinel = {handle.process.sentinel: handle for handle in handles}
+            for ready in wait(list(by_conn.keys()) + list(by_sentinel.keys()), timeout=0.5):
+                if ready in by_conn:
+                    handle = by_conn[ready]
+                    try:
+                        message = ready.recv()
+                    except (EOFError, OSError):
+                        continue
+                    self.handle_message(handle, message)
+                elif self.running and ready in by_sentinel:
+                    handle = by_sentinel[ready]
+                    if handle.worker_id in self.workers:
+                        self.handle_worker_exit(handle)
+
+
+    def handle_message(self, handle: WorkerHandle, message: tuple) -> None:
+        kind = message[0]
+        if kind == 'events':
+            batch = message[2]
+            self.events_received += len(batch)
+            for callback in self.subscribers:
+                for room_id, event in batch:
+                    callback(room_id, event)
+        elif kind == 'health':
+            handle.health = message[2]
+
+
+    def health(self) -> dict[int, dict]:
+        with self.lock:
+            return {
+                worker_id: {
+                    'alive': handle.process.is_alive(),
+                    'rooms': len(handle.rooms),
+                    'health': handle.health,
+                }
+                for worker_id, handle in self.workers.items()
+            }
+
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self.lock:
+            self.running = False
+            handles = list(self.workers.values())
+        for handle in handles:
+            self.send(handle, ('stop',))
+        for handle in handles:
+            handle.process.join(timeout)
+            if handle.process.is_alive():
+                handle.process.terminate()
+        if self.monitor is not None:
+            self.monitor.join(timeout)
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from bili import aioclient
+from bili import encrypter
+
+
+"""
+    wbi 签名
+    img_key 和 sub_key 大约每天轮换一次，WbiSigner 在内存和磁盘上缓存密钥，超过 ttl 后才重新请求导航接口
+    mixin_key 只在密钥变化时计算一次，签名本身只剩下参数排序、序列化和一次 md5
+    服务器拒绝签名(如 getDanmuInfo 返回 -352)时调用 refresh / refresh_async 重新获取密钥
+    密钥过期但仍然存在时在后台刷新，签名继续使用旧的密钥，只有还没有密钥时才需要等待请求完成
+"""
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TTL = 6 * 3600
+NAV_URL = 'https://api.bilibili.com/x/web-interface/nav'
+# 签名失效或被风控时接口返回的错误码
+SIGN_REJECTED_CODES = (-352, -403)
+
+
+class WbiSigner:
+
+    def __init__(self, saving_path: str | None = None, ttl: float = DEFAULT_TTL,
+                 keys: tuple[str, str] | None = None):
+        """
+            :param saving_path: 磁盘缓存的路径，格式与 session.save_wbi 兼容，为 None 时只缓存在内存中
+            :param ttl:         密钥的有效时间(秒)
+            :param keys:        已知的 (img_key, sub_key)，为 None 时先尝试读取磁盘缓存
+        """
+        self.saving_path = saving_path
+        self.ttl = ttl
+        self.keys: tuple[str, str] | None = None
+        self.mixin_key = ''
+        self.fetched_at = 0.0
+        # 每次密钥变化时加一，用于判断失败的签名是否已经被其他调用刷新过
+        self.version = 0
+        self.lock = threading.Lock()
+        self.pending: asyncio.Task | None = None
+        self.background: threading.Thread | None = None
+        self.failures = 0
+        self.last_error: str | None = None
+        if keys is not None:
+            self.set_keys(keys, save=False)
+        elif saving_path is not None:
+            self.load()
+
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['lock'] = None
+        state['pending'] = None
+        state['background'] = None
+        return state
+
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+    def set_keys(self, keys: tuple[str, str], fetched_at: float | None = None, save: bool = True) -> None:
+        """
+            替换密钥并计算 mixin_key
+            :param keys:        (img_key, sub_key)
+            :param fetched_at:  获取密钥的时间，为 None 时使用当前时间
+            :param save:        是否写入磁盘缓存
+        """
+        img_key, sub_key = keys
+        self.mixin_key = encrypter.get_mixin_key(img_key + sub_key)
+        self.keys = (img_key, sub_key)
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.version += 1
+        if save and self.saving_path is not None:
+            self.save()
+
+
+    def expired(self) -> bool:
+        return self.keys is None or time.time() - self.fetched_at >= self.ttl
+
+
+    def sign(self, params: dict) -> dict[str, str]:
+        """
+            为请求参数签名，不检查密钥是否过期，参看 ensure
+            :return:    带有 w_rid 和 wts 的请求参数字典
+        """
+        if self.keys is None:
+            raise ValueError("WBI keys are not loaded")
+        return encrypter.sign_params(params, self.mixin_key)
+
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.saving_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        json_obj = {
+            'img_key': self.keys[0],
+            'sub_key': self.keys[1],
+            'fetched_at': self.fetched_at
+        }
+        # 多个工作进程可能同时刷新，先写临时文件再替换
+        temp_path = f'{self.saving_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(json_obj, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, self.saving_path)
+
+
+    def load(self) -> bool:
+        """
+            读取磁盘缓存，没有记录获取时间的旧缓存同样会被读取，但视为已过期
+            :return:    是否读取成功
+        """
+        try:
+            with open(self.saving_path, 'r', encoding='utf-8') as f:
+                json_obj = json.load(f)
+            keys = (json_obj['img_key'], json_obj['sub_key'])
+            fetched_at = float(json_obj.get('fetched_at', 0.0))
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self.set_keys(keys, fetched_at, save=False)
+        return True
+
+
+    def refresh(self, stale_version: int | None = None) -> None:
+        """
+            从导航接口重新获取密钥
+            :param stale_version:   签名失败时使用的 version，如果密钥已经被其他线程刷新过则不再请求
+        """
+        with self.lock:
+            if stale_version is not None and stale_version != self.version:
+                return
+            try:
+                keys = encrypter.get_wbi_keys()
+            except Exception as e:
+                self.record_failure(e)
+                raise
+            self.set_keys(keys)
+
+
+    def record_failure(self, error: Exception) -> None:
+        self.failures += 1
+        self.last_error = repr(error)
+        logger.warning('Failed to refresh WBI keys: %r', error)
+
+
+    async def refresh_async(self, stale_version: int | None = None) -> None:
+        """
+            refresh 的异步版本，同时失败的多个请求只会触发一次刷新
+        """
+        if stale_version is not None and stale_version != self.version:
+            return
+        await asyncio.shield(self.start_refresh_async())
+
+
+    def start_refresh_async(self) -> asyncio.Task:
+        """
+            启动(或复用正在进行的)异步刷新，必须在事件循环中调用
+        """
+        pending = self.pending
+        if pending is None or pending.done() or pending.get_loop() is not asyncio.get_running_loop():
+            pending = self.pending = asyncio.ensure_future(self.fetch_async())
+            # 后台刷新可能没有调用方等待结果，错误已经在 fetch_async 中记录
+            pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return pending
+
+
+    async def fetch_async(self) -> None:
+        try:
+            # 与 encrypter.get_wbi_keys 相同，获取密钥不需要登录
+            response = await aioclient.get_client().get(NAV_URL, anonymous=True)
+            keys = encrypter.parse_wbi_keys(response.json())
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.set_keys(keys, save=False)
+        if self.saving_path is not None:
+            # 写文件不阻塞事件循环
+            await asyncio.to_thread(self.save)
+
+
+    def refresh_in_background(self) -> None:
+        """
+            在后台线程中刷新，已经有后台刷新在进行时直接返回
+        """
+        # 不使用 self.lock，它在同步刷新的整个请求期间都被持有；同时启动的两个线程由 version 去重
+        if self.background is not None and self.background.is_alive():
+            return
+        self.background = threading.Thread(target=self.refresh_quietly, args=(self.version,),
+                                           name='wbi-refresh', daemon=True)
+        self.background.start()
+
+
+    def refresh_quietly(self, stale_version: int) -> None:
+        try:
+            self.refresh(stale_version)
+        except Exception:
+            # 已经在 refresh 中记录，下次 ensure 时重试
+            pass
+
+
+    def ensure(self) -> None:
+        """
+            还没有密钥时同步获取；已过期时在后台刷新，本次仍使用旧的密钥
+        """
+        if self.keys is None:
+            self.refresh(self.version)
+        elif self.expired():
+            self.refresh_in_background()
+
+
+    async def ensure_async(self) -> None:
+        """
+            ensure 的异步版本
+        """
+        if self.keys is None:
+            await self.refresh_async(self.version)
+        elif self.expired():
+            self.start_refresh_async()
+
+
+def as_signer(wbi: 'WbiSigner | tuple[str, str]') -> WbiSigner:
+    """
+        兼容直接传入 (img_key, sub_key) 的调用
+    """
+    if isinstance(wbi, WbiSigner):
+        return wbi
+    return WbiSigner(keys=wbi)
@@ -1,5 +1,7 @@
 import asyncio
 import os.path
+import threading
+import time
 
 import requests
 
@@ -9,18 +11,75 @@ from bili import login
 from bili import session
 from bili import encrypter
 from bili import constants
-from bili import live
+from bili import codec
+from bili import decompress
+from bili import events
+from bili import interaction
+from bili import metrics
+from bili import client
+from bili import aioclient
+from bili import latency
+from bili import signer
+from bili import refresher
+from bili.manager import LiveRoomManager
+from bili.shard import ShardSupervisor
 import urllib.parse
 
 session_saving_path = 'usr/session.json'
 
+
+async def restore_session(sessions: session.Session):
+    """
+        检查 Cookies 是否需要刷新，需要时先刷新，再用有效的 Cookies 获取用户数据
+        :return:    (User, wbi)，会话失效或刷新失败时返回 None
+    """
+    try:
+        need_to_refresh = await sessions.cookie_need_to_refresh_async()
+        if not need_to_refresh['logged_in']:
+            return None
+        if need_to_refresh['need_to_refresh']:
+            if not await sessions.refresh_cookies_async(need_to_refresh['timestamp']):
+                return None
+            sessions.save_session(session_saving_path)
+        return await sessions.get_user_data_async('usr/user.json', 'usr/wbi.json')
+    finally:
+        # aiohttp 的连接与这个临时事件循环绑定，结束前关闭
+        await aioclient.get_client().close()
+
 if __name__ == '__main__':
 
     cfg = Config(config_path="config.json")
 
     cfg.register_basic_config_item("ForceLogin", bool, False, "Whether to force login via QR code, ignoring saved session")
+    cfg.register_basic_config_item("JsonBackend", str, "auto", "JSON backend used for live packets: auto, json, orjson or msgspec")
+    cfg.register_basic_config_item("DecompressThreshold", int, 65536, "Compressed frames at least this many bytes are decompressed in a worker pool")
+    cfg.register_basic_config_item("DecompressPoolSize", int, 2, "Number of workers in the decompression pool")
+    cfg.register_basic_config_item("DecompressUseProcesses", bool, False, "Use a process pool instead of a thread pool for decompression")
+    cfg.register_basic_config_item("Rooms", list, [22499290], "Live room ids to connect to")
+    cfg.register_basic_config_item("MaxConcurrentConnects", int, 8, "Maximum number of rooms connecting at the same time")
+    cfg.register_basic_config_item("ConnectIntervalMs", int, 200, "Minimum interval between two room connections in milliseconds")
+    cfg.register_basic_config_item("EventBufferCapacity", int, 10000, "Maximum number of danmakus buffered per room")
+    cfg.register_basic_config_item("EventBufferPolicy", str, "drop_oldest", "What to do when the buffer is full: drop_oldest, drop_newest or block")
+    cfg.register_basic_config_item("PrintDanmaku", bool, True, "Whether to print received danmakus to the console")
+    cfg.register_basic_config_item("SenderCacheSize", int, 4096, "Number of danmaku senders kept in the shared sender cache")
+    cfg.register_basic_config_item("Workers", int, 0, "Number of worker processes to shard rooms across, 0 runs every room in this process")
+    cfg.register_basic_config_item("ArchiveDirectory", str, "", "Directory to archive raw websocket frames into, empty disables archiving")
+    cfg.register_basic_config_item("ArchiveSegmentSizeMb", int, 64, "Size in megabytes at which archive segment files are rotated")
+    cfg.register_basic_config_item("MetricsPort", int, 0, "Local port serving Prometheus metrics at /metrics, 0 disables metrics (single process mode only)")
+    cfg.register_basic_config_item("TrackLatency", bool, False, "Track rolling p50/p95/p99 latency from server send time to dispatch per room and server (single process mode only)")
+    cfg.register_basic_config_item("HttpPoolSize", int, 16, "Keep-alive connections kept per host by the shared HTTP client")
+    cfg.register_basic_config_item("HttpRetries", int, 3, "Retries for failed HTTP requests and 429/5xx responses")
+    cfg.register_basic_config_item("ResolvePerSecond", int, 20, "Maximum number of getDanmuInfo requests per second")
+    cfg.register_basic_config_item("ResolveBurst", int, 40, "Number of getDanmuInfo requests allowed in a burst")
+    cfg.register_basic_config_item("LiveHouseCacheSeconds", int, 300, "Seconds a resolved room token and host list is reused")
+    cfg.register_basic_config_item("CookieCheckInterval", int, 3600, "Seconds between two background cookie checks, 0 to disable")
+    cfg.register_basic_config_item("StatusReportInterval", int, 60, "Seconds between two status reports of the room manager")
     cfg.load()
+    codec.set_backend(cfg.get_config_value('JsonBackend'))
+    interaction.sender_cache.resize(cfg.get_config_value('SenderCacheSize'))
     i18n = I18nManager(locals_dir="lang", default_lang="en_us")
+    client.set_client(client.HttpClient(pool_maxsize=cfg.get_config_value('HttpPoolSize'),
+                                        retries=cfg.get_config_value('HttpRetries')))
 
     sessions = None
     need_to_login = True
@@ -29,16 +88,22 @@ if __name__ == '__main__':
     if (not bool(cfg.get_config_value('ForceLogin')) and
             os.path.exists(session_saving_path)):
         sessions = login.login_by_session_file(session_saving_path)
-        need_to_refresh = sessions.cookie_need_to_refresh()
-        if need_to_refresh['logged_in']:
-            if need_to_refresh['need_to_refresh']:
-                if sessions.refresh_cookies(need_to_refresh['timestamp']):
-                    sessions.save_session(session_saving_path)
-                    user, wbi = sessions.get_user_data('usr/user.json', 'usr/wbi.json')
-                    need_to_login = False
-            else:
+        if aioclient.available():
+            user_data = asyncio.run(restore_session(sessions))
+            if user_data is not None:
+                user, wbi = user_data
                 need_to_login = False
-                user, wbi = sessions.get_user_data('usr/user.json', 'usr/wbi.json')
+        else:
+            need_to_refresh = sessions.cookie_need_to_refresh()
+            if need_to_refresh['logged_in']:
+                if need_to_refresh['need_to_refresh']:
+                    if sessions.refresh_cookies(need_to_refresh['timestamp']):
+                        sessions.save_session(session_saving_path)
+                        user, wbi = sessions.get_user_data('usr/user.json', 'usr/wbi.json')
+                        need_to_login = False
+                else:
+                    need_to_login = False
+                    user, wbi = sessions.get_user_data('usr/user.json', 'usr/wbi.json')
 
     if need_to_login:
         sessions = login.login_by_qrcode(sleep_time=5, timeout=600,
@@ -54,15 +119,130 @@ if __name__ == '__main__':
     else:
         print(i18n.translate("session_loaded_successfully"))
 
-    liveHouse = live.get_live_house(22499290, sessions, wbi)
+    # 导航接口已经返回了最新的 wbi 密钥，写入缓存供签名和工作进程使用
+    wbi_signer = signer.WbiSigner('usr/wbi.json')
+    if wbi is not None:
+        wbi_signer.set_keys(wbi)
+
     loop = asyncio.new_event_loop()
-    eventLoop = live.LiveEventLoop(liveHouse, liveHouse.host_list[0], user, 5)
+    decompress_options = {
+        'threshold': cfg.get_config_value('DecompressThreshold'),
+        'pool_size': cfg.get_config_value('DecompressPoolSize'),
+        'use_processes': bool(cfg.get_config_value('DecompressUseProcesses'))
+    }
+    manager_options = {
+        'max_concurrent_connects': cfg.get_config_value('MaxConcurrentConnects'),
+        'connect_interval': cfg.get_config_value('ConnectIntervalMs') / 1000,
+        'heartbeat_interval': 5,
+        'buffer_capacity': cfg.get_config_value('EventBufferCapacity'),
+        'drop_policy': cfg.get_config_value('EventBufferPolicy'),
+        'archive_directory': cfg.get_config_value('ArchiveDirectory') or None,
+        'archive_segment_size': cfg.get_config_value('ArchiveSegmentSizeMb') * 1024 * 1024,
+        'resolve_rate': cfg.get_config_value('ResolvePerSecond'),
+        'resolve_burst': cfg.get_config_value('ResolveBurst'),
+        'live_house_ttl': cfg.get_config_value('LiveHouseCacheSeconds')
+    }
+
+    if cfg.get_config_value('Workers') > 0:
+        supervisor = ShardSupervisor(sessions, user, wbi_signer,
+                                     workers=cfg.get_config_value('Workers'),
+                                     manager_options=manager_options,
+                                     decompress_options=decompress_options,
+                                     runtime_options={
+                                         'json_backend': cfg.get_config_value('JsonBackend'),
+                                         'sender_cache_size': cfg.get_config_value('SenderCacheSize'),
+                                         'http_pool_size': cfg.get_config_value('HttpPoolSize'),
+                                         'http_retries': cfg.get_config_value('HttpRetries')
+                                     })
+        sink = None
+        if cfg.get_config_value('PrintDanmaku'):
+            sink = events.PrintSink()
+            supervisor.subscribe(lambda room_id, danmaku: sink(events.LiveEvent(room_id, events.DANMAKU, danmaku,
+                                                                                danmaku.receive_time,
+                                                                                danmaku.dispatch_time)))
+            # 回调在监控线程中执行，消息较少时需要定时输出
+            threading.Thread(target=asyncio.run, args=(sink.run(),), name='print-sink', daemon=True).start()
+        supervisor.start()
+        cookie_refresher = None
+        if cfg.get_config_value('CookieCheckInterval') > 0:
+            # 监督进程没有事件循环，在单独的线程中检查，刷新后把新的会话发送给工作进程
+            cookie_refresher = refresher.CookieRefresher(sessions, session_saving_path,
+                                                         interval=cfg.get_config_value('CookieCheckInterval'),
+                                                         on_refresh=supervisor.update_session)
+            cookie_refresher.start_thread(cookie_refresher.interval)
+        for room_id in cfg.get_config_value('Rooms'):
+            supervisor.add_room(int(room_id))
+        try:
+            while True:
+                time.sleep(cfg.get_config_value('StatusReportInterval'))
+                worker_stats = [worker['health'].get('stats', {}) for worker in supervisor.health().values()]
+                print(i18n.translate("manager_status", rooms=len(supervisor.rooms),
+                                     running=sum(stats.get('states', {}).get('running', 0) for stats in worker_stats),
+                                     rate=round(sum(stats.get('messages_per_second', 0.0) for stats in worker_stats), 1)))
+        finally:
+            if cookie_refresher is not None:
+                cookie_refresher.stop_thread()
+            supervisor.stop()
+            if sink is not None:
+                sink.flush()
+
+    latency_monitor = latency.LatencyMonitor() if cfg.get_config_value('TrackLatency') else None
+    pipeline_metrics = None
+    if cfg.get_config_value('MetricsPort') > 0:
+        pipeline_metrics = metrics.PipelineMetrics(latency_monitor=latency_monitor)
+        metrics.MetricsServer(pipeline_metrics.registry, port=cfg.get_config_value('MetricsPort')).start()
+
+    manager = LiveRoomManager(sessions, user, wbi_signer,
+                              decompress_stage=decompress.DecompressStage(**decompress_options),
+                              pipeline_metrics=pipeline_metrics,
+                              latency_monitor=latency_monitor,
+                              **manager_options)
+
+    async def run_rooms():
+        sink_task = None
+        if cfg.get_config_value('PrintDanmaku'):
+            sink = events.PrintSink()
+            manager.subscribe(sink, events.DANMAKU)
+            sink_task = asyncio.create_task(sink.run())
+        cookie_refresher = None
+        if cfg.get_config_value('CookieCheckInterval') > 0:
+            cookie_refresher = refresher.CookieRefresher(sessions, session_saving_path,
+                                                         interval=cfg.get_config_value('CookieCheckInterval'),
+                                                         on_refresh=manager.update_session)
+            cookie_refresher.start(cookie_refresher.interval)
+        rooms = [int(room_id) for room_id in cfg.get_config_value('Rooms')]
+        # 先在令牌桶限速下批量获取所有直播间的信息，之后的连接直接使用缓存
+        await manager.resolve_many(rooms)
+        for room_id in rooms:
+            manager.add_room(room_id)
+
+        async def drain_buffers():
+            # 弹幕已经通过 subscribe 分发，这里只需要清空各直播间的缓冲区，否则 block 策略下接收循环会停住
+            while True:
+                await asyncio.sleep(0.05)
+                manager.pop_danmakus()
+
+        drain_task = asyncio.create_task(drain_buffers())
+        try:
+            while True:
+                await asyncio.sleep(cfg.get_config_value('StatusReportInterval'))
+                stats = manager.stats()
+                print(i18n.translate("manager_status", rooms=stats['rooms'],
+                                     running=stats['states'].get('running', 0),
+                                     rate=round(stats['messages_per_second'], 1)))
+        finally:
+            drain_task.cancel()
+            if cookie_refresher is not None:
+                await cookie_refresher.stop()
+            await manager.close()
+            if sink_task is not None:
+                sink_task.cancel()
 
     if loop.is_running():
         task = asyncio.create_task(
-            eventLoop.start()
+            run_rooms()
         )
     else:
         loop.run_until_complete(
-            eventLoop.start()
+            run_rooms()
         )
\ No newline at end of file
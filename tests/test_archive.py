@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from bili import archive
+
+
+def write_records(directory, background: bool, segment_size: int = 64 * 1024) -> list[tuple[float, bytes]]:
+    frame_archive = archive.FrameArchive(str(directory), 7, segment_size=segment_size,
+                                         index_interval=0, background=background)
+    records = [(1000.0 + i, f'message-{i}'.encode() * 4) for i in range(50)]
+    for timestamp, data in records:
+        frame_archive.write(data, timestamp)
+    frame_archive.close()
+    assert frame_archive.stats()['frames'] == 50
+    return records
+
+
+def read_all(directory, start=None, end=None) -> list[tuple[float, bytes]]:
+    reader = archive.ArchiveReader(str(directory), 7)
+    return [(timestamp, bytes(payload)) for timestamp, payload in reader.iter_range(start, end)]
+
+
+def test_round_trip_in_background(tmp_path):
+    records = write_records(tmp_path, background=True)
+    assert read_all(tmp_path) == records
+    assert read_all(tmp_path, 1010.0, 1020.0) == records[10:20]
+
+
+def test_segments_opened_in_the_same_millisecond_do_not_collide(tmp_path):
+    frame_archive = archive.FrameArchive(str(tmp_path), 7, segment_size=32, background=False)
+    for i in range(5):
+        frame_archive.write(b'x' * 20, 1000.0)
+    frame_archive.close()
+    segments = sorted(name for name in os.listdir(tmp_path) if name.endswith(archive.SEGMENT_SUFFIX))
+    assert len(segments) == 5
+    assert [archive.parse_segment_name(name)[2] for name in segments] == [0, 1, 2, 3, 4]
+    assert read_all(tmp_path) == [(1000.0, b'x' * 20)] * 5
+
+
+def test_parse_legacy_segment_name():
+    assert archive.parse_segment_name('7-0000001000000.seg') == (7, 1000.0, 0)
+    assert archive.parse_segment_name('7-0000001000000-002.seg') == (7, 1000.0, 2)
+    assert archive.parse_segment_name('7-0000001000000.idx') is None
+
+
+def test_segment_reader_close_releases_views(tmp_path):
+    write_records(tmp_path, background=False)
+    path = archive.ArchiveReader(str(tmp_path), 7).segments()[0][1]
+    reader = archive.SegmentReader(path)
+    records = reader.records()
+    timestamp, payload = next(records)
+    assert bytes(payload) == b'message-0' * 4
+    reader.close()
+    assert len(reader) == 0
+    with pytest.raises(ValueError):
+        bytes(payload)
@@ -0,0 +1,16 @@
+from bili.backoff import Backoff
+
+
+def test_next_does_not_overflow_after_many_failures():
+    backoff = Backoff(initial=0.5, maximum=30.0, factor=2.0, jitter=0.0)
+    delays = [backoff.next() for _ in range(5000)]
+    assert delays[0] == 0.5
+    assert delays[-1] == 30.0
+    assert max(delays) == 30.0
+
+
+def test_reset_starts_from_initial():
+    backoff = Backoff(initial=1.0, maximum=8.0, jitter=0.0)
+    assert [backoff.next() for _ in range(5)] == [1.0, 2.0, 4.0, 8.0, 8.0]
+    backoff.reset()
+    assert backoff.next() == 1.0
@@ -0,0 +1,35 @@
+import asyncio
+
+from bili import batch
+from bili import buffer
+
+
+def fill(danmaku_batch: batch.DanmakuBatch, count: int) -> list[bool]:
+    return [danmaku_batch.append_values(i, i, 0, 25, f'弹幕{i}') for i in range(count)]
+
+
+def test_unbounded_by_default():
+    danmaku_batch = batch.DanmakuBatch()
+    assert all(fill(danmaku_batch, 100))
+    assert len(danmaku_batch) == 100
+    assert danmaku_batch.dropped == 0
+
+
+def test_drop_newest_rejects_new_danmakus():
+    danmaku_batch = batch.DanmakuBatch(capacity=3, policy=buffer.DROP_NEWEST)
+    assert fill(danmaku_batch, 5) == [True, True, True, False, False]
+    assert danmaku_batch.contents() == ['弹幕0', '弹幕1', '弹幕2']
+    assert danmaku_batch.dropped == 2
+
+
+def test_drop_oldest_keeps_offsets_consistent():
+    danmaku_batch = batch.DanmakuBatch(capacity=8, policy=buffer.DROP_OLDEST)
+    assert all(fill(danmaku_batch, 20))
+    assert len(danmaku_batch) <= 8
+    assert danmaku_batch.dropped == 20 - len(danmaku_batch)
+    kept = range(20 - len(danmaku_batch), 20)
+    assert list(danmaku_batch.timestamps) == list(kept)
+    assert danmaku_batch.contents() == [f'弹幕{i}' for i in kept]
+    assert danmaku_batch.content_offsets[0] == 0
+    assert danmaku_batch.content_offsets[-1] == len(danmaku_batch.content_data)
+
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from bili import buffer
+
+
+def fill(event_buffer: buffer.EventBuffer, count: int) -> list[bool]:
+    return [event_buffer.put(i) for i in range(count)]
+
+
+def test_drop_oldest_keeps_newest_items():
+    event_buffer = buffer.EventBuffer(3, buffer.DROP_OLDEST)
+    assert all(fill(event_buffer, 5))
+    assert event_buffer.drain() == [2, 3, 4]
+    assert event_buffer.stats() == {'size': 0, 'capacity': 3, 'accepted': 5, 'dropped': 2}
+
+
+def test_drop_newest_rejects_new_items():
+    event_buffer = buffer.EventBuffer(3, buffer.DROP_NEWEST)
+    assert fill(event_buffer, 5) == [True, True, True, False, False]
+    assert event_buffer.drain() == [0, 1, 2]
+    assert event_buffer.stats() == {'size': 0, 'capacity': 3, 'accepted': 3, 'dropped': 2}
+
+
+def test_block_waits_for_drain():
+    event_buffer = buffer.EventBuffer(3, buffer.BLOCK)
+    assert all(fill(event_buffer, 4))
+    assert event_buffer.dropped == 0
+    assert event_buffer.should_wait()
+
+    async def main():
+        waiter = asyncio.create_task(event_buffer.wait_for_space())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert event_buffer.drain(2) == [0, 1]
+        await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(main())
+    assert not event_buffer.should_wait()
+
+
+def test_drain_from_another_thread_wakes_reader():
+    event_buffer = buffer.EventBuffer(1, buffer.BLOCK)
+    event_buffer.put('a')
+
+    async def main():
+        waiter = asyncio.create_task(event_buffer.wait_for_space())
+        await asyncio.sleep(0.01)
+        await asyncio.to_thread(event_buffer.drain)
+        await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(main())
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        buffer.EventBuffer(3, 'drop_all')
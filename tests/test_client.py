@@ -0,0 +1,55 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bili import client
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = json.dumps({'cookie': self.headers.get('Cookie')}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'server_set=1; Path=/')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_cookies_are_sent_unless_anonymous(server_url):
+    http = client.HttpClient(retries=0)
+    http.set_cookies({'SESSDATA': 'a'})
+    assert http.get(server_url).json()['cookie'] == 'SESSDATA=a'
+    assert http.get(server_url, anonymous=True).json()['cookie'] is None
+    http.set_cookies({'SESSDATA': 'b'})
+    response = http.get(server_url)
+    assert response.json()['cookie'] == 'SESSDATA=b'
+    # 服务器下发的 Cookies 只出现在响应中，不会随之后的请求发送
+    assert response.cookies.get('server_set') == '1'
+    assert http.get(server_url).json()['cookie'] == 'SESSDATA=b'
+    http.close()
+
+
+def test_pool_blocks_instead_of_discarding_connections():
+    http = client.HttpClient(pool_maxsize=4)
+    adapter = http.session.get_adapter('https://api.bilibili.com')
+    assert adapter._pool_block is True
+    assert adapter._pool_maxsize == 4
+    http.close()
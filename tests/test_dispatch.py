@@ -0,0 +1,27 @@
+from bili import dispatch
+
+
+def test_peek_cmd_reads_first_key():
+    assert dispatch.peek_cmd(b'{"cmd":"DANMU_MSG","info":[]}') == 'DANMU_MSG'
+    assert dispatch.peek_cmd(memoryview(b'{ "cmd" : "INTERACT_WORD", "data":{}}')) == 'INTERACT_WORD'
+
+
+def test_peek_cmd_strips_legacy_suffix():
+    assert dispatch.peek_cmd(b'{"cmd":"DANMU_MSG:4:0:2:2:2:0","info":[]}') == 'DANMU_MSG'
+
+
+def test_peek_cmd_ignores_nested_cmd():
+    assert dispatch.peek_cmd(b'{"data":{"cmd":"X"},"cmd":"DANMU_MSG"}') == 'DANMU_MSG'
+    assert dispatch.peek_cmd(b'{"data":{"cmd":"X"}}') is None
+
+
+def test_peek_cmd_reads_long_values_and_bodies():
+    cmd = 'A' * 100
+    assert dispatch.peek_cmd(('{"cmd":"%s"}' % cmd).encode()) == cmd
+    padding = 'x' * 200
+    assert dispatch.peek_cmd(('{"pad":"%s","cmd":"SEND_GIFT"}' % padding).encode()) == 'SEND_GIFT'
+
+
+def test_peek_cmd_invalid_json():
+    assert dispatch.peek_cmd(b'not json') is None
+    assert dispatch.peek_cmd(b'[1, 2]') is None
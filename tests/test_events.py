@@ -0,0 +1,44 @@
+import asyncio
+
+from bili import dispatch, events
+
+
+class Packet:
+
+    def __init__(self, body: bytes):
+        self.data = (16 + len(body)).to_bytes(4, 'big') + (16).to_bytes(2, 'big') + bytes(10) + body
+        self.body = body
+
+
+    def decode(self):
+        import json
+        return json.loads(self.body)
+
+
+def test_catch_all_handler_receives_unregistered_cmds():
+    dispatcher = dispatch.CommandDispatcher()
+    specific, fallback = [], []
+    dispatcher.register('DANMU_MSG', specific.append)
+    dispatcher.register(None, fallback.append)
+    assert dispatcher.dispatch(Packet(b'{"cmd":"DANMU_MSG"}'))
+    assert dispatcher.dispatch(Packet(b'{"cmd":"SEND_GIFT"}'))
+    assert not dispatcher.dispatch(Packet(b'{"data":1}'))
+    assert [item['cmd'] for item in specific] == ['DANMU_MSG']
+    assert [item['cmd'] for item in fallback] == ['SEND_GIFT']
+    dispatcher.unregister(None, fallback.append)
+    assert not dispatcher.dispatch(Packet(b'{"cmd":"SEND_GIFT"}'))
+
+
+def test_stream_close_runs_callback_and_unsubscribes():
+    hub = events.EventHub()
+    closed = []
+    stream = events.EventStream(hub, ('A',), on_close=closed.append)
+    hub.publish(events.LiveEvent(1, 'A', None))
+    stream.close()
+    assert closed == [stream]
+    assert not hub.wants('A')
+
+    async def main():
+        return [event.type async for event in stream]
+
+    assert asyncio.run(main()) == ['A']
@@ -0,0 +1,67 @@
+import asyncio
+import zlib
+
+import brotli
+import pytest
+
+from bili import decompress, frame
+
+
+def make_frame(body: bytes, protocol: int = frame.PROTOCOL_JSON, packet_type: int = frame.OP_MESSAGE) -> bytes:
+    return frame.HEADER.pack(frame.HEADER_LEN + len(body), frame.HEADER_LEN, protocol, packet_type, 0) + body
+
+
+def bodies(frames) -> list[bytes]:
+    return [bytes(item[frame.HEADER_LEN:]) for item in frames]
+
+
+def test_multiple_frames_in_one_message():
+    message = make_frame(b'{"cmd":"A"}') + make_frame(b'{"cmd":"B"}') + make_frame(b'{"cmd":"C"}')
+    assert bodies(frame.FrameParser().feed(message)) == [b'{"cmd":"A"}', b'{"cmd":"B"}', b'{"cmd":"C"}']
+
+
+def test_truncated_frame_is_completed_by_next_message():
+    message = make_frame(b'{"cmd":"A"}') + make_frame(b'{"cmd":"B"}')
+    parser = frame.FrameParser()
+    # 在第二帧的包头中间截断
+    cut = len(make_frame(b'{"cmd":"A"}')) + 5
+    assert bodies(parser.feed(message[:cut])) == [b'{"cmd":"A"}']
+    assert parser.pending == message[len(make_frame(b'{"cmd":"A"}')):cut]
+    assert bodies(parser.feed(message[cut:])) == [b'{"cmd":"B"}']
+    assert parser.pending == b''
+
+
+def test_reset_discards_pending_bytes():
+    parser = frame.FrameParser()
+    assert list(parser.feed(make_frame(b'{"cmd":"A"}')[:10])) == []
+    parser.reset()
+    assert bodies(parser.feed(make_frame(b'{"cmd":"B"}'))) == [b'{"cmd":"B"}']
+
+
+@pytest.mark.parametrize('protocol, compress', [
+    (frame.PROTOCOL_ZLIB, zlib.compress),
+    (frame.PROTOCOL_BROTLI, brotli.compress),
+])
+def test_compressed_batches_are_expanded_in_order(protocol, compress):
+    inner = make_frame(b'{"cmd":"A"}') + make_frame(b'{"cmd":"B"}')
+    message = make_frame(b'{"cmd":"before"}') + make_frame(compress(inner), protocol) + make_frame(b'{"cmd":"after"}')
+    expected = [b'{"cmd":"before"}', b'{"cmd":"A"}', b'{"cmd":"B"}', b'{"cmd":"after"}']
+    assert bodies(frame.FrameParser().feed(message)) == expected
+    stage = decompress.DecompressStage(threshold=0)
+    try:
+        assert bodies(asyncio.run(frame.FrameParser().feed_async(message, stage))) == expected
+    finally:
+        stage.shutdown()
+
+
+def test_truncated_compressed_batch_is_rejected():
+    inner = make_frame(b'{"cmd":"A"}') + make_frame(b'{"cmd":"B"}')
+    message = make_frame(zlib.compress(inner[:-3]), frame.PROTOCOL_ZLIB)
+    with pytest.raises(ValueError):
+        list(frame.FrameParser().feed(message))
+
+
+def test_malformed_header_is_rejected():
+    message = frame.HEADER.pack(4, frame.HEADER_LEN, 0, frame.OP_MESSAGE, 0)
+    with pytest.raises(ValueError):
+        frame.FrameParser().feed(message)
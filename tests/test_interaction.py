@@ -0,0 +1,48 @@
+from bili import interaction
+
+
+def test_sender_data_accepts_missing_fields():
+    sender = interaction.SenderData(1, None, 0, 0, False)
+    assert sender.name is None
+    assert sender.avatar_url == 0
+    emoji = interaction.EmojiInfo('d', None, (20, 20), None)
+    assert emoji.emoji is None and emoji.url is None
+
+
+def test_sender_data_interns_names():
+    first = interaction.SenderData(1, ''.join(['na', 'me']), 0, '', False)
+    second = interaction.SenderData(2, ''.join(['nam', 'e']), 0, '', False)
+    assert first.name is second.name
+
+
+def test_sender_cache_reuses_senders():
+    cache = interaction.SenderCache(max_size=2)
+    first = cache.get(1, 'a', 0, '', False)
+    assert cache.get(1, 'a', 0, '', False) is first
+    assert cache.get(1, 'b', 0, '', False).name == 'b'
+    cache.get(2, 'c', 0, '', False)
+    cache.get(3, 'd', 0, '', False)
+    assert len(cache) == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_sender_cache_skips_anonymous_senders():
+    cache = interaction.SenderCache()
+    first = cache.get(0, 'a***', 0, '', False)
+    second = cache.get(0, 'b***', 0, '', False)
+    assert (first.name, second.name) == ('a***', 'b***')
+    assert len(cache) == 0
+    assert cache.stats()['uncached'] == 2
+
+
+def test_danmaku_keeps_raw_time():
+    sender = interaction.SenderData(1, 'a', 0, '', False)
+    raw = {'ts': 1700000000, 'ct': 'ABCDEF'}
+    danmaku = interaction.Danmaku('hi', raw, interaction.text_info(25, 0), (), sender)
+    assert danmaku.time == raw
+    assert danmaku.time['ct'] == 'ABCDEF'
+    assert danmaku.timestamp == 1700000000
+    assert danmaku.server_time == 1700000000.0
+    legacy = interaction.Danmaku('hi', 1700000000123, interaction.text_info(25, 0), (), sender)
+    assert legacy.timestamp == 1700000000
+    assert danmaku.get_time(None) == legacy.get_time(None) == '2023-11-14 22:13:20'
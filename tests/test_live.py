@@ -0,0 +1,123 @@
+import asyncio
+import json
+import zlib
+
+from bili import decompress, frame, live
+
+
+def make_frame(body: bytes, protocol: int = 0, packet_type: int = 5) -> bytes:
+    return frame.HEADER.pack(frame.HEADER_LEN + len(body), frame.HEADER_LEN, protocol, packet_type, 0) + body
+
+
+def zlib_frame(frames: list[bytes]) -> bytes:
+    return make_frame(zlib.compress(b''.join(frames)), protocol=2)
+
+
+def new_event_loop(**kwargs) -> live.LiveEventLoop:
+    live_house = live.LiveHouse(1, 0, 0, 0, '', [])
+    return live.LiveEventLoop(live_house, None, None, **kwargs)
+
+
+class FakeSocket:
+
+    def __init__(self, messages: list[bytes]):
+        self.messages = list(messages)
+
+
+    async def recv(self) -> bytes:
+        if not self.messages:
+            # 模拟一直没有新消息的连接
+            await asyncio.Event().wait()
+        return self.messages.pop(0)
+
+
+def gift(index: int) -> bytes:
+    return make_frame(json.dumps({'cmd': 'SEND_GIFT', 'data': {'index': index}}).encode())
+
+
+def test_receive_ordered_keeps_order_and_cleans_up():
+    stage = decompress.DecompressStage(threshold=0, pool_size=2)
+    event_loop = new_event_loop(decompress_stage=stage, owns_decompress_stage=True)
+    received = []
+    event_loop.subscribe(lambda event: received.append(event.data['data']['index']), 'SEND_GIFT')
+    messages = [zlib_frame([gift(i * 3 + j) for j in range(3)]) for i in range(10)]
+
+    async def main():
+        before = asyncio.all_tasks()
+        reader = asyncio.create_task(event_loop.receive_ordered(FakeSocket(messages)))
+        while len(received) < 30:
+            await asyncio.sleep(0.01)
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        assert asyncio.all_tasks() == before
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+    assert received == list(range(30))
+    event_loop.stop()
+    assert stage.executor is None
+
+
+class ClosingSocket:
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+    async def send(self, data) -> None:
+        pass
+
+
+    async def recv(self) -> bytes:
+        raise ConnectionResetError('closed before verify')
+
+
+class FakeHost:
+
+    def get_ws_url(self) -> str:
+        return 'ws://127.0.0.1:1/sub'
+
+
+    async def send_verify(self, ws, room_id, mid, token) -> None:
+        pass
+
+
+class FakeUser:
+    mid = 0
+
+
+def test_start_raises_reader_error_before_verify(monkeypatch):
+    monkeypatch.setattr(live.websockets, 'connect', lambda url: ClosingSocket(), raising=False)
+    live_house = live.LiveHouse(1, 0, 0, 0, '', [])
+    event_loop = live.LiveEventLoop(live_house, FakeHost(), FakeUser(), verify_timeout=5.0)
+
+    async def main():
+        try:
+            await event_loop.start()
+        except ConnectionResetError:
+            return True
+        return False
+
+    assert asyncio.run(asyncio.wait_for(main(), 2))
+
+
+def test_block_waits_for_pop_batch():
+    async def main():
+        event_loop = new_event_loop(buffer_capacity=2, drop_policy='block', collect_batch=True)
+        for i in range(2):
+            event_loop.danmaku_batch.append_values(i, i, 0, 25, str(i))
+        event_loop.received_danmakus.drain()
+        assert event_loop.should_wait()
+        waiter = asyncio.create_task(event_loop.wait_for_space())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        popped = event_loop.pop_batch()
+        await asyncio.wait_for(waiter, 1.0)
+        assert len(popped) == 2
+        assert event_loop.danmaku_batch.capacity == 2
+        assert not event_loop.should_wait()
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from bili import buffer, frame, replay
+
+
+def danmaku_frame(index: int) -> bytes:
+    info = [
+        [0, 1, 25, 16777215, 1700000000000 + index, index, 0, '', 0, 0, 0],
+        f'弹幕{index}',
+        [index + 1, f'user{index}', 0, 0, 0, 10000, 1, ''],
+        [],
+        [0, 0, 9868950, '>50000', 0],
+        ['', ''],
+        0,
+        0,
+        None,
+    ]
+    body = json.dumps({'cmd': 'DANMU_MSG', 'info': info}).encode()
+    return frame.HEADER.pack(frame.HEADER_LEN + len(body), frame.HEADER_LEN, 0, 5, 0) + body
+
+
+def test_stats_count_dispatched_danmakus_when_buffer_drops():
+    engine = replay.ReplayEngine(1, speed=replay.SPEED_UNLIMITED, buffer_capacity=2, drop_policy=buffer.DROP_NEWEST)
+    records = [(None, danmaku_frame(i)) for i in range(5)]
+    stats = asyncio.run(engine.run(records))
+    assert stats.messages == 5
+    assert stats.danmakus == 5
+    assert stats.errors == 0
+    assert len(engine.pop_danmakus()) == 2
+    engine.close()
+
+
+def test_raw_events_carry_receive_and_dispatch_time():
+    engine = replay.ReplayEngine(1, speed=replay.SPEED_UNLIMITED)
+    received = []
+    engine.subscribe(received.append, 'SEND_GIFT', 'DANMU_MSG')
+    body = json.dumps({'cmd': 'SEND_GIFT', 'data': {}}).encode()
+    gift = frame.HEADER.pack(frame.HEADER_LEN + len(body), frame.HEADER_LEN, 0, 5, 0) + body
+    asyncio.run(engine.run([(1700000000.5, gift), (1700000001.5, danmaku_frame(0))]))
+    assert [event.type for event in received] == ['SEND_GIFT', 'DANMU_MSG']
+    assert [event.receive_time for event in received] == [1700000000.5, 1700000001.5]
+    # 未开启延迟统计时不为每个事件读取时钟
+    assert [event.dispatch_time for event in received] == [1700000000.5, 1700000001.5]
+    engine.close()
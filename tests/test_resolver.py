@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from bili import backoff, live, resolver
+
+
+def test_token_bucket_limits_rate_after_burst():
+    async def main():
+        bucket = resolver.TokenBucket(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - start
+        for _ in range(5):
+            await bucket.acquire()
+        return burst, time.monotonic() - start
+
+    burst, elapsed = asyncio.run(main())
+    assert burst < 0.02
+    # 突发之后的 5 个令牌按每秒 50 个发放
+    assert elapsed >= 0.09
+
+
+def test_token_bucket_penalize_pauses_acquire():
+    async def main():
+        bucket = resolver.TokenBucket(rate=1000, burst=10)
+        bucket.penalize(0.1)
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 0.09
+
+
+def new_resolver(responses: dict[int, list], monkeypatch, **kwargs) -> tuple[resolver.RoomResolver, list[int]]:
+    calls = []
+
+    async def get_live_house_async(room_id, session, wbi):
+        calls.append(room_id)
+        result = responses[room_id].pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(live, 'get_live_house_async', get_live_house_async)
+    monkeypatch.setattr(resolver.aioclient, 'available', lambda: True)
+    room_resolver = resolver.RoomResolver(None, ('a' * 32, 'b' * 32), rate=1000, burst=100,
+                                          retry_backoff=backoff.Backoff(initial=0.01, maximum=0.01, jitter=0),
+                                          **kwargs)
+    return room_resolver, calls
+
+
+def live_house(room_id: int) -> live.LiveHouse:
+    return live.LiveHouse(room_id, 0, 0, 0, '', [])
+
+
+def test_resolve_many_requeues_retryable_failures(monkeypatch):
+    responses = {
+        1: [-503, ConnectionError('reset'), live_house(1)],
+        2: [live_house(2)],
+        3: [-400],
+    }
+    room_resolver, calls = new_resolver(responses, monkeypatch, retries=3)
+    results = asyncio.run(room_resolver.resolve_many([1, 2, 3]))
+    assert results[1].room_id == 1
+    assert results[2].room_id == 2
+    # 不可重试的错误码直接返回
+    assert results[3] == -400
+    assert calls.count(1) == 3 and calls.count(3) == 1
+    assert room_resolver.stats()['retries'] == 2
+    assert room_resolver.stats()['failures'] == 1
+
+
+def test_resolve_many_gives_up_after_retries(monkeypatch):
+    room_resolver, calls = new_resolver({1: [-503, -503, -503]}, monkeypatch, retries=2)
+    assert asyncio.run(room_resolver.resolve_many([1])) == {1: -503}
+    assert len(calls) == 3
+
+
+def test_resolve_uses_cache_and_shares_inflight_requests(monkeypatch):
+    room_resolver, calls = new_resolver({1: [live_house(1)]}, monkeypatch)
+
+    async def main():
+        first, second = await asyncio.gather(room_resolver.resolve(1), room_resolver.resolve(1))
+        third = await room_resolver.resolve(1)
+        return first, second, third
+
+    first, second, third = asyncio.run(main())
+    assert first is second is third
+    assert calls == [1]
+    assert room_resolver.cache_hits == 1
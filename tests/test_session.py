@@ -0,0 +1,96 @@
+import pytest
+
+from bili import client, encrypter, refresher, session
+
+
+COOKIES = {
+    'SESSDATA': 's1',
+    'bili_jct': 'jct1',
+    'DedeUserID': '1',
+    'DedeUserID__ckMd5': 'md5',
+    'sid': 'sid',
+    'sec_ck': 'sec',
+}
+
+
+def test_extract_refresh_csrf():
+    html = b'<html><div id="1-name">abc123</div><div id="2-name">x</div></html>'
+    assert session.extract_refresh_csrf(html) == 'abc123'
+    assert session.extract_refresh_csrf(b"<DIV class='a' id='1-name'>\n  def456\n</DIV>") == 'def456'
+    assert session.extract_refresh_csrf(b'<div id="1-name"></div>') is None
+    assert session.extract_refresh_csrf(b'<div id="11-name">abc</div>') is None
+
+
+def test_set_data_rejects_incomplete_cookies():
+    current = session.Session('t0', dict(COOKIES), 'token0')
+    incomplete = dict(COOKIES)
+    del incomplete['sid']
+    with pytest.raises(KeyError):
+        current.__set_data__('t1', {**incomplete, 'SESSDATA': 's2'}, 'token1')
+    assert current.cookies == COOKIES
+    assert current.session_data == 's1'
+    assert current.refresh_token == 'token0'
+
+
+class FakeResponse:
+
+    def __init__(self, json_obj=None, content=b'', cookies=None):
+        self.json_obj = json_obj
+        self.content = content
+        self.cookies = FakeCookies(cookies or {})
+
+
+    def json(self):
+        return self.json_obj
+
+
+class FakeCookies(dict):
+
+    def get_dict(self):
+        return dict(self)
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.calls = []
+
+
+    def set_cookies(self, cookies):
+        pass
+
+
+    def get(self, url, **kwargs):
+        self.calls.append(('GET', url, kwargs.get('params')))
+        return FakeResponse(content=b'<div id="1-name">csrf</div>')
+
+
+    def post(self, url, **kwargs):
+        self.calls.append(('POST', url, kwargs.get('params')))
+        if url == session.COOKIE_REFRESH_URL:
+            return FakeResponse({'code': 0, 'data': {'refresh_token': 'token1'}},
+                                cookies={'SESSDATA': 's2', 'bili_jct': 'jct2'})
+        return FakeResponse({'code': 0})
+
+
+def test_refresh_confirms_with_old_refresh_token(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(client, 'get_client', lambda: fake)
+    monkeypatch.setattr(encrypter, 'get_correspond_path', lambda timestamp: 'path')
+    current = session.Session('t0', dict(COOKIES), 'token0')
+    assert current.refresh_cookies(1)
+    refresh, confirm = fake.calls[1], fake.calls[2]
+    assert refresh[2]['refresh_token'] == 'token0'
+    assert confirm[1] == session.CONFIRM_REFRESH_URL
+    assert confirm[2] == {'csrf': 'jct2', 'refresh_token': 'token0'}
+    assert current.refresh_token == 'token1'
+    assert current.cookies == {**COOKIES, 'SESSDATA': 's2', 'bili_jct': 'jct2'}
+
+
+def test_refresher_thread_stops():
+    current = session.Session('t0', dict(COOKIES), 'token0')
+    cookie_refresher = refresher.CookieRefresher(current, interval=3600)
+    thread = cookie_refresher.start_thread(initial_delay=3600)
+    assert thread.is_alive()
+    cookie_refresher.stop_thread(timeout=5)
+    assert not thread.is_alive()
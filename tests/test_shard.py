@@ -0,0 +1,56 @@
+import time
+
+from bili import codec
+from bili.shard import HashRing, ShardSupervisor
+
+
+def wait_for_health(supervisor: ShardSupervisor, timeout: float = 20.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for worker in supervisor.health().values():
+            if worker['health']:
+                return worker['health']
+        time.sleep(0.05)
+    raise AssertionError('worker did not report health')
+
+
+def test_worker_applies_runtime_options():
+    assert codec.get_backend().name == 'json'
+    supervisor = ShardSupervisor(None, None, ('a' * 32, 'b' * 32), workers=1,
+                                 runtime_options={'json_backend': 'orjson', 'sender_cache_size': 16})
+    supervisor.start()
+    try:
+        health = wait_for_health(supervisor)
+    finally:
+        supervisor.stop()
+    assert health['json_backend'] == 'orjson'
+    assert health['stats']['sender_cache']['max_size'] == 16
+
+
+def test_resolve_limits_are_split_across_workers():
+    supervisor = ShardSupervisor(None, None, ('a' * 32, 'b' * 32), workers=4,
+                                 manager_options={'resolve_rate': 20, 'resolve_burst': 6})
+    assert supervisor.manager_options['resolve_rate'] == 5.0
+    assert supervisor.manager_options['resolve_burst'] == 1
+
+
+def test_hash_ring_only_moves_rooms_of_changed_node():
+    ring = HashRing((0, 1, 2, 3))
+    rooms = range(1, 2001)
+    before = {room_id: ring.get(room_id) for room_id in rooms}
+    assert set(before.values()) == {0, 1, 2, 3}
+    ring.remove(2)
+    after = {room_id: ring.get(room_id) for room_id in rooms}
+    assert 2 not in after.values()
+    # 只有原来分配给节点 2 的直播间被重新分配
+    assert all(after[room_id] == node for room_id, node in before.items() if node != 2)
+    ring.add(2)
+    assert {room_id: ring.get(room_id) for room_id in rooms} == before
+
+
+def test_empty_hash_ring():
+    ring = HashRing()
+    assert ring.get(1) is None
+    ring.add(5)
+    assert ring.get(1) == 5
+    assert ring.nodes() == {5}
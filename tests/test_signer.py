@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+import urllib.parse
+from functools import reduce
+from hashlib import md5
+
+import pytest
+
+from bili import aioclient, encrypter, signer
+
+
+IMG_KEY = '7cd084941338484aae1ad9425b84077c'
+SUB_KEY = '4932caff0ff746eab6f01bf08b70ac45'
+
+
+def legacy_enc_wbi(params: dict, img_key: str, sub_key: str, wts: int) -> dict:
+    # 改为 sign_params 之前 enc_wbi 的实现
+    mixin_key = reduce(lambda s, i: s + (img_key + sub_key)[i], encrypter.mixinKeyEncTab, '')[:32]
+    params = dict(params)
+    params['wts'] = wts
+    params = dict(sorted(params.items()))
+    params = {
+        k: ''.join(filter(lambda chr: chr not in "!'()*", str(v)))
+        for k, v in params.items()
+    }
+    query = urllib.parse.urlencode(params)
+    params['w_rid'] = md5((query + mixin_key).encode()).hexdigest()
+    return params
+
+
+def test_sign_params_matches_legacy_enc_wbi():
+    mixin_key = encrypter.get_mixin_key(IMG_KEY + SUB_KEY)
+    cases = [
+        {'id': 22499290},
+        {'foo': '114', 'bar': '514', 'zab': 1919810},
+        {'keyword': "a!b'c(d)e*f 中文", 'page': 2},
+    ]
+    for params in cases:
+        original = dict(params)
+        signed = encrypter.sign_params(params, mixin_key, wts=1702204169)
+        assert params == original
+        assert signed == legacy_enc_wbi(params, IMG_KEY, SUB_KEY, 1702204169)
+
+
+def test_signer_sign_uses_current_time():
+    wbi_signer = signer.WbiSigner(keys=(IMG_KEY, SUB_KEY))
+    before = round(time.time())
+    signed = wbi_signer.sign({'id': 1})
+    assert before <= int(signed['wts']) <= round(time.time())
+    assert signed == legacy_enc_wbi({'id': 1}, IMG_KEY, SUB_KEY, int(signed['wts']))
+
+
+def test_concurrent_refreshes_fetch_once(monkeypatch):
+    calls = []
+
+    def get_wbi_keys():
+        calls.append(1)
+        time.sleep(0.05)
+        return IMG_KEY, SUB_KEY
+
+    monkeypatch.setattr(encrypter, 'get_wbi_keys', get_wbi_keys)
+    wbi_signer = signer.WbiSigner(keys=('a' * 32, 'b' * 32))
+    stale_version = wbi_signer.version
+    threads = [threading.Thread(target=wbi_signer.refresh, args=(stale_version,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert wbi_signer.version == stale_version + 1
+    assert wbi_signer.keys == (IMG_KEY, SUB_KEY)
+
+
+class FakeResponse:
+
+    def json(self):
+        return {'code': 0, 'data': {'wbi_img': {
+            'img_url': f'https://i0.hdslb.com/bfs/wbi/{IMG_KEY}.png',
+            'sub_url': f'https://i0.hdslb.com/bfs/wbi/{SUB_KEY}.png',
+        }}}
+
+
+class FakeAsyncClient:
+
+    def __init__(self):
+        self.calls = 0
+
+
+    async def get(self, url, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return FakeResponse()
+
+
+def test_concurrent_async_refreshes_fetch_once(monkeypatch, tmp_path):
+    fake = FakeAsyncClient()
+    monkeypatch.setattr(aioclient, 'get_client', lambda: fake)
+    wbi_signer = signer.WbiSigner(str(tmp_path / 'wbi.json'), keys=('a' * 32, 'b' * 32))
+    stale_version = wbi_signer.version
+
+    async def main():
+        await asyncio.gather(*(wbi_signer.refresh_async(stale_version) for _ in range(50)))
+        # 之后用旧 version 的刷新请求直接返回
+        await wbi_signer.refresh_async(stale_version)
+
+    asyncio.run(main())
+    assert fake.calls == 1
+    assert wbi_signer.keys == (IMG_KEY, SUB_KEY)
+    assert signer.WbiSigner(str(tmp_path / 'wbi.json')).keys == (IMG_KEY, SUB_KEY)
+
+
+def test_expired_keys_are_refreshed_in_background(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_wbi_keys():
+        started.set()
+        release.wait(5)
+        return IMG_KEY, SUB_KEY
+
+    monkeypatch.setattr(encrypter, 'get_wbi_keys', get_wbi_keys)
+    wbi_signer = signer.WbiSigner(keys=('a' * 32, 'b' * 32), ttl=0)
+    wbi_signer.ensure()
+    assert started.wait(5)
+    # 刷新还没有完成，签名继续使用旧的密钥
+    assert wbi_signer.keys == ('a' * 32, 'b' * 32)
+    release.set()
+    wbi_signer.background.join(5)
+    assert wbi_signer.keys == (IMG_KEY, SUB_KEY)
+
+
+def test_refresh_failure_is_recorded(monkeypatch):
+    def get_wbi_keys():
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(encrypter, 'get_wbi_keys', get_wbi_keys)
+    wbi_signer = signer.WbiSigner(keys=('a' * 32, 'b' * 32))
+    with pytest.raises(ConnectionError):
+        wbi_signer.refresh()
+    assert wbi_signer.failures == 1
+    assert 'offline' in wbi_signer.last_error